@@ -5,7 +5,14 @@ class AnimalsConfig(AppConfig):
     """
     Configuration for the Animals app.
 
-    Specifies the default primary key type and the app name.
+    Specifies the default primary key type and the app name, and imports
+    signal handlers when the app is ready.
     """
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'animals'
+
+    def ready(self):
+        """
+        Import signal handlers when the app is ready.
+        """
+        import animals.signals
@@ -0,0 +1,144 @@
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+from shelters.models import Shelter
+from .models import Animal, Update
+
+
+def count_of(queryset, group_by, **filters):
+    """
+    Returns a subquery counting the rows of `queryset` matching `filters`
+    whose `group_by` field is the outer row, or 0 if there are none.
+    """
+    counted = (
+        queryset.filter(**{group_by: OuterRef('pk')}, **filters)
+        .order_by()
+        .values(group_by)
+        .annotate(count=Count('pk'))
+        .values('count')
+    )
+    return Coalesce(Subquery(counted), 0)
+
+
+def latest_of(queryset, group_by, field):
+    """
+    Returns a subquery of the latest `field` value among the rows of
+    `queryset` whose `group_by` field is the outer row.
+    """
+    latest = (
+        queryset.filter(**{group_by: OuterRef('pk')}, **{
+            f'{field}__isnull': False
+        })
+        .order_by(F(field).desc())
+        .values(field)[:1]
+    )
+    return Subquery(latest)
+
+
+def shelter_totals(values):
+    """
+    Returns (shelter id, animals, fostered) contributed by an animal with
+    the facet values `values`, as read by animals.facets.
+    """
+    if not values:
+        return None, 0, 0
+    return (
+        values.get('shelter'),
+        1,
+        int(values.get('adoption_status') == 'Fostered')
+    )
+
+
+def adjust_shelter(shelter_id, animals, fostered):
+    """
+    Adds to a shelter's animal and fostered counts in one UPDATE.
+    """
+    if shelter_id is not None and (animals or fostered):
+        Shelter.objects.filter(id=shelter_id).update(
+            animal_count=F('animal_count') + animals,
+            fostered_count=F('fostered_count') + fostered
+        )
+
+
+def record_animal_change(old, new):
+    """
+    Applies the shelter count changes for an animal whose facet values went
+    from `old` to `new`. Either may be empty, for a new or deleted animal.
+    """
+    old_shelter, old_animals, old_fostered = shelter_totals(old)
+    new_shelter, new_animals, new_fostered = shelter_totals(new)
+    if old_shelter == new_shelter:
+        adjust_shelter(
+            new_shelter,
+            new_animals - old_animals,
+            new_fostered - old_fostered
+        )
+        return
+    adjust_shelter(old_shelter, -old_animals, -old_fostered)
+    adjust_shelter(new_shelter, new_animals, new_fostered)
+    refresh_shelter_last_update(old_shelter)
+    refresh_shelter_last_update(new_shelter)
+
+
+def refresh_shelter_last_update(shelter_id):
+    """
+    Sets a shelter's last update time to the latest of its animals'.
+    """
+    if shelter_id is not None:
+        Shelter.objects.filter(id=shelter_id).update(
+            last_update_at=latest_of(
+                Animal.objects, 'shelter', 'last_update_at'
+            )
+        )
+
+
+def update_added(update):
+    """
+    Counts a new update on its animal and moves the animal's and shelter's
+    last update time forward to it.
+    """
+    def later(field):
+        return Greatest(Coalesce(field, update.created_at), update.created_at)
+
+    Animal.objects.filter(id=update.animal_id).update(
+        update_count=F('update_count') + 1,
+        last_update_at=later(F('last_update_at'))
+    )
+    Shelter.objects.filter(animals__id=update.animal_id).update(
+        last_update_at=later(F('last_update_at'))
+    )
+
+
+def update_removed(update):
+    """
+    Uncounts a deleted update and recomputes the last update times it may
+    have set, which cannot be done by arithmetic. The count never goes
+    below zero, even if it had drifted.
+    """
+    Animal.objects.filter(id=update.animal_id).update(
+        update_count=Greatest(F('update_count') - 1, 0),
+        last_update_at=latest_of(Update.objects, 'animal', 'created_at')
+    )
+    Shelter.objects.filter(animals__id=update.animal_id).update(
+        last_update_at=latest_of(Animal.objects, 'shelter', 'last_update_at')
+    )
+
+
+def recount():
+    """
+    Recomputes every counter from the animal and update tables, repairing
+    drift from writes that bypassed the model signals. Each table is
+    repaired with a single UPDATE, animals first since the shelters' last
+    update times are read from them.
+    """
+    animals = Animal.objects.update(
+        update_count=count_of(Update.objects, 'animal'),
+        last_update_at=latest_of(Update.objects, 'animal', 'created_at')
+    )
+    shelters = Shelter.objects.update(
+        animal_count=count_of(Animal.objects, 'shelter'),
+        fostered_count=count_of(
+            Animal.objects, 'shelter', adoption_status='Fostered'
+        ),
+        last_update_at=latest_of(Animal.objects, 'shelter', 'last_update_at')
+    )
+    return animals, shelters
@@ -0,0 +1,132 @@
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+from shelters.models import Shelter
+from .models import Animal, FacetCount
+
+
+# Facets counted, mapped to the Animal field holding their value
+FACETS = {
+    'adoption_status': 'adoption_status',
+    'species': 'species',
+    'breed': 'breed',
+    'shelter': 'shelter_id',
+}
+
+
+def stored_facet_values(animal_id):
+    """
+    Returns {facet: value} for an animal as currently stored, or an empty
+    dict if it is not in the database.
+    """
+    stored = Animal.objects.filter(id=animal_id).values(*FACETS.values())
+    row = stored.first()
+    return facet_values(row) if row else {}
+
+
+def facet_values(animal):
+    """
+    Returns {facet: value} for an animal instance or a values() row,
+    leaving out empty values.
+    """
+    values = {}
+    for facet, field in FACETS.items():
+        if isinstance(animal, dict):
+            value = animal[field]
+        else:
+            value = getattr(animal, field)
+        if value not in (None, ''):
+            values[facet] = str(value)
+    return values
+
+
+def facet_label(facet, value):
+    """
+    Returns the text shown for a facet value.
+    """
+    if facet == 'shelter':
+        name = Shelter.objects.filter(id=value).values_list('name', flat=True)
+        return name.first() or value
+    return value
+
+
+def adjust(facet, value, delta):
+    """
+    Adds `delta` to the count of one facet value.
+
+    The change is a single UPDATE of count + delta, so concurrent saves never
+    overwrite each other's counts. A value seen for the first time gets its
+    row created, and a row that reaches zero is removed.
+    """
+    rows = FacetCount.objects.filter(facet=facet, value=value)
+    if rows.update(count=F('count') + delta):
+        if delta < 0:
+            rows.filter(count__lte=0).delete()
+        return
+    if delta <= 0:
+        return
+    try:
+        with transaction.atomic():
+            FacetCount.objects.create(
+                facet=facet,
+                value=value,
+                label=facet_label(facet, value),
+                count=delta
+            )
+    except IntegrityError:
+        # Another request created the row first
+        rows.update(count=F('count') + delta)
+
+
+def record_change(old, new):
+    """
+    Applies the count changes for an animal whose facet values went from
+    `old` to `new`. Either may be empty, for a new or deleted animal.
+    """
+    for facet in FACETS:
+        if old.get(facet) == new.get(facet):
+            continue
+        if old.get(facet) is not None:
+            adjust(facet, old[facet], -1)
+        if new.get(facet) is not None:
+            adjust(facet, new[facet], 1)
+
+
+def facet_counts():
+    """
+    Returns {facet: [FacetCount, ...]} with every facet value, most common
+    first, read in one query.
+    """
+    counts = {facet: [] for facet in FACETS}
+    for row in FacetCount.objects.order_by('facet', '-count', 'label'):
+        counts[row.facet].append(row)
+    return counts
+
+
+def rebuild_counts():
+    """
+    Recounts every facet from the animal table, repairing any drift from
+    writes that bypassed the model signals.
+    """
+    rows = []
+    shelters = dict(Shelter.objects.values_list('id', 'name'))
+    for facet, field in FACETS.items():
+        grouped = (
+            Animal.objects.exclude(**{f'{field}__isnull': True})
+            .values_list(field)
+            .annotate(count=Count('id'))
+            .order_by()
+        )
+        for value, count in grouped:
+            if value == '':
+                continue
+            label = shelters.get(value) if facet == 'shelter' else value
+            rows.append(FacetCount(
+                facet=facet,
+                value=str(value),
+                label=label or str(value),
+                count=count
+            ))
+    with transaction.atomic():
+        FacetCount.objects.all().delete()
+        FacetCount.objects.bulk_create(rows)
+    return len(rows)
@@ -1,4 +1,5 @@
 from django import forms
+from shelters.models import Shelter
 from .models import Animal, Update
 
 
@@ -57,3 +58,44 @@ class UpdateForm(forms.ModelForm):
     class Meta:
         model = Update
         fields = ['text']
+
+
+class AnimalFilterForm(forms.Form):
+    """
+    Filters and page cursor for browsing animals.
+
+    `after` is the id of the last animal on the previous page. All fields
+    are optional, and an invalid value is ignored rather than rejected.
+    """
+    adoption_status = forms.ChoiceField(
+        choices=[('', 'Any status')] + Animal._meta.get_field(
+            'adoption_status'
+        ).choices,
+        required=False,
+        label="Status"
+    )
+    shelter = forms.ModelChoiceField(
+        queryset=Shelter.objects.order_by('name'),
+        required=False,
+        empty_label="Any shelter"
+    )
+    species = forms.ChoiceField(
+        choices=[('', 'Any species')] + Animal.SpeciesChoices.choices,
+        required=False
+    )
+    breed = forms.CharField(max_length=100, required=False)
+    min_age = forms.IntegerField(
+        min_value=0,
+        required=False,
+        label="Min age (years)"
+    )
+    max_age = forms.IntegerField(
+        min_value=0,
+        required=False,
+        label="Max age (years)"
+    )
+    after = forms.IntegerField(
+        min_value=0,
+        required=False,
+        widget=forms.HiddenInput
+    )
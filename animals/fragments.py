@@ -0,0 +1,63 @@
+import time
+from functools import partial
+from django.core.cache import caches
+from django.db import transaction
+
+
+# Cache alias holding the fragments and their generation counters, shared
+# by every web process or a dummy cache when there is nothing to share
+FRAGMENT_CACHE = 'fragments'
+# Seconds a rendered profile fragment is kept. Edits do not wait for this:
+# they bump the object's generation, which changes the fragment's key.
+FRAGMENT_TIMEOUT = 60 * 60 * 24
+
+
+def generation_key(model, pk):
+    """
+    Returns the cache key of an object's generation counter.
+    """
+    return f'generation:{model._meta.label_lower}:{pk}'
+
+
+def generation(*instances):
+    """
+    Returns the combined generation of one or more objects, for use as the
+    vary_on argument of a {% cache %} fragment showing them.
+
+    The counters are read in one cache round trip. A counter missing from
+    the cache, never set or evicted, is started from the current time, so it
+    cannot come back to a value that stale fragments were cached under.
+    """
+    keys = [generation_key(type(instance), instance.pk)
+            for instance in instances]
+    cache = caches[FRAGMENT_CACHE]
+    found = cache.get_many(keys)
+    for key in keys:
+        if key not in found:
+            cache.add(key, time.time_ns(), None)
+            found[key] = cache.get(key)
+    return '-'.join(str(found[key]) for key in keys)
+
+
+def bump(model, pk):
+    """
+    Moves an object's generation on once the current transaction commits,
+    so fragments cached for it are no longer used. Bumping before the
+    commit would let a concurrent request cache the old data under the new
+    generation. Nothing is bumped for a pk of None.
+    """
+    if pk is None:
+        return
+    transaction.on_commit(partial(increment, generation_key(model, pk)))
+
+
+def increment(key):
+    """
+    Adds one to a generation counter, restarting it from the current time
+    if it has been evicted.
+    """
+    cache = caches[FRAGMENT_CACHE]
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, time.time_ns(), None)
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from animals.facets import rebuild_counts
+
+
+class Command(BaseCommand):
+    """
+    Management command that recounts the animal browse facets from the
+    animal table.
+    """
+    help = "Rebuild the animal facet counts"
+
+    def handle(self, *args, **options):
+        """
+        Rebuilds the counts in one transaction.
+        """
+        rows = rebuild_counts()
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt {rows} facet counts"
+        ))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from animals.search import rebuild_index
+
+
+class Command(BaseCommand):
+    """
+    Management command that rebuilds the animal full-text search index from
+    the animal table.
+    """
+    help = "Rebuild the animal full-text search index"
+
+    def handle(self, *args, **options):
+        """
+        Rebuilds the index in one transaction.
+        """
+        rebuild_index()
+        self.stdout.write(self.style.SUCCESS("Search index rebuilt"))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from animals.counters import recount
+
+
+class Command(BaseCommand):
+    """
+    Management command that recomputes the animal and shelter counter
+    columns from the animal and update tables.
+    """
+    help = "Recount the denormalised animal and shelter counters"
+
+    def handle(self, *args, **options):
+        """
+        Repairs every counter with one UPDATE per table.
+        """
+        animals, shelters = recount()
+        self.stdout.write(self.style.SUCCESS(
+            f"Recounted {animals} animals and {shelters} shelters"
+        ))
@@ -0,0 +1,27 @@
+# Generated by Django 5.1 on 2026-10-18 13:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('animals', '0010_alter_animal_age'),
+        ('profiles', '0007_stripeevent'),
+        ('shelters', '0003_alter_shelter_image'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='animal',
+            index=models.Index(fields=['adoption_status', 'id'], name='animals_ani_adoptio_c6220b_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='animal',
+            index=models.Index(fields=['shelter', 'adoption_status', 'id'], name='animals_ani_shelter_4c6341_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='animal',
+            index=models.Index(fields=['species', 'breed', 'id'], name='animals_ani_species_a39979_idx'),
+        ),
+    ]
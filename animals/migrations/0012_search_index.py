@@ -0,0 +1,72 @@
+from django.db import migrations
+
+
+# The statements are written out here rather than taken from animals.search,
+# so later changes to that module do not change what this migration does.
+
+SQLITE_CREATE = (
+    'CREATE VIRTUAL TABLE animals_animal_fts USING fts5('
+    'name, breed, description, shelter, '
+    "tokenize = 'porter unicode61', prefix = '2 3')",
+    'INSERT INTO animals_animal_fts '
+    '(rowid, name, breed, description, shelter) '
+    'SELECT animal.id, animal.name, animal.breed, animal.description, '
+    'shelter.name FROM animals_animal animal '
+    'JOIN shelters_shelter shelter ON shelter.id = animal.shelter_id',
+)
+
+POSTGRES_CREATE = (
+    'CREATE TABLE animals_animal_search ('
+    'animal_id bigint PRIMARY KEY '
+    'REFERENCES animals_animal (id) ON DELETE CASCADE '
+    'DEFERRABLE INITIALLY DEFERRED, '
+    'document tsvector NOT NULL)',
+    'CREATE INDEX animals_animal_search_document_idx '
+    'ON animals_animal_search USING GIN (document)',
+    'INSERT INTO animals_animal_search (animal_id, document) '
+    'SELECT animal.id, '
+    "setweight(to_tsvector('english', animal.name), 'A') "
+    "|| setweight(to_tsvector('english', coalesce(animal.breed, '')), 'B') "
+    "|| setweight(to_tsvector('english', "
+    "coalesce(animal.description, '')), 'D') "
+    "|| setweight(to_tsvector('english', shelter.name), 'C') "
+    'FROM animals_animal animal '
+    'JOIN shelters_shelter shelter ON shelter.id = animal.shelter_id',
+)
+
+
+def create_index(apps, schema_editor):
+    """
+    Creates and fills the full-text index for the database in use: an FTS5
+    table on SQLite, or a tsvector table with a GIN index on PostgreSQL.
+    Other databases get no index and fall back to substring matching.
+    """
+    statements = {
+        'sqlite': SQLITE_CREATE,
+        'postgresql': POSTGRES_CREATE,
+    }.get(schema_editor.connection.vendor, ())
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+def drop_index(apps, schema_editor):
+    """
+    Drops the full-text index created by create_index.
+    """
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS animals_animal_fts')
+    elif vendor == 'postgresql':
+        schema_editor.execute('DROP TABLE IF EXISTS animals_animal_search')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('animals', '0011_browse_indexes'),
+        ('shelters', '0003_alter_shelter_image'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
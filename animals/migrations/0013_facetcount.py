@@ -0,0 +1,63 @@
+# Generated by Django 5.1 on 2026-10-18 14:00
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def count_facets(apps, schema_editor):
+    """
+    Fills the facet count table from the existing animals.
+    """
+    Animal = apps.get_model('animals', 'Animal')
+    FacetCount = apps.get_model('animals', 'FacetCount')
+    Shelter = apps.get_model('shelters', 'Shelter')
+    shelters = dict(Shelter.objects.values_list('id', 'name'))
+    rows = []
+    for facet, field in [
+        ('adoption_status', 'adoption_status'),
+        ('species', 'species'),
+        ('breed', 'breed'),
+        ('shelter', 'shelter_id'),
+    ]:
+        grouped = (
+            Animal.objects.exclude(**{f'{field}__isnull': True})
+            .values_list(field)
+            .annotate(count=Count('id'))
+            .order_by()
+        )
+        for value, count in grouped:
+            if value == '':
+                continue
+            label = shelters.get(value) if facet == 'shelter' else value
+            rows.append(FacetCount(
+                facet=facet,
+                value=str(value),
+                label=label or str(value),
+                count=count
+            ))
+    FacetCount.objects.bulk_create(rows)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('animals', '0012_search_index'),
+        ('shelters', '0003_alter_shelter_image'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FacetCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('facet', models.CharField(max_length=20)),
+                ('value', models.CharField(max_length=255)),
+                ('label', models.CharField(max_length=255)),
+                ('count', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('facet', 'value'), name='unique_facet_value')],
+            },
+        ),
+        migrations.RunPython(count_facets, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.1 on 2026-10-18 14:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('animals', '0013_facetcount'),
+        ('profiles', '0007_stripeevent'),
+        ('shelters', '0003_alter_shelter_image'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='animal',
+            name='age_months',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='animal',
+            index=models.Index(fields=['adoption_status', 'age_months'], name='animals_ani_adoptio_d9cd54_idx'),
+        ),
+    ]
@@ -0,0 +1,61 @@
+import re
+from django.db import migrations, transaction
+from django.db.models import Case, Max, Value, When
+
+
+# Animals updated per transaction
+CHUNK_SIZE = 5000
+
+
+def age_in_months(age):
+    """
+    Converts an age string to a whole number of months. A copy of
+    animals.models.age_in_months as it was when this migration was written,
+    so later changes to the model do not change what the migration does.
+    """
+    match = re.match(r'\s*(\d+)(?:\s*-\s*\d+)?\s*(month|year)?', str(age))
+    if not match:
+        return None
+    number = int(match.group(1))
+    return number if match.group(2) == 'month' else number * 12
+
+
+def backfill_age_months(apps, schema_editor):
+    """
+    Sets age_months for existing animals, one id range per transaction so a
+    large table is never locked as a whole.
+
+    Ages come from a fixed list of choices, so each chunk is a single UPDATE
+    mapping every distinct age string to its number of months.
+    """
+    Animal = apps.get_model('animals', 'Animal')
+    months = {
+        age: age_in_months(age)
+        for age in Animal.objects.values_list('age', flat=True).distinct()
+    }
+    if not months:
+        return
+    age_months = Case(
+        *[When(age=age, then=Value(value)) for age, value in months.items()],
+        default=None
+    )
+    last_id = Animal.objects.aggregate(Max('id'))['id__max']
+    for start in range(0, last_id + 1, CHUNK_SIZE):
+        with transaction.atomic():
+            Animal.objects.filter(
+                id__gte=start,
+                id__lt=start + CHUNK_SIZE
+            ).update(age_months=age_months)
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('animals', '0014_animal_age_months'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_age_months, migrations.RunPython.noop),
+    ]
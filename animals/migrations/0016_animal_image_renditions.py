@@ -0,0 +1,18 @@
+# Generated by Django 5.1 on 2026-10-18 14:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('animals', '0015_backfill_age_months'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='animal',
+            name='image_renditions',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+    ]
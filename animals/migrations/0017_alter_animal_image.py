@@ -0,0 +1,19 @@
+# Generated by Django 5.1 on 2026-10-18 14:18
+
+import blobs.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('animals', '0016_animal_image_renditions'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='animal',
+            name='image',
+            field=models.ImageField(blank=True, null=True, storage=blobs.storage.ContentAddressedStorage(), upload_to=''),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.1 on 2026-10-18 14:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('animals', '0017_alter_animal_image'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='update',
+            index=models.Index(fields=['animal', '-created_at'], name='animals_upd_animal__98bc11_idx'),
+        ),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 5.1 on 2026-10-18 14:31
+
+from django.db import migrations, models
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_of(queryset, group_by, **filters):
+    counted = (
+        queryset.filter(**{group_by: OuterRef('pk')}, **filters)
+        .order_by()
+        .values(group_by)
+        .annotate(count=Count('pk'))
+        .values('count')
+    )
+    return Coalesce(Subquery(counted), 0)
+
+
+def latest_of(queryset, group_by, field):
+    return Subquery(
+        queryset.filter(**{group_by: OuterRef('pk')}, **{
+            f'{field}__isnull': False
+        })
+        .order_by(F(field).desc())
+        .values(field)[:1]
+    )
+
+
+def fill_counters(apps, schema_editor):
+    """
+    Fills the animal and shelter counters from the existing rows.
+    """
+    Animal = apps.get_model('animals', 'Animal')
+    Update = apps.get_model('animals', 'Update')
+    Shelter = apps.get_model('shelters', 'Shelter')
+    Animal.objects.update(
+        update_count=count_of(Update.objects, 'animal'),
+        last_update_at=latest_of(Update.objects, 'animal', 'created_at')
+    )
+    Shelter.objects.update(
+        animal_count=count_of(Animal.objects, 'shelter'),
+        fostered_count=count_of(
+            Animal.objects, 'shelter', adoption_status='Fostered'
+        ),
+        last_update_at=latest_of(Animal.objects, 'shelter', 'last_update_at')
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('animals', '0018_update_animals_upd_animal__98bc11_idx'),
+        ('shelters', '0006_shelter_animal_count_shelter_fostered_count_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='animal',
+            name='last_update_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='animal',
+            name='update_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
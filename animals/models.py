@@ -1,6 +1,21 @@
+import re
 from django.db import models
 from shelters.models import Shelter
 from profiles.models import Profile
+from blobs.storage import content_addressed_storage
+
+
+def age_in_months(age):
+    """
+    Converts an age string such as '0-5 month', '6-12 month' or '7 year' to
+    a whole number of months, using the lower end of a range. A bare number
+    is taken as years. Returns None if the string cannot be read.
+    """
+    match = re.match(r'\s*(\d+)(?:\s*-\s*\d+)?\s*(month|year)?', str(age))
+    if not match:
+        return None
+    number = int(match.group(1))
+    return number if match.group(2) == 'month' else number * 12
 
 
 class Animal(models.Model):
@@ -15,6 +30,8 @@ class Animal(models.Model):
             The profile of the fosterer, if applicable.
         image:
             Optional image of the animal.
+        image_renditions:
+            Resized copies of the image, generated by the thumbnails app.
         name:
             The name of the animal.
         species:
@@ -23,6 +40,8 @@ class Animal(models.Model):
             The breed of the animal, which is optional.
         age:
             The age of the animal.
+        age_months:
+            The age in whole months, derived from `age` on save.
         description:
             Optional description of the animal.
         adoption_status:
@@ -44,7 +63,17 @@ class Animal(models.Model):
         blank=True,
         null=True
         )
-    image = models.ImageField(upload_to='', blank=True, null=True)
+    image = models.ImageField(
+        upload_to='',
+        storage=content_addressed_storage,
+        blank=True,
+        null=True
+    )
+    image_renditions = models.JSONField(
+        default=dict,
+        blank=True,
+        editable=False
+        )
     name = models.CharField(max_length=255)
     species = models.CharField(
         max_length=25,
@@ -53,12 +82,33 @@ class Animal(models.Model):
         )
     breed = models.CharField(max_length=100, blank=True, null=True)
     age = models.CharField(max_length=15)
+    age_months = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        editable=False
+        )
     description = models.TextField(blank=True, null=True)
     adoption_status = models.CharField(
         max_length=20,
         choices=[('Available', 'Available'), ('Fostered', 'Fostered')],
         default='Available'
         )
+    # Maintained by animals.counters as updates are added and removed
+    update_count = models.PositiveIntegerField(default=0, editable=False)
+    last_update_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        editable=False
+        )
+
+    class Meta:
+        # Each browse filter, followed by the id the pages are keyed on
+        indexes = [
+            models.Index(fields=['adoption_status', 'id']),
+            models.Index(fields=['shelter', 'adoption_status', 'id']),
+            models.Index(fields=['species', 'breed', 'id']),
+            models.Index(fields=['adoption_status', 'age_months']),
+        ]
 
     def __str__(self):
         """
@@ -66,6 +116,51 @@ class Animal(models.Model):
         """
         return f'{self.name} - {self.shelter}'
 
+    def save(self, *args, **kwargs):
+        """
+        Keeps age_months in step with age before saving.
+        """
+        self.age_months = age_in_months(self.age)
+        if kwargs.get('update_fields') and 'age' in kwargs['update_fields']:
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'age_months'}
+        super().save(*args, **kwargs)
+
+
+class FacetCount(models.Model):
+    """
+    Number of animals sharing one value of a browse facet, kept current
+    from the Animal save and delete signals.
+
+    Attributes:
+        facet:
+            The Animal field counted: adoption_status, species, breed or
+            shelter.
+        value:
+            The field value, with shelters stored by id.
+        label:
+            The text shown for the value, the shelter name for shelters.
+        count:
+            The number of animals with the value.
+    """
+    facet = models.CharField(max_length=20)
+    value = models.CharField(max_length=255)
+    label = models.CharField(max_length=255)
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['facet', 'value'],
+                name='unique_facet_value'
+            )
+        ]
+
+    def __str__(self):
+        """
+        Returns string representation of FacetCount object.
+        """
+        return f'{self.facet}: {self.label} ({self.count})'
+
 
 class Update(models.Model):
     """
@@ -88,6 +183,12 @@ class Update(models.Model):
     text = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        # Finds an animal's latest update without sorting all of them
+        indexes = [
+            models.Index(fields=['animal', '-created_at']),
+        ]
+
     def __str__(self):
         """
         Returns string representation of Update object.
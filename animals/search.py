@@ -0,0 +1,178 @@
+import re
+from django.db import connection, transaction
+from django.db.models import Q
+from .models import Animal
+
+
+# Largest number of results returned by a search
+RESULT_LIMIT = 20
+# Number of most recently added matches that are ranked. Ranking every match
+# of a common word costs time in proportion to the catalogue, so only the
+# newest candidates are scored.
+CANDIDATE_LIMIT = 1000
+
+SQLITE_TABLE = 'animals_animal_fts'
+POSTGRES_TABLE = 'animals_animal_search'
+
+# Columns indexed for each animal, in index column order
+FIELDS = ('id', 'name', 'breed', 'description', 'shelter__name')
+
+# Weighted tsvector built from the name, breed, description and shelter name
+POSTGRES_DOCUMENT = (
+    "setweight(to_tsvector('english', {}), 'A') "
+    "|| setweight(to_tsvector('english', coalesce({}, '')), 'B') "
+    "|| setweight(to_tsvector('english', coalesce({}, '')), 'D') "
+    "|| setweight(to_tsvector('english', {}), 'C')"
+)
+
+# Statements filling an empty index from the animal and shelter tables
+POPULATE = {
+    'sqlite': (
+        f'INSERT INTO {SQLITE_TABLE} '
+        '(rowid, name, breed, description, shelter) '
+        'SELECT animal.id, animal.name, animal.breed, animal.description, '
+        'shelter.name FROM animals_animal animal '
+        'JOIN shelters_shelter shelter ON shelter.id = animal.shelter_id'
+    ),
+    'postgresql': (
+        f'INSERT INTO {POSTGRES_TABLE} (animal_id, document) '
+        'SELECT animal.id, ' + POSTGRES_DOCUMENT.format(
+            'animal.name', 'animal.breed', 'animal.description',
+            'shelter.name'
+        ) + ' FROM animals_animal animal '
+        'JOIN shelters_shelter shelter ON shelter.id = animal.shelter_id'
+    ),
+}
+
+
+def search_terms(query):
+    """
+    Returns the words of a search query, lower-cased. Punctuation and search
+    operators typed by the user are dropped.
+    """
+    return re.findall(r'\w+', query.lower())
+
+
+def index_rows(rows):
+    """
+    Writes (id, name, breed, description, shelter name) rows to the
+    full-text index, replacing any existing entries for the same animals.
+    """
+    if not rows:
+        return
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.executemany(
+                f'DELETE FROM {SQLITE_TABLE} WHERE rowid = %s',
+                [(row[0],) for row in rows]
+            )
+            cursor.executemany(
+                f'INSERT INTO {SQLITE_TABLE} '
+                '(rowid, name, breed, description, shelter) '
+                'VALUES (%s, %s, %s, %s, %s)',
+                rows
+            )
+        elif connection.vendor == 'postgresql':
+            cursor.executemany(
+                f'INSERT INTO {POSTGRES_TABLE} (animal_id, document) '
+                'VALUES (%s, ' + POSTGRES_DOCUMENT.format(*['%s'] * 4) + ') '
+                'ON CONFLICT (animal_id) '
+                'DO UPDATE SET document = EXCLUDED.document',
+                rows
+            )
+
+
+def index_animals(animals):
+    """
+    Brings the index entries of the animals in a queryset up to date.
+    """
+    index_rows(list(animals.order_by('id').values_list(*FIELDS)))
+
+
+def remove_animal(animal_id):
+    """
+    Removes an animal from the full-text index. On PostgreSQL the entry is
+    removed by the cascading foreign key instead.
+    """
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {SQLITE_TABLE} WHERE rowid = %s',
+                [animal_id]
+            )
+
+
+def rebuild_index():
+    """
+    Empties the full-text index and fills it again from the animal table,
+    repairing any drift from writes that bypassed the model signals.
+    """
+    if connection.vendor not in POPULATE:
+        return
+    table = SQLITE_TABLE if connection.vendor == 'sqlite' else POSTGRES_TABLE
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {table}')
+        cursor.execute(POPULATE[connection.vendor])
+
+
+def search_ids(query, limit=RESULT_LIMIT):
+    """
+    Returns the ids of the animals that best match a search query, best
+    match first.
+
+    Every word must match, and the last one also matches as a prefix so
+    results appear while the visitor is still typing. Matches in the name
+    rank above the breed and shelter name, and those above the description.
+    Only the newest CANDIDATE_LIMIT matches are ranked, which keeps a search
+    for a common word as fast as a rare one.
+    """
+    terms = search_terms(query)
+    if not terms:
+        return []
+
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            match = ' '.join(f'"{term}"' for term in terms) + '*'
+            cursor.execute(
+                f'SELECT rowid FROM ('
+                f'SELECT rowid, bm25({SQLITE_TABLE}, 10.0, 4.0, 1.0, 2.0) '
+                f'AS score FROM {SQLITE_TABLE} '
+                f'WHERE {SQLITE_TABLE} MATCH %s '
+                'ORDER BY rowid DESC LIMIT %s'
+                ') ORDER BY score, rowid DESC LIMIT %s',
+                [match, CANDIDATE_LIMIT, limit]
+            )
+        elif connection.vendor == 'postgresql':
+            match = ' & '.join(terms) + ':*'
+            cursor.execute(
+                'SELECT animal_id FROM ('
+                'SELECT animal_id, ts_rank(document, query) AS score '
+                f"FROM {POSTGRES_TABLE}, to_tsquery('english', %s) query "
+                'WHERE document @@ query '
+                'ORDER BY animal_id DESC LIMIT %s'
+                ') candidates ORDER BY score DESC, animal_id DESC LIMIT %s',
+                [match, CANDIDATE_LIMIT, limit]
+            )
+        else:
+            condition = Q()
+            for term in terms:
+                condition &= (
+                    Q(name__icontains=term)
+                    | Q(breed__icontains=term)
+                    | Q(description__icontains=term)
+                    | Q(shelter__name__icontains=term)
+                )
+            return list(
+                Animal.objects.filter(condition)
+                .values_list('id', flat=True)[:limit]
+            )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def search_animals(query, limit=RESULT_LIMIT):
+    """
+    Returns the animals that best match a search query, best match first.
+    """
+    ids = search_ids(query, limit)
+    animals = Animal.objects.in_bulk(ids)
+    return [animals[id] for id in ids if id in animals]
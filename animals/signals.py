@@ -0,0 +1,202 @@
+from django.db.models import QuerySet
+from django.db.models.signals import (
+    post_delete, post_save, pre_delete, pre_save
+)
+from django.dispatch import receiver
+from shelters.models import Shelter
+from thumbnails.renditions import renditions_updated
+from .counters import (
+    record_animal_change, refresh_shelter_last_update, update_added,
+    update_removed
+)
+from .facets import facet_values, record_change, stored_facet_values
+from .fragments import bump
+from .models import Animal, FacetCount, Update
+from .search import index_animals, remove_animal
+
+
+@receiver(post_save, sender=Animal)
+def index_saved_animal(sender, instance, **kwargs):
+    """
+    Updates the search index entry of an animal when it is saved.
+    """
+    index_animals(Animal.objects.filter(id=instance.id))
+
+
+@receiver(post_delete, sender=Animal)
+def unindex_deleted_animal(sender, instance, **kwargs):
+    """
+    Removes a deleted animal from the search index.
+    """
+    remove_animal(instance.id)
+
+
+@receiver(post_save, sender=Shelter)
+def reindex_shelter_animals(sender, instance, created, **kwargs):
+    """
+    Re-indexes a shelter's animals when the shelter is edited, since the
+    shelter name is searchable.
+    """
+    if not created:
+        index_animals(instance.animals.all())
+
+
+@receiver(pre_save, sender=Animal)
+def remember_stored_facets(sender, instance, **kwargs):
+    """
+    Reads the facet values an animal has in the database before it is
+    saved, so the counts of the values it leaves can be decremented.
+    """
+    instance._stored_facets = (
+        stored_facet_values(instance.id) if instance.id else {}
+    )
+
+
+@receiver(post_save, sender=Animal)
+def count_saved_animal(sender, instance, **kwargs):
+    """
+    Updates the facet counts for a saved animal.
+    """
+    record_change(
+        getattr(instance, '_stored_facets', {}),
+        facet_values(instance)
+    )
+
+
+@receiver(pre_delete, sender=Animal)
+def uncount_deleted_animal(sender, instance, **kwargs):
+    """
+    Decrements the facet counts of an animal about to be deleted.
+    """
+    record_change(stored_facet_values(instance.id), {})
+
+
+@receiver(post_save, sender=Animal)
+def count_shelter_animal(sender, instance, **kwargs):
+    """
+    Updates the shelter's animal and fostered counts for a saved animal,
+    including status changes made when a sprite fosters or returns it.
+    """
+    record_animal_change(
+        getattr(instance, '_stored_facets', {}),
+        facet_values(instance)
+    )
+
+
+@receiver(pre_delete, sender=Animal)
+def uncount_shelter_animal(sender, instance, **kwargs):
+    """
+    Decrements the shelter's counts for an animal about to be deleted.
+    """
+    record_animal_change(stored_facet_values(instance.id), {})
+
+
+@receiver(post_delete, sender=Animal)
+def refresh_deleted_animal_shelter(sender, instance, **kwargs):
+    """
+    Recomputes the shelter's last update time without the deleted animal.
+    """
+    refresh_shelter_last_update(instance.shelter_id)
+
+
+@receiver(post_save, sender=Update)
+def count_saved_update(sender, instance, created, **kwargs):
+    """
+    Counts a new update on its animal and shelter.
+    """
+    if created:
+        update_added(instance)
+
+
+def deleted_with_animal(origin):
+    """
+    Returns whether an update was deleted because its animal was. Updates
+    are only reachable through their animal, so a deletion that did not
+    start from updates themselves cascaded from it.
+    """
+    if origin is None:
+        return False
+    model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    return model is not Update
+
+
+@receiver(post_delete, sender=Update)
+def uncount_deleted_update(sender, instance, origin=None, **kwargs):
+    """
+    Uncounts a deleted update from its animal and shelter. Nothing is
+    counted for updates deleted with their animal, whose own deletion
+    updates the shelter.
+    """
+    if not deleted_with_animal(origin):
+        update_removed(instance)
+
+
+@receiver(post_save, sender=Shelter)
+def relabel_shelter_facet(sender, instance, created, **kwargs):
+    """
+    Keeps the shelter facet label in step with the shelter name.
+    """
+    if not created:
+        FacetCount.objects.filter(
+            facet='shelter',
+            value=str(instance.id)
+        ).exclude(label=instance.name).update(label=instance.name)
+
+
+def shelter_of(animal_id):
+    """
+    Returns the shelter id of an animal, or None if it has been deleted.
+    """
+    return (
+        Animal.objects.filter(id=animal_id)
+        .values_list('shelter_id', flat=True)
+        .first()
+    )
+
+
+@receiver(post_save, sender=Animal)
+@receiver(post_delete, sender=Animal)
+def expire_animal_fragments(sender, instance, **kwargs):
+    """
+    Expires the cached fragments of an animal's profile and of its
+    shelter's page, which lists it.
+    """
+    bump(Animal, instance.id)
+    bump(Shelter, instance.shelter_id)
+
+
+@receiver(post_save, sender=Update)
+@receiver(post_delete, sender=Update)
+def expire_update_fragments(sender, instance, origin=None, **kwargs):
+    """
+    Expires the cached fragments of the animal an update belongs to, and
+    of its shelter's page, which shows each animal's latest update. Updates
+    deleted with their animal are left to the animal's own expiry.
+    """
+    if deleted_with_animal(origin):
+        return
+    bump(Animal, instance.animal_id)
+    bump(Shelter, shelter_of(instance.animal_id))
+
+
+@receiver(post_save, sender=Shelter)
+@receiver(post_delete, sender=Shelter)
+def expire_shelter_fragments(sender, instance, **kwargs):
+    """
+    Expires the cached fragments of a shelter's page. Its animals' profiles
+    include the shelter's generation in their keys, so they expire too.
+    """
+    bump(Shelter, instance.id)
+
+
+@receiver(renditions_updated)
+def expire_rendered_fragments(sender, pk, **kwargs):
+    """
+    Expires the fragments showing an image whose renditions were just
+    generated, so they switch from the original to the renditions.
+    """
+    if sender is Animal:
+        bump(Animal, pk)
+        bump(Shelter, shelter_of(pk))
+    elif sender is Shelter:
+        bump(Shelter, pk)
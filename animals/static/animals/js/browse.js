@@ -0,0 +1,54 @@
+export function buildCard(template, animal) {
+  const card = template.content.cloneNode(true);
+  const imageLink = card.querySelector('.animal-image-link');
+  if (animal.image) {
+    imageLink.href = animal.url;
+    const image = imageLink.querySelector('img');
+    image.src = animal.image;
+    image.alt = `Image of ${animal.name}`;
+  } else {
+    imageLink.remove();
+  }
+  card.querySelector('.animal-name-link').href = animal.url;
+  card.querySelector('h3').textContent = animal.name;
+  card.querySelector('.animal-summary').textContent =
+    `${animal.age} old ${animal.breed || animal.species}`;
+  card.querySelector('.animal-status').textContent = animal.adoption_status;
+  return card;
+}
+
+
+export async function loadMore(button, list, template) {
+  button.classList.add('disabled');
+  try {
+    const response = await fetch(`/animals/browse/?${button.dataset.next}`);
+    const data = await response.json();
+    data.animals.forEach((animal) => {
+      list.appendChild(buildCard(template, animal));
+    });
+    if (data.next) {
+      button.dataset.next = data.next;
+      button.href = `?${data.next}`;
+      button.classList.remove('disabled');
+    } else {
+      button.remove();
+    }
+  } catch (error) {
+    console.error('Failed to load animals:', error);
+    button.classList.remove('disabled');
+  }
+}
+
+
+window.addEventListener('load', () => {
+  const button = document.getElementById('load-more');
+  if (!button) {
+    return;
+  }
+  const list = document.getElementById('animal-list');
+  const template = document.getElementById('animal-card-template');
+  button.addEventListener('click', (event) => {
+    event.preventDefault();
+    loadMore(button, list, template);
+  });
+});
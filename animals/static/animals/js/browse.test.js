@@ -0,0 +1,75 @@
+import { buildCard, loadMore } from './browse.js';
+
+const animal = {
+  id: 2,
+  name: 'Sky',
+  species: 'Dog',
+  breed: 'Collie',
+  age: '3 year',
+  adoption_status: 'Available',
+  image: '/media/sky.jpg',
+  url: '/animals/profile/2/',
+};
+
+// Mock global fetch function
+global.fetch = jest.fn(() =>
+  Promise.resolve({
+    json: () => Promise.resolve({
+      animals: [animal],
+      next: 'after=2',
+    }),
+  })
+);
+
+describe('browse', () => {
+  let template, list, button;
+
+  beforeEach(() => {
+    fetch.mockClear();
+    document.body.innerHTML = `
+      <div id="animal-list"></div>
+      <a id="load-more" data-next="after=1" href="?after=1">Load more</a>
+      <template id="animal-card-template">
+        <div>
+          <a class="animal-image-link"><img></a>
+          <a class="animal-name-link"><h3></h3></a>
+          <p class="animal-summary"></p>
+          <p><strong class="animal-status"></strong></p>
+        </div>
+      </template>`;
+    template = document.getElementById('animal-card-template');
+    list = document.getElementById('animal-list');
+    button = document.getElementById('load-more');
+  });
+
+  test('buildCard should fill in the animal details', () => {
+    list.appendChild(buildCard(template, animal));
+    expect(list.querySelector('h3').textContent).toBe('Sky');
+    expect(list.querySelector('.animal-summary').textContent).toBe('3 year old Collie');
+    expect(list.querySelector('.animal-status').textContent).toBe('Available');
+    expect(list.querySelector('img').getAttribute('src')).toBe('/media/sky.jpg');
+  });
+
+  test('buildCard should drop the image link when there is no image', () => {
+    list.appendChild(buildCard(template, { ...animal, image: null, breed: null }));
+    expect(list.querySelector('img')).toBeNull();
+    expect(list.querySelector('.animal-summary').textContent).toBe('3 year old Dog');
+  });
+
+  test('loadMore should fetch the next page and append it', async () => {
+    await loadMore(button, list, template);
+    expect(fetch).toHaveBeenCalledWith('/animals/browse/?after=1');
+    expect(list.querySelectorAll('h3').length).toBe(1);
+    expect(button.dataset.next).toBe('after=2');
+  });
+
+  test('loadMore should remove the button on the last page', async () => {
+    fetch.mockImplementationOnce(() =>
+      Promise.resolve({
+        json: () => Promise.resolve({ animals: [], next: null }),
+      })
+    );
+    await loadMore(button, list, template);
+    expect(document.getElementById('load-more')).toBeNull();
+  });
+});
@@ -1,13 +1,23 @@
 import os
 from django.conf import settings
-from django.test import TestCase
+from django.core.cache import caches
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.contrib.messages import get_messages
 from django.contrib.auth.models import User
 from shelters.models import Shelter
-from .models import Animal, Update
+from virtual_shelter.budgets import QueryBudgetTestCase
+from .fragments import FRAGMENT_CACHE
+from .models import Animal, FacetCount, Update, age_in_months
 from animals.forms import AnimalForm, UpdateForm
 from datetime import datetime
+from unittest.mock import patch
+from importlib import import_module
+from io import StringIO
+from django.apps import apps as django_apps
+from django.core.management import call_command
 
 
 # Views
@@ -103,6 +113,7 @@ class ProfileViewTest(TestCase):
         Set up the test environment by creating a user, shelter, animal, and
         uploading an image.
         """
+        caches[FRAGMENT_CACHE].clear()
         self.user = User.objects.create_user(
             username='testuser',
             password='12345'
@@ -425,6 +436,110 @@ class ViewAnimalsViewTest(TestCase):
         self.assertIn('animals', response.context)
         self.assertEqual(len(response.context['animals']), 1)
 
+    def test_filters(self):
+        """
+        Test that the page only lists animals matching the filters.
+        """
+        Animal.objects.create(
+            shelter=self.shelter,
+            name="Rex",
+            species="Dog",
+            breed="Husky",
+            age=2,
+            adoption_status="Fostered"
+        )
+
+        response = self.client.get(
+            '/animals/', {'adoption_status': 'Fostered'}
+        )
+        self.assertEqual(
+            [a.name for a in response.context['animals']], ['Rex']
+        )
+
+        response = self.client.get(
+            '/animals/', {'breed': 'Collie', 'shelter': self.shelter.id}
+        )
+        self.assertEqual(
+            [a.name for a in response.context['animals']], ['Sky']
+        )
+
+    def test_age_range_filter(self):
+        """
+        Test that the age range filter matches whole years inclusively.
+        """
+        Animal.objects.create(
+            shelter=self.shelter, name="Pup", age='6-12 month'
+        )
+        Animal.objects.create(shelter=self.shelter, name="Old", age='9 year')
+
+        response = self.client.get('/animals/', {'max_age': 3})
+        self.assertEqual(
+            [a.name for a in response.context['animals']], ['Sky', 'Pup']
+        )
+        response = self.client.get('/animals/', {'min_age': 3})
+        self.assertEqual(
+            [a.name for a in response.context['animals']], ['Sky', 'Old']
+        )
+
+    def test_invalid_filter_ignored(self):
+        """
+        Test that an invalid filter value is ignored rather than rejected.
+        """
+        response = self.client.get('/animals/', {'shelter': 'abc'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['animals']), 1)
+
+    @patch('animals.views.PAGE_SIZE', 2)
+    def test_keyset_pages(self):
+        """
+        Test that pages follow on from the last id of the previous page and
+        that the JSON variant returns the same pages.
+        """
+        for name in ['A', 'B', 'C', 'D']:
+            Animal.objects.create(shelter=self.shelter, name=name, age=1)
+
+        response = self.client.get('/animals/', {'species': 'Dog'})
+        first = response.context['animals']
+        self.assertEqual([a.name for a in first], ['Sky', 'A'])
+        self.assertEqual(
+            response.context['next_page'], f'species=Dog&after={first[1].id}'
+        )
+
+        response = self.client.get(
+            f"/animals/browse/?{response.context['next_page']}"
+        )
+        data = response.json()
+        self.assertEqual([a['name'] for a in data['animals']], ['B', 'C'])
+        self.assertEqual(
+            data['animals'][0]['url'],
+            f"/animals/profile/{data['animals'][0]['id']}/"
+        )
+
+        response = self.client.get(f"/animals/browse/?{data['next']}")
+        data = response.json()
+        self.assertEqual([a['name'] for a in data['animals']], ['D'])
+        self.assertIsNone(data['next'])
+
+    @patch('animals.views.PAGE_SIZE', 2)
+    def test_page_query_count(self):
+        """
+        Test that a deep page costs one query.
+        """
+        for name in ['A', 'B', 'C', 'D']:
+            Animal.objects.create(shelter=self.shelter, name=name, age=1)
+        last = Animal.objects.order_by('id').values_list('id', flat=True)[2]
+
+        with self.assertNumQueries(1):
+            self.client.get(f'/animals/browse/?after={last}')
+
+    def test_html_page_query_count(self):
+        """
+        Test that the page reads the animals, the shelter choices and the
+        facet counts in one query each.
+        """
+        with self.assertNumQueries(3):
+            self.client.get('/animals/')
+
 
 class AddUpdateViewTest(TestCase):
     """
@@ -773,6 +888,203 @@ class DeleteUpdateViewTest(TestCase):
         super().tearDown()
 
 
+class SearchViewTest(TestCase):
+    """
+    Test cases for the animal full-text search endpoint and the signals that
+    keep its index up to date.
+    """
+    def setUp(self):
+        """
+        Set up the test environment by creating a shelter and two animals.
+        """
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='12345'
+            )
+        self.shelter = Shelter.objects.create(
+            admin=self.user,
+            name="Happy Paws",
+            registration_number="12345",
+            website="http://example.com",
+            description="A test shelter."
+        )
+        self.sky = Animal.objects.create(
+            shelter=self.shelter,
+            name="Sky",
+            breed="Collie",
+            age=3,
+            description="Loves running on the beach"
+        )
+        self.rex = Animal.objects.create(
+            shelter=self.shelter,
+            name="Rex",
+            breed="Husky",
+            age=2,
+            description="Gets on well with collies"
+        )
+
+    def names(self, query):
+        response = self.client.get('/animals/search/', {'q': query})
+        self.assertEqual(response.status_code, 200)
+        return [a['name'] for a in response.json()['animals']]
+
+    def test_ranked_results(self):
+        """
+        Test that a match in the breed ranks above one in the description.
+        """
+        self.assertEqual(self.names('collie'), ['Sky', 'Rex'])
+
+    def test_all_words_and_prefix(self):
+        """
+        Test that every word must match and the last may be a prefix.
+        """
+        self.assertEqual(self.names('sky coll'), ['Sky'])
+        # Equal matches list the newest animal first
+        self.assertEqual(self.names('happy pa'), ['Rex', 'Sky'])
+        self.assertEqual(self.names('husky beach'), [])
+
+    def test_operators_ignored(self):
+        """
+        Test that search syntax typed by the user is treated as text.
+        """
+        self.assertEqual(self.names('"sky" OR NOT *'), [])
+        self.assertEqual(self.names('sky*'), ['Sky'])
+        self.assertEqual(self.names(''), [])
+
+    def test_index_follows_changes(self):
+        """
+        Test that edits, deletions and shelter renames reach the index.
+        """
+        self.sky.name = "Bluebell"
+        self.sky.save()
+        self.assertEqual(self.names('bluebell'), ['Bluebell'])
+        self.assertEqual(self.names('sky'), [])
+
+        self.rex.delete()
+        self.assertEqual(self.names('husky'), [])
+
+        self.shelter.name = "Dogs Trust"
+        self.shelter.save()
+        self.assertEqual(self.names('trust'), ['Bluebell'])
+
+    def test_rebuild_command(self):
+        """
+        Test that the rebuild command restores an index that has drifted.
+        """
+        Animal.objects.filter(id=self.sky.id).update(name="Bluebell")
+        self.assertEqual(self.names('bluebell'), [])
+
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual(self.names('bluebell'), ['Bluebell'])
+
+
+class FacetCountTest(TestCase):
+    """
+    Test cases for the facet counts kept from the Animal signals and shown
+    on the view animals page.
+    """
+    def setUp(self):
+        """
+        Set up the test environment by creating a shelter and two animals.
+        """
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='12345'
+            )
+        self.shelter = Shelter.objects.create(
+            admin=self.user,
+            name="Happy Paws",
+            registration_number="12345",
+            website="http://example.com",
+            description="A test shelter."
+        )
+        self.sky = Animal.objects.create(
+            shelter=self.shelter, name="Sky", breed="Collie", age=3
+        )
+        self.rex = Animal.objects.create(
+            shelter=self.shelter, name="Rex", breed="Husky", age=2
+        )
+
+    def counts(self):
+        return {
+            (row.facet, row.label): row.count
+            for row in FacetCount.objects.all()
+        }
+
+    def test_counts_follow_saves_and_deletes(self):
+        """
+        Test that creating, editing and deleting animals moves the counts.
+        """
+        self.assertEqual(self.counts(), {
+            ('adoption_status', 'Available'): 2,
+            ('species', 'Dog'): 2,
+            ('breed', 'Collie'): 1,
+            ('breed', 'Husky'): 1,
+            ('shelter', 'Happy Paws'): 2,
+        })
+
+        self.rex.adoption_status = 'Fostered'
+        self.rex.breed = 'Collie'
+        self.rex.save()
+        self.sky.delete()
+
+        self.assertEqual(self.counts(), {
+            ('adoption_status', 'Fostered'): 1,
+            ('species', 'Dog'): 1,
+            ('breed', 'Collie'): 1,
+            ('shelter', 'Happy Paws'): 1,
+        })
+
+    def test_stale_instance_counted_from_database(self):
+        """
+        Test that saving an out of date instance moves the counts from the
+        stored values rather than the ones it was loaded with.
+        """
+        stale = Animal.objects.get(id=self.sky.id)
+        self.sky.breed = 'Husky'
+        self.sky.save()
+        stale.breed = 'Beagle'
+        stale.save()
+
+        self.assertEqual(self.counts()[('breed', 'Husky')], 1)
+        self.assertEqual(self.counts()[('breed', 'Beagle')], 1)
+        self.assertNotIn(('breed', 'Collie'), self.counts())
+
+    def test_shelter_rename_relabels(self):
+        """
+        Test that renaming a shelter renames its facet.
+        """
+        self.shelter.name = "Dogs Trust"
+        self.shelter.save()
+        self.assertEqual(self.counts()[('shelter', 'Dogs Trust')], 2)
+
+    def test_rebuild_command(self):
+        """
+        Test that the rebuild command repairs drifted counts.
+        """
+        Animal.objects.filter(id=self.sky.id).update(breed='Husky')
+        FacetCount.objects.filter(facet='species').delete()
+
+        call_command('rebuild_facet_counts', stdout=StringIO())
+
+        self.assertEqual(self.counts(), {
+            ('adoption_status', 'Available'): 2,
+            ('species', 'Dog'): 2,
+            ('breed', 'Husky'): 2,
+            ('shelter', 'Happy Paws'): 2,
+        })
+
+    def test_view_renders_counts(self):
+        """
+        Test that the view animals page shows the counts.
+        """
+        response = self.client.get('/animals/')
+        self.assertContains(
+            response, f'?shelter={self.shelter.id}" class="me-2">Happy Paws: 2'
+        )
+        self.assertContains(response, 'Available: 2')
+
+
 # Models
 class AnimalModelTest(TestCase):
     """
@@ -854,11 +1166,59 @@ class AnimalModelTest(TestCase):
         self.assertIsNone(self.animal.description)
         self.assertEqual(self.animal.adoption_status, "Available")  # Default
 
+    def test_age_months_kept_in_step(self):
+        """
+        Test that age_months follows the age string on every save.
+        """
+        self.animal = Animal.objects.create(
+            shelter=self.shelter,
+            name="Test Animal",
+            age='6-12 month'
+        )
+        self.assertEqual(self.animal.age_months, 6)
+
+        self.animal.age = '7 year'
+        self.animal.save(update_fields=['age'])
+        self.animal.refresh_from_db()
+        self.assertEqual(self.animal.age_months, 84)
+
+    def test_age_in_months(self):
+        """
+        Test parsing of the age strings offered by AnimalForm.
+        """
+        self.assertEqual(age_in_months('0-5 month'), 0)
+        self.assertEqual(age_in_months('6-12 month'), 6)
+        self.assertEqual(age_in_months('1 year'), 12)
+        self.assertEqual(age_in_months('20 year'), 240)
+        self.assertEqual(age_in_months('3'), 36)
+        self.assertIsNone(age_in_months('unknown'))
+
+    def test_backfill_migration(self):
+        """
+        Test that the data migration fills age_months in chunks.
+        """
+        migration = import_module(
+            'animals.migrations.0015_backfill_age_months'
+        )
+        for i, age in enumerate(['0-5 month', '2 year', '10 year']):
+            Animal.objects.create(shelter=self.shelter, name=str(i), age=age)
+        Animal.objects.update(age_months=None)
+
+        with patch.object(migration, 'CHUNK_SIZE', 2):
+            migration.backfill_age_months(django_apps, None)
+
+        self.assertEqual(
+            list(Animal.objects.order_by('id').values_list(
+                'age_months', flat=True
+            )),
+            [0, 24, 120]
+        )
+
     def tearDown(self):
         """
         Clean up by deleting the uploaded test image after the test.
         """
-        if self.animal.image:
+        if self.animal and self.animal.image:
             os.remove(
                 os.path.join(settings.MEDIA_ROOT, self.animal.image.name)
                 )
@@ -938,3 +1298,337 @@ class UpdateModelTest(TestCase):
         # Check that the updates are correctly related to the animal
         self.assertIn(update1, self.animal.updates.all())
         self.assertIn(update2, self.animal.updates.all())
+
+
+@override_settings(CACHES={
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    FRAGMENT_CACHE: {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'fragments',
+    },
+})
+class FragmentCacheTest(TestCase):
+    """
+    Test cases for the cached fragments of the animal and shelter profile
+    pages and their invalidation, with a cache shared by the web processes.
+    """
+    def setUp(self):
+        """
+        Set up a shelter admin, a fosterer, a shelter and an animal with an
+        update.
+        """
+        caches[FRAGMENT_CACHE].clear()
+        self.admin = User.objects.create_user(
+            username='admin',
+            password='12345'
+        )
+        self.fosterer = User.objects.create_user(
+            username='fosterer',
+            password='12345'
+        )
+        self.shelter = Shelter.objects.create(
+            admin=self.admin,
+            name="Test Shelter",
+            registration_number="123456789",
+            description="A test shelter"
+        )
+        self.animal = Animal.objects.create(
+            shelter=self.shelter,
+            name="Sky",
+            species="Dog",
+            age='1 year',
+            description="Calm and friendly"
+        )
+        Update.objects.create(animal=self.animal, text="First walk")
+        self.url = f'/animals/profile/{self.animal.id}/'
+
+    def test_fragments_reused(self):
+        """
+        Test that a repeat view is served from the cache without querying
+        the updates.
+        """
+        self.client.get(self.url)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url)
+
+        self.assertContains(response, "Calm and friendly")
+        self.assertContains(response, "First walk")
+        self.assertFalse(any(
+            'animals_update' in query['sql'] for query in queries
+        ))
+
+    def test_saves_expire_fragments(self):
+        """
+        Test that saving an update, the animal or its shelter is reflected
+        on the next view.
+        """
+        self.client.get(self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            Update.objects.create(animal=self.animal, text="Vet visit")
+        self.assertContains(self.client.get(self.url), "Vet visit")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.animal.description = "Loves the beach"
+            self.animal.save()
+        self.assertContains(self.client.get(self.url), "Loves the beach")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.shelter.name = "Renamed Shelter"
+            self.shelter.save()
+        self.assertContains(self.client.get(self.url), "Renamed Shelter")
+
+    def test_deletes_expire_fragments(self):
+        """
+        Test that a deleted update disappears from the animal's page and a
+        deleted animal from its shelter's page.
+        """
+        shelter_url = f'/shelters/profile/{self.shelter.id}/'
+        self.client.get(self.url)
+        self.client.get(shelter_url)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.animal.updates.all().delete()
+        self.assertNotContains(self.client.get(self.url), "First walk")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.animal.delete()
+        self.assertNotContains(self.client.get(shelter_url), "Sky")
+
+    def test_controls_not_cached(self):
+        """
+        Test that the Foster button and the admin's edit controls are
+        rendered per user around the cached fragments.
+        """
+        anonymous = self.client.get(self.url)
+        self.client.login(username='fosterer', password='12345')
+        fosterer = self.client.get(self.url)
+        self.client.login(username='admin', password='12345')
+        admin = self.client.get(self.url)
+
+        self.assertNotContains(anonymous, '>Foster</a>')
+        self.assertContains(fosterer, '>Foster</a>')
+        self.assertNotContains(fosterer, 'Edit Profile')
+        self.assertContains(admin, 'Edit Profile')
+        self.assertContains(admin, 'deleteUpdateModal')
+        self.assertNotContains(fosterer, 'deleteUpdateModal')
+
+
+class UnsharedFragmentCacheTest(TestCase):
+    """
+    Test cases for the profile pages when there is no cache shared by the
+    web processes.
+    """
+    def test_fragments_not_cached(self):
+        """
+        Test that without a shared cache every view renders the current
+        data, even after a change that bumps no generation.
+        """
+        user = User.objects.create_user(username='admin', password='12345')
+        shelter = Shelter.objects.create(
+            admin=user, name="Test Shelter", registration_number="123456789"
+        )
+        animal = Animal.objects.create(
+            shelter=shelter, name="Sky", species="Dog", age='1 year',
+            description="Calm and friendly"
+        )
+        url = f'/animals/profile/{animal.id}/'
+        self.client.get(url)
+
+        Animal.objects.filter(id=animal.id).update(
+            description="Loves the beach"
+        )
+
+        self.assertContains(self.client.get(url), "Loves the beach")
+
+
+class CounterTest(TestCase):
+    """
+    Test cases for the animal and shelter counter columns and the recount
+    command.
+    """
+    def setUp(self):
+        """
+        Set up a shelter with one animal.
+        """
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='12345'
+        )
+        self.shelter = Shelter.objects.create(
+            admin=self.user,
+            name="Test Shelter",
+            registration_number="123456789",
+            description="A test shelter"
+        )
+        self.animal = Animal.objects.create(
+            shelter=self.shelter,
+            name="Sky",
+            age='1 year'
+        )
+
+    def counts(self):
+        self.shelter.refresh_from_db()
+        return self.shelter.animal_count, self.shelter.fostered_count
+
+    def test_animal_counts(self):
+        """
+        Test that adding, fostering, returning and deleting animals keep the
+        shelter's counts.
+        """
+        rex = Animal.objects.create(
+            shelter=self.shelter, name="Rex", age='2 year'
+        )
+        self.assertEqual(self.counts(), (2, 0))
+
+        rex.adoption_status = 'Fostered'
+        rex.save()
+        self.assertEqual(self.counts(), (2, 1))
+
+        rex.adoption_status = 'Available'
+        rex.save()
+        rex.adoption_status = 'Fostered'
+        rex.save()
+        self.assertEqual(self.counts(), (2, 1))
+
+        rex.delete()
+        self.assertEqual(self.counts(), (1, 0))
+
+    def test_update_counts(self):
+        """
+        Test that updates are counted and the last update time follows the
+        newest remaining update.
+        """
+        first = Update.objects.create(animal=self.animal, text="First")
+        second = Update.objects.create(animal=self.animal, text="Second")
+        self.animal.refresh_from_db()
+        self.shelter.refresh_from_db()
+        self.assertEqual(self.animal.update_count, 2)
+        self.assertEqual(self.animal.last_update_at, second.created_at)
+        self.assertEqual(self.shelter.last_update_at, second.created_at)
+
+        second.delete()
+        self.animal.refresh_from_db()
+        self.shelter.refresh_from_db()
+        self.assertEqual(self.animal.update_count, 1)
+        self.assertEqual(self.animal.last_update_at, first.created_at)
+        self.assertEqual(self.shelter.last_update_at, first.created_at)
+
+        self.animal.delete()
+        self.shelter.refresh_from_db()
+        self.assertIsNone(self.shelter.last_update_at)
+        self.assertEqual(self.counts(), (0, 0))
+
+    def test_update_count_not_below_zero(self):
+        """
+        Test that deleting an update from an animal whose count has drifted
+        to zero leaves it at zero.
+        """
+        update = Update.objects.create(animal=self.animal, text="News")
+        Animal.objects.filter(id=self.animal.id).update(update_count=0)
+
+        update.delete()
+
+        self.animal.refresh_from_db()
+        self.assertEqual(self.animal.update_count, 0)
+
+    def test_animal_delete_skips_update_counters(self):
+        """
+        Test that deleting an animal costs no queries per update for
+        uncounting updates that are deleted with it.
+        """
+        def delete_queries(updates):
+            animal = Animal.objects.create(
+                shelter=self.shelter, name="Rex", age='2 year'
+            )
+            for i in range(updates):
+                Update.objects.create(animal=animal, text=f"News {i}")
+            with CaptureQueriesContext(connection) as queries:
+                animal.delete()
+            return len(queries)
+
+        self.assertEqual(delete_queries(1), delete_queries(5))
+        self.shelter.refresh_from_db()
+        self.assertEqual(self.counts(), (1, 0))
+        self.assertIsNone(self.shelter.last_update_at)
+
+    def test_recount_repairs_drift(self):
+        """
+        Test that the recount command repairs counters changed behind the
+        signals' back.
+        """
+        update = Update.objects.create(animal=self.animal, text="News")
+        Animal.objects.filter(id=self.animal.id).update(
+            adoption_status='Fostered', update_count=7
+        )
+        Shelter.objects.filter(id=self.shelter.id).update(
+            animal_count=9, last_update_at=None
+        )
+        out = StringIO()
+
+        call_command('recount_counters', stdout=out)
+
+        self.assertIn('Recounted 1 animals and 1 shelters', out.getvalue())
+        self.assertEqual(self.counts(), (1, 1))
+        self.assertEqual(self.shelter.last_update_at, update.created_at)
+        self.animal.refresh_from_db()
+        self.assertEqual(self.animal.update_count, 1)
+
+
+class AnimalQueryBudgetTest(QueryBudgetTestCase):
+    """
+    Checks the animal views against their query budgets.
+    """
+    def setUp(self):
+        """
+        Set up a logged-in shelter admin, their shelter and an animal.
+        """
+        self.user = User.objects.create_user(
+            username='admin',
+            password='12345'
+        )
+        self.client.login(username='admin', password='12345')
+        self.shelter = Shelter.objects.create(
+            admin=self.user,
+            name="Test Shelter",
+            registration_number="123456789",
+            description="A test shelter"
+        )
+        self.animal = Animal.objects.create(
+            shelter=self.shelter,
+            name="Sky",
+            age='1 year',
+            image='animals/sky.jpg'
+        )
+
+    def add_animals(self, count):
+        for _ in range(count):
+            Animal.objects.create(
+                shelter=self.shelter,
+                name="Sky",
+                species="Dog",
+                age='1 year',
+                adoption_status='Available',
+                image='animals/sky.jpg'
+            )
+
+    def add_updates(self, count):
+        for _ in range(count):
+            Update.objects.create(animal=self.animal, text="News")
+
+    def test_animal_profile(self):
+        self.assertWithinBudget(
+            'animal_profile', self.add_updates, args=[self.animal.id]
+        )
+
+    def test_view_animals(self):
+        self.assertWithinBudget('view_animals', self.add_animals)
+
+    def test_browse_animals(self):
+        self.assertWithinBudget('browse_animals', self.add_animals)
+
+    def test_search_animals(self):
+        self.assertWithinBudget(
+            'search_animals', self.add_animals, query='?q=sky'
+        )
@@ -16,6 +16,8 @@ urlpatterns = [
       name='delete_animal_profile'
       ),
     path('', views.view_animals, name='view_animals'),
+    path('browse/', views.browse_animals, name='browse_animals'),
+    path('search/', views.search, name='search_animals'),
     path('add-update/<int:id>/', views.add_update, name='add_update'),
     path('edit-update/<int:id>/', views.edit_update, name='edit_update'),
     path('delete-update/<int:id>/', views.delete_update, name='delete_update'),
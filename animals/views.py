@@ -1,9 +1,18 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
+from django.http import JsonResponse
+from django.urls import reverse
 from .models import Animal, Update
-from .forms import AnimalForm, UpdateForm
-from shelters.models import Shelter
+from .forms import AnimalFilterForm, AnimalForm, UpdateForm
+from .facets import facet_counts
+from .fragments import FRAGMENT_TIMEOUT, generation
+from .search import search_animals
+from thumbnails.renditions import image_url
+
+
+# Number of animals per browse page
+PAGE_SIZE = 24
 
 
 @login_required
@@ -16,9 +25,8 @@ def add_animal(request):
     redirected to the shelter profile. If the form is invalid, an error message
     is shown and the form is re-rendered.
     """
-    try:
-        shelter = Shelter.objects.get(admin=request.user)
-    except Shelter.DoesNotExist:
+    shelter = request.identity.shelter
+    if shelter is None:
         messages.error(request, "You aren't a shelter admin")
         return redirect('home')
 
@@ -49,14 +57,22 @@ def profile(request, id):
     Attempts to retrieve the animal by its ID. If the animal does not exist,
     an error message is shown and the user is redirected to the homepage.
     Otherwise, the animal's profile page is rendered.
+
+    The animal's details, description and public updates are cached as
+    fragments keyed by the generations of the animal and its shelter.
     """
     try:
-        animal = Animal.objects.get(id=id)
+        animal = Animal.objects.select_related('shelter').get(id=id)
     except Animal.DoesNotExist:
         messages.error(request, "Animal not found")
         return redirect('home')
 
-    return render(request, 'animals/profile.html', {'animal': animal})
+    return render(request, 'animals/profile.html', {
+        'animal': animal,
+        'is_shelter_admin': request.identity.owns(animal.shelter_id),
+        'generation': generation(animal, animal.shelter),
+        'fragment_timeout': FRAGMENT_TIMEOUT,
+    })
 
 
 @login_required
@@ -71,7 +87,7 @@ def edit_profile(request, id):
     the form is invalid, an error message is shown and the form is re-rendered.
     """
     animal = get_object_or_404(Animal, id=id)
-    if animal.shelter.admin != request.user:
+    if not request.identity.owns(animal.shelter_id):
         messages.error(request, "Only shelter admin can edit animal")
         return redirect('home')
 
@@ -106,7 +122,7 @@ def delete_profile(request, id):
     message is displayed and the user is redirected to the shelter profile.
     """
     animal = get_object_or_404(Animal, id=id)
-    if animal.shelter.admin != request.user:
+    if not request.identity.owns(animal.shelter_id):
         messages.error(request, "Only shelter admin can delete animal")
         return redirect('profile')
 
@@ -121,15 +137,98 @@ def delete_profile(request, id):
     return redirect('home')
 
 
+def animal_page(params):
+    """
+    Returns one page of animals matching the browse filters in `params`,
+    the filter form, and the query string for the next page (None on the
+    last page).
+
+    Pages are keyed on the animal id rather than an offset: each page starts
+    after the last id of the previous one, so with the composite indexes on
+    Animal every page costs an index range scan of PAGE_SIZE rows however
+    deep the visitor goes.
+    """
+    form = AnimalFilterForm(params)
+    form.is_valid()
+    filters = form.cleaned_data
+
+    animals = Animal.objects.order_by('id')
+    for field in ('adoption_status', 'shelter', 'species', 'breed'):
+        if filters.get(field):
+            animals = animals.filter(**{field: filters[field]})
+    # Ages are whole years, so 'up to 2' includes animals of 2 years 11 months
+    if filters.get('min_age') is not None:
+        animals = animals.filter(age_months__gte=filters['min_age'] * 12)
+    if filters.get('max_age') is not None:
+        animals = animals.filter(age_months__lt=(filters['max_age'] + 1) * 12)
+    if filters.get('after') is not None:
+        animals = animals.filter(id__gt=filters['after'])
+
+    animals = list(animals[:PAGE_SIZE + 1])
+    next_page = None
+    if len(animals) > PAGE_SIZE:
+        animals = animals[:PAGE_SIZE]
+        query = params.copy()
+        query['after'] = animals[-1].id
+        next_page = query.urlencode()
+    return animals, form, next_page
+
+
+def animal_card(animal):
+    """
+    Returns the fields shown on an animal's browse card.
+    """
+    return {
+        'id': animal.id,
+        'name': animal.name,
+        'species': animal.species,
+        'breed': animal.breed,
+        'age': animal.age,
+        'adoption_status': animal.adoption_status,
+        'image': image_url(animal.image) if animal.image else None,
+        'url': reverse('animal_profile', args=[animal.id]),
+    }
+
+
 def view_animals(request):
     """
-    Displays a list of all animals.
+    Displays a page of animals, optionally filtered by adoption status,
+    shelter, species, breed and age range.
+
+    The page links to the next one, which the browse script loads from
+    browse_animals and appends in place. The number of animals for each
+    filter value is read from the maintained facet counts.
+    """
+    animals, form, next_page = animal_page(request.GET)
+    return render(request, 'animals/view_animals.html', {
+        'animals': animals,
+        'form': form,
+        'next_page': next_page,
+        'facets': facet_counts(),
+    })
 
-    Retrieves all Animal objects and renders them on the 'view_animals'
-    template.
+
+def browse_animals(request):
+    """
+    Returns a page of animals as JSON, with the same filters and cursor as
+    view_animals.
+    """
+    animals, form, next_page = animal_page(request.GET)
+    return JsonResponse({
+        'animals': [animal_card(animal) for animal in animals],
+        'next': next_page,
+    })
+
+
+def search(request):
+    """
+    Returns the animals that best match the `q` parameter as JSON, ranked
+    by the full-text index.
     """
-    animals = Animal.objects.all()
-    return render(request, 'animals/view_animals.html', {'animals': animals})
+    animals = search_animals(request.GET.get('q', ''))
+    return JsonResponse({
+        'animals': [animal_card(animal) for animal in animals],
+    })
 
 
 @login_required
@@ -146,7 +245,7 @@ def add_update(request, id):
     """
     animal = get_object_or_404(Animal, id=id)
 
-    if animal.shelter.admin != request.user:
+    if not request.identity.owns(animal.shelter_id):
         messages.error(request, "Only shelter admin can add update")
         return redirect('animal_profile', id=animal.id)
 
@@ -182,9 +281,9 @@ def edit_update(request, id):
     the form is invalid, an error message is displayed and the form is
     re-rendered with errors.
     """
-    update = get_object_or_404(Update, id=id)
+    update = get_object_or_404(Update.objects.select_related('animal'), id=id)
 
-    if update.animal.shelter.admin != request.user:
+    if not request.identity.owns(update.animal.shelter_id):
         messages.error(request, "Only shelter admin can edit this update")
         return redirect('animal_profile', id=update.animal.id)
 
@@ -220,9 +319,9 @@ def delete_update(request, id):
     the update is successfully deleted, a success message is shown. If an error
     occurs during deletion, an error message is displayed.
     """
-    update = get_object_or_404(Update, id=id)
+    update = get_object_or_404(Update.objects.select_related('animal'), id=id)
 
-    if update.animal.shelter.admin != request.user:
+    if not request.identity.owns(update.animal.shelter_id):
         messages.error(request, "Only shelter admin can delete this update")
         return redirect('animal_profile', id=update.animal.id)
 
@@ -0,0 +1,13 @@
+from django.contrib import admin
+from .models import Blob
+
+
+class BlobAdmin(admin.ModelAdmin):
+    """
+    Blob admin display options.
+    """
+    list_display = ('name', 'size', 'references', 'last_used')
+    readonly_fields = ('name', 'size', 'references', 'created_at', 'last_used')
+
+
+admin.site.register(Blob, BlobAdmin)
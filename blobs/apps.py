@@ -0,0 +1,19 @@
+from django.apps import AppConfig
+
+
+class BlobsConfig(AppConfig):
+    """
+    App configuration for the 'blobs' app, which stores uploaded files once
+    per distinct content and removes them when nothing refers to them.
+
+    Connects the reference counting handlers of every file field using
+    ContentAddressedStorage when the app is ready.
+    """
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'blobs'
+
+    def ready(self):
+        """
+        Import signal handlers when the app is ready.
+        """
+        import blobs.signals
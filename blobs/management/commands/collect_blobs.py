@@ -0,0 +1,38 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from blobs.references import BATCH_SIZE, GRACE_PERIOD, collect_blobs
+
+
+class Command(BaseCommand):
+    """
+    Management command that deletes stored blobs no file field refers to.
+    Meant to be run on a schedule.
+    """
+    help = "Delete unreferenced content-addressed blobs"
+
+    def add_arguments(self, parser):
+        """
+        Adds the batch size and grace period options.
+        """
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=BATCH_SIZE,
+            help="Number of blobs deleted per transaction"
+        )
+        parser.add_argument(
+            '--grace',
+            type=int,
+            default=int(GRACE_PERIOD.total_seconds() // 60),
+            help="Minutes an unreferenced blob is kept before deletion"
+        )
+
+    def handle(self, *args, **options):
+        """
+        Deletes unreferenced blobs in batches until none are due.
+        """
+        deleted = collect_blobs(
+            options['batch_size'],
+            timedelta(minutes=options['grace'])
+        )
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} blobs"))
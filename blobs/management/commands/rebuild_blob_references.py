@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from blobs.references import rebuild_references
+
+
+class Command(BaseCommand):
+    """
+    Management command that recounts blob references from the file fields
+    that hold them.
+    """
+    help = "Rebuild the reference counts of content-addressed blobs"
+
+    def handle(self, *args, **options):
+        """
+        Recounts every blob.
+        """
+        blobs = rebuild_references()
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt references of {blobs} blobs"
+        ))
@@ -0,0 +1,29 @@
+from django.db import models
+
+
+class Blob(models.Model):
+    """
+    A stored file named after the SHA-256 digest of its content.
+
+    `references` counts the model file fields currently holding `name`.
+    Blobs left at zero are deleted by collect_blobs once `last_used` is
+    older than its grace period, which covers the time between an upload
+    being stored and the row referring to it being saved.
+    """
+    name = models.CharField(max_length=255, unique=True)
+    size = models.PositiveBigIntegerField(default=0)
+    references = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_used = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['last_used'],
+                condition=models.Q(references__lte=0),
+                name='blobs_blob_unreferenced_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return self.name
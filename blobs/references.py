@@ -0,0 +1,140 @@
+import logging
+from datetime import timedelta
+from django.apps import apps
+from django.db import transaction
+from django.db.models import F, FileField
+from django.utils import timezone
+from .models import Blob
+from .storage import ContentAddressedStorage, content_addressed_storage
+
+
+logger = logging.getLogger(__name__)
+
+# Unreferenced blobs deleted per transaction by collect_blobs
+BATCH_SIZE = 500
+# How long an unreferenced blob is kept, so an upload whose row has not
+# been saved yet is not collected
+GRACE_PERIOD = timedelta(hours=1)
+
+
+def tracked_fields():
+    """
+    Returns (model, field name) for every file field stored with
+    ContentAddressedStorage.
+    """
+    return [
+        (model, field.name)
+        for model in apps.get_models()
+        for field in model._meta.get_fields()
+        if isinstance(field, FileField)
+        and isinstance(field.storage, ContentAddressedStorage)
+    ]
+
+
+def adjust(name, delta):
+    """
+    Adds `delta` to the reference count of a blob. Names that are not blobs,
+    such as files saved before content addressing, are ignored.
+    """
+    if name:
+        Blob.objects.filter(name=name).update(
+            references=F('references') + delta,
+            last_used=timezone.now()
+        )
+
+
+def record_change(old, new):
+    """
+    Moves a reference from blob `old` to blob `new`. Either may be empty,
+    for a field being set, cleared, created or deleted.
+    """
+    if old != new:
+        adjust(new, 1)
+        adjust(old, -1)
+
+
+def referenced_names(names):
+    """
+    Returns the subset of `names` that a tracked field still holds.
+    """
+    referenced = set()
+    for model, field_name in tracked_fields():
+        referenced.update(
+            model._base_manager.filter(**{f'{field_name}__in': names})
+            .values_list(field_name, flat=True)
+        )
+    return referenced
+
+
+def collect_batch(batch_size=BATCH_SIZE, grace=GRACE_PERIOD):
+    """
+    Deletes up to `batch_size` unreferenced blobs unused for longer than
+    `grace`. Returns how many were deleted, or None if none were due.
+
+    The claimed rows are locked with SKIP LOCKED, so collectors running at
+    once take different batches. Files are deleted before the transaction
+    commits, while the deleted rows are still locked, so an upload of the
+    same content waits for the batch and then stores the file again. A file
+    whose row has been created again in the meantime is kept. A failed file
+    delete leaves a stray file rather than a row naming a missing one.
+    Names still held by a tracked field are spared even if their count has
+    drifted to zero, and have their count repaired.
+    """
+    cutoff = timezone.now() - grace
+    with transaction.atomic():
+        names = list(
+            Blob.objects.select_for_update(skip_locked=True)
+            .filter(references__lte=0, last_used__lt=cutoff)
+            .order_by('last_used')
+            .values_list('name', flat=True)[:batch_size]
+        )
+        if not names:
+            return None
+        referenced = referenced_names(names)
+        unreferenced = [name for name in names if name not in referenced]
+        Blob.objects.filter(name__in=unreferenced).delete()
+        for name in unreferenced:
+            if Blob.objects.filter(name=name).exists():
+                continue
+            try:
+                content_addressed_storage.backend.delete(name)
+            except Exception:
+                logger.exception("Failed to delete blob %s", name)
+    for name in referenced:
+        rebuild_references(name)
+    return len(unreferenced)
+
+
+def collect_blobs(batch_size=BATCH_SIZE, grace=GRACE_PERIOD):
+    """
+    Deletes unreferenced blobs in batches until none are left, and returns
+    how many were deleted.
+    """
+    total = 0
+    while (deleted := collect_batch(batch_size, grace)) is not None:
+        total += deleted
+    return total
+
+
+def rebuild_references(name=None):
+    """
+    Recounts the references of one blob, or of every blob, from the tracked
+    fields.
+    """
+    blobs = Blob.objects.all()
+    if name is not None:
+        blobs = blobs.filter(name=name)
+    counts = {}
+    for model, field_name in tracked_fields():
+        holders = model._base_manager.exclude(**{field_name: ''})
+        if name is not None:
+            holders = holders.filter(**{field_name: name})
+        for held in holders.values_list(field_name, flat=True):
+            if held:
+                counts[held] = counts.get(held, 0) + 1
+    updated = []
+    for blob in blobs.only('id', 'name', 'references'):
+        blob.references = counts.get(blob.name, 0)
+        updated.append(blob)
+    Blob.objects.bulk_update(updated, ['references'], batch_size=BATCH_SIZE)
+    return len(updated)
@@ -0,0 +1,57 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from .references import record_change, tracked_fields
+
+
+def remember_stored_name(field_name):
+    """
+    Returns a pre_save handler that reads the file name an instance has in
+    the database before it is saved, so the blob it leaves loses a
+    reference.
+    """
+    def handler(sender, instance, **kwargs):
+        stored = None
+        if not instance._state.adding:
+            stored = (
+                sender._base_manager.filter(pk=instance.pk)
+                .values_list(field_name, flat=True)
+                .first()
+            )
+        instance.__dict__[f'_stored_{field_name}'] = stored
+    return handler
+
+
+def count_saved_reference(field_name):
+    """
+    Returns a post_save handler that moves the reference from the stored
+    blob to the saved one.
+    """
+    def handler(sender, instance, **kwargs):
+        record_change(
+            instance.__dict__.pop(f'_stored_{field_name}', None),
+            getattr(instance, field_name).name
+        )
+    return handler
+
+
+def uncount_deleted_reference(field_name):
+    """
+    Returns a post_delete handler that drops the deleted instance's
+    reference.
+    """
+    def handler(sender, instance, **kwargs):
+        record_change(getattr(instance, field_name).name, None)
+    return handler
+
+
+for model, field_name in tracked_fields():
+    for signal, handler in (
+        (pre_save, remember_stored_name),
+        (post_save, count_saved_reference),
+        (post_delete, uncount_deleted_reference),
+    ):
+        signal.connect(
+            handler(field_name),
+            sender=model,
+            weak=False,
+            dispatch_uid=f'blobs.{model._meta.label}.{field_name}'
+        )
@@ -0,0 +1,119 @@
+import hashlib
+import os
+from django.core.files.storage import Storage, storages
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from django.utils.deconstruct import deconstructible
+from .models import Blob
+
+
+@deconstructible
+class ContentAddressedStorage(Storage):
+    """
+    Storage layered over another storage backend that keeps one copy of
+    each distinct file.
+
+    Uploads are hashed chunk by chunk and stored as
+    '<directory>/<ab>/<digest><ext>', where <ab> is the first two digest
+    characters. Saving content that is already stored records another use
+    of the existing blob instead of uploading it again. Reads, URLs and
+    existence checks go to the backend, so names saved before this storage
+    was used keep working.
+
+    A blob can be shared by several fields, so delete() leaves blobs in
+    place; they are removed by collect_blobs once unreferenced.
+    """
+    def __init__(self, backend='default', directory='blobs'):
+        self.backend_alias = backend
+        self.directory = directory
+
+    @property
+    def backend(self):
+        """
+        Returns the storage holding the blobs, looked up on each use so it
+        follows changes to STORAGES.
+        """
+        return storages[self.backend_alias]
+
+    def blob_name(self, digest, name):
+        """
+        Returns the name of the blob with the given digest, keeping the file
+        extension of the uploaded name.
+        """
+        extension = os.path.splitext(name)[1].lower()
+        if not extension[1:].isalnum() or len(extension) > 6:
+            extension = ''
+        return f'{self.directory}/{digest[:2]}/{digest}{extension}'
+
+    def is_blob(self, name):
+        return name.startswith(f'{self.directory}/')
+
+    def get_available_name(self, name, max_length=None):
+        """
+        Returns the name unchanged; the stored name comes from the content.
+        """
+        return name
+
+    def _save(self, name, content):
+        """
+        Hashes the content and records a use of the blob with that digest,
+        uploading the file if it is not stored.
+
+        The Blob row is locked, or created, before deciding whether to
+        upload. collect_blobs deletes files while still holding the locks
+        on their deleted rows, so a save of content being collected waits
+        for the batch and then finds neither row nor file. last_used is
+        refreshed either way, so a blob reused while unreferenced is not
+        collected before its new reference is saved.
+        """
+        digest = hashlib.sha256()
+        size = 0
+        for chunk in content.chunks():
+            digest.update(chunk)
+            size += len(chunk)
+        name = self.blob_name(digest.hexdigest(), name)
+
+        with transaction.atomic():
+            blob = Blob.objects.select_for_update().filter(name=name).first()
+            if blob is None:
+                try:
+                    with transaction.atomic():
+                        blob = Blob.objects.create(name=name, size=size)
+                except IntegrityError:
+                    # The same content was stored concurrently
+                    blob = Blob.objects.select_for_update().get(name=name)
+            else:
+                Blob.objects.filter(id=blob.id).update(
+                    last_used=timezone.now()
+                )
+            # A referenced blob's file is known to be stored; any other may
+            # be new, or left without its file by an interrupted collection
+            if blob.references <= 0 and not self.backend.exists(name):
+                content.seek(0)
+                self.backend.save(name, content)
+        return name
+
+    def _open(self, name, mode='rb'):
+        return self.backend.open(name, mode)
+
+    def delete(self, name):
+        if not self.is_blob(name):
+            self.backend.delete(name)
+
+    def exists(self, name):
+        return self.backend.exists(name)
+
+    def path(self, name):
+        return self.backend.path(name)
+
+    def size(self, name):
+        return self.backend.size(name)
+
+    def url(self, name):
+        return self.backend.url(name)
+
+    def get_modified_time(self, name):
+        return self.backend.get_modified_time(name)
+
+
+content_addressed_storage = ContentAddressedStorage()
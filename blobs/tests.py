@@ -0,0 +1,213 @@
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db.models.signals import post_delete
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from animals.models import Animal
+from shelters.models import Shelter
+from .models import Blob
+from .references import collect_blobs
+from .storage import content_addressed_storage
+
+
+def upload(content=b'photo', name='photo.jpg'):
+    return SimpleUploadedFile(name, content, 'image/jpeg')
+
+
+class ContentAddressedStorageTests(TestCase):
+    """
+    Test cases for storing uploads once per content, counting their
+    references and collecting unreferenced blobs.
+    """
+    def setUp(self):
+        """
+        Set up a temporary media directory and a shelter.
+        """
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        override = override_settings(MEDIA_ROOT=self.media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='12345'
+        )
+        self.shelter = Shelter.objects.create(
+            admin=self.user,
+            name="Test Shelter",
+            registration_number="12345",
+            description="A test shelter"
+        )
+
+    def animal(self, image, name="Sky"):
+        return Animal.objects.create(
+            shelter=self.shelter,
+            name=name,
+            age='1 year',
+            image=image
+        )
+
+    def stored_files(self):
+        return [
+            file
+            for _, _, files in os.walk(os.path.join(self.media_root, 'blobs'))
+            for file in files
+        ]
+
+    def expire(self):
+        Blob.objects.update(last_used=timezone.now() - timedelta(days=1))
+
+    def test_duplicate_upload_stored_once(self):
+        """
+        Test that the same content uploaded under different names is stored
+        once, named by its digest, and referenced by both animals.
+        """
+        first = self.animal(upload(name='a.JPG'))
+        second = self.animal(upload(name='b.jpg'), name="Rex")
+
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertRegex(
+            first.image.name, r'^blobs/[0-9a-f]{2}/[0-9a-f]{64}\.jpg$'
+        )
+        self.assertEqual(len(self.stored_files()), 1)
+        blob = Blob.objects.get()
+        self.assertEqual((blob.size, blob.references), (5, 2))
+        with first.image.open() as file:
+            self.assertEqual(file.read(), b'photo')
+
+    def test_references_follow_fields(self):
+        """
+        Test that replacing, clearing and deleting images move the counts.
+        """
+        animal = self.animal(upload())
+        old = animal.image.name
+        animal.image = upload(b'other')
+        animal.save()
+        new = animal.image.name
+
+        self.assertEqual(Blob.objects.get(name=old).references, 0)
+        self.assertEqual(Blob.objects.get(name=new).references, 1)
+
+        animal.delete()
+        self.assertEqual(Blob.objects.get(name=new).references, 0)
+
+    def test_unreferenced_blobs_collected(self):
+        """
+        Test that collection deletes unreferenced blobs in batches once past
+        the grace period, and keeps referenced and recent ones.
+        """
+        kept = self.animal(upload(b'kept'))
+        for content in (b'one', b'two', b'three'):
+            self.animal(upload(content), name="Gone").delete()
+
+        self.assertEqual(collect_blobs(), 0)
+        self.expire()
+        self.assertEqual(collect_blobs(batch_size=2), 3)
+
+        self.assertEqual(
+            list(Blob.objects.values_list('name', flat=True)),
+            [kept.image.name]
+        )
+        self.assertEqual(len(self.stored_files()), 1)
+        self.assertTrue(default_storage.exists(kept.image.name))
+
+    def test_reupload_keeps_blob(self):
+        """
+        Test that uploading content whose blob is unreferenced reuses it and
+        restarts its grace period.
+        """
+        self.animal(upload()).delete()
+        self.expire()
+        animal = self.animal(upload(name='again.jpg'))
+
+        self.assertEqual(collect_blobs(), 0)
+        self.assertTrue(animal.image.storage.exists(animal.image.name))
+        self.assertEqual(Blob.objects.get().references, 1)
+
+    def test_save_during_collection_keeps_file(self):
+        """
+        Test that content saved again between the collector deleting its
+        row and deleting its file keeps both.
+        """
+        name = self.animal(upload(b'again')).image.name
+        Animal.objects.get().delete()
+        self.expire()
+        saved = []
+
+        def save_again(sender, instance, **kwargs):
+            saved.append(content_addressed_storage.save(
+                'again.jpg', ContentFile(b'again')
+            ))
+
+        post_delete.connect(save_again, sender=Blob)
+        try:
+            collect_blobs()
+        finally:
+            post_delete.disconnect(save_again, sender=Blob)
+
+        self.assertEqual(saved, [name])
+        self.assertTrue(Blob.objects.filter(name=name).exists())
+        self.assertTrue(default_storage.exists(name))
+
+    def test_save_restores_missing_file(self):
+        """
+        Test that saving content whose unreferenced blob has lost its file
+        uploads the file again.
+        """
+        name = self.animal(upload(b'lost')).image.name
+        Animal.objects.get().delete()
+        default_storage.delete(name)
+
+        content_addressed_storage.save('lost.jpg', ContentFile(b'lost'))
+
+        with default_storage.open(name) as file:
+            self.assertEqual(file.read(), b'lost')
+
+    def test_drifted_count_repaired(self):
+        """
+        Test that a blob still held by a field is not collected when its
+        count has drifted to zero, and its count is repaired.
+        """
+        animal = self.animal(upload())
+        Blob.objects.update(references=0)
+        self.expire()
+
+        self.assertEqual(collect_blobs(), 0)
+        self.assertEqual(Blob.objects.get().references, 1)
+        self.assertTrue(default_storage.exists(animal.image.name))
+
+    def test_legacy_names_still_served(self):
+        """
+        Test that files saved before content addressing keep their names.
+        """
+        name = default_storage.save('legacy.jpg', upload())
+        animal = self.animal(None)
+        Animal.objects.filter(id=animal.id).update(image=name)
+        animal.refresh_from_db()
+
+        self.assertEqual(animal.image.url, '/media/legacy.jpg')
+        self.assertTrue(animal.image.storage.exists(name))
+
+    def test_commands(self):
+        """
+        Test that the commands rebuild counts and collect blobs.
+        """
+        self.animal(upload())
+        Blob.objects.update(references=5)
+        out = StringIO()
+
+        call_command('rebuild_blob_references', stdout=out)
+        call_command('collect_blobs', '--grace=0', stdout=out)
+
+        self.assertIn('Rebuilt references of 1 blobs', out.getvalue())
+        self.assertIn('Deleted 0 blobs', out.getvalue())
+        self.assertEqual(Blob.objects.get().references, 1)
@@ -1,12 +1,277 @@
+import contextvars
+import logging
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from django.conf import settings
+from django.core.files.storage import FileSystemStorage, Storage
+from django.urls import re_path
+from django.utils.deconstruct import deconstructible
+from django.utils.module_loading import import_string
+from django.views.static import serve
 from storages.backends.s3boto3 import S3Boto3Storage
+from metrics.tracing import span
 
 
-class StaticStorage(S3Boto3Storage):
-    location = settings.STATICFILES_LOCATION
+logger = logging.getLogger(__name__)
+
+
+class TracedS3Storage(S3Boto3Storage):
+    """
+    S3 storage whose requests to S3 are recorded as tracing spans.
+    """
+    def s3_span(self, operation, name):
+        return span(f's3.{operation}', 'client', {
+            'aws.s3.bucket': self.bucket_name,
+            'aws.s3.key': name,
+        })
+
+    def _save(self, name, content):
+        with self.s3_span('put_object', name):
+            return super()._save(name, content)
+
+    def _open(self, name, mode='rb'):
+        with self.s3_span('get_object', name):
+            return super()._open(name, mode)
+
+    def delete(self, name):
+        with self.s3_span('delete_object', name):
+            return super().delete(name)
+
+    def exists(self, name):
+        with self.s3_span('head_object', name):
+            return super().exists(name)
+
+
+class StaticStorage(TracedS3Storage):
+    location = getattr(settings, 'STATICFILES_LOCATION', 'static')
     default_acl = 'public-read'
 
 
-class MediaStorage(S3Boto3Storage):
-    location = settings.MEDIAFILES_LOCATION
+class MediaStorage(TracedS3Storage):
+    location = getattr(settings, 'MEDIAFILES_LOCATION', 'media')
     default_acl = 'public-read'
+
+
+@deconstructible
+class StagedMediaStorage(Storage):
+    """
+    Media storage that saves uploads to local disk and promotes them to a
+    remote storage, S3 by default, from a background thread.
+
+    A request that saves an image returns as soon as the file is on disk.
+    Until promotion finishes the file is read and served locally from
+    MEDIA_STAGING_URL; afterwards the staged copy is deleted and url()
+    returns the remote URL. The remote storage is set with
+    STAGED_MEDIA_REMOTE_STORAGE.
+
+    Staged files live on the web dyno's own disk, so promotion runs in the
+    web process rather than as a job on the worker dyno, which cannot read
+    them. Promotions still queued when the process exits cleanly finish
+    before it does. Files left staged, because every attempt failed or the
+    process that saved them was killed, are queued again by a sweep of the
+    staging directory when the storage starts and every sweep_interval
+    seconds after.
+    """
+    # Promotion attempts before a file is left staged
+    attempts = 3
+    # Seconds before the first retry; each later retry waits twice as long
+    retry_delay = 1
+    # Seconds a staged file must have been left before a sweep queues it,
+    # so sweeps do not race the promotion queued when it was saved
+    sweep_min_age = 60
+
+    def __init__(self, remote=None, location=None, base_url=None, workers=4,
+                 sweep_interval=None):
+        self.remote = remote or import_string(getattr(
+            settings,
+            'STAGED_MEDIA_REMOTE_STORAGE',
+            'custom_storages.MediaStorage'
+        ))()
+        self.local = FileSystemStorage(
+            location=location or settings.MEDIA_STAGING_ROOT,
+            base_url=base_url or settings.MEDIA_STAGING_URL
+        )
+        self.executor = ThreadPoolExecutor(
+            max_workers=workers,
+            thread_name_prefix='media-promotion'
+        )
+        self.lock = threading.Lock()
+        # Queued promotions, by file name
+        self.pending = {}
+        if sweep_interval is None:
+            sweep_interval = getattr(
+                settings, 'STAGED_MEDIA_SWEEP_INTERVAL', 300
+            )
+        if sweep_interval:
+            threading.Thread(
+                target=self.sweep_every,
+                args=(sweep_interval,),
+                name='media-sweep',
+                daemon=True
+            ).start()
+
+    def _save(self, name, content):
+        """
+        Writes the file to the staging directory and queues its promotion.
+        """
+        name = self.local.save(name, content)
+        self.queue(name)
+        return name
+
+    def queue(self, name):
+        """
+        Queues the promotion of a staged file and returns True, or returns
+        False if it is already queued.
+        """
+        with self.lock:
+            if name in self.pending:
+                return False
+            # Promote in a copy of the current context, so its span joins
+            # the trace of the request that saved the file
+            self.pending[name] = self.executor.submit(
+                contextvars.copy_context().run, self.promote_queued, name
+            )
+            return True
+
+    def promote_queued(self, name):
+        try:
+            return self.promote(name)
+        finally:
+            with self.lock:
+                self.pending.pop(name, None)
+
+    def sweep(self, min_age=None):
+        """
+        Queues the promotion of every staged file left for at least
+        `min_age` seconds, sweep_min_age by default, and returns their
+        names.
+        """
+        if min_age is None:
+            min_age = self.sweep_min_age
+        queued = []
+        for name in self.staged():
+            try:
+                age = time.time() - os.path.getmtime(self.local.path(name))
+            except FileNotFoundError:
+                continue
+            if age >= min_age and self.queue(name):
+                queued.append(name)
+        return queued
+
+    def sweep_every(self, interval):
+        """
+        Sweeps the staging directory now and then every `interval` seconds,
+        for the life of the process.
+        """
+        while True:
+            try:
+                self.sweep()
+            except Exception:
+                logger.exception("Failed to sweep staged media")
+            time.sleep(interval)
+
+    def promote(self, name):
+        """
+        Uploads a staged file to the remote storage under the same name and
+        removes the staged copy. A failed upload is retried with backoff and
+        the file stays staged, and served locally, if every attempt fails.
+        A file already promoted by another process is left alone.
+        """
+        for attempt in range(self.attempts):
+            if not self.local.exists(name):
+                return True
+            try:
+                with span('storage.promote', attributes={
+                    'storage.name': name,
+                    'storage.attempt': attempt + 1,
+                }), self.local.open(name, 'rb') as file:
+                    self.remote.save(name, file)
+            except Exception:
+                logger.exception("Failed to promote %s", name)
+                time.sleep(self.retry_delay * 2 ** attempt)
+            else:
+                self.local.delete(name)
+                return True
+        return False
+
+    def wait(self):
+        """
+        Blocks until every queued promotion has finished.
+        """
+        with self.lock:
+            pending = list(self.pending.values())
+        for future in pending:
+            future.result()
+
+    def get_available_name(self, name, max_length=None):
+        """
+        Uses the remote storage's naming, so a staged file keeps the name it
+        will have once promoted.
+        """
+        return self.remote.get_available_name(name, max_length=max_length)
+
+    def _open(self, name, mode='rb'):
+        if self.local.exists(name):
+            return self.local.open(name, mode)
+        return self.remote.open(name, mode)
+
+    def delete(self, name):
+        self.local.delete(name)
+        self.remote.delete(name)
+
+    def exists(self, name):
+        return self.local.exists(name) or self.remote.exists(name)
+
+    def size(self, name):
+        if self.local.exists(name):
+            return self.local.size(name)
+        return self.remote.size(name)
+
+    def url(self, name):
+        """
+        Returns the staging URL while the file is still local, and the
+        remote URL once it has been promoted. Checking is a local stat, so
+        rendering a page costs no remote requests.
+        """
+        if self.local.exists(name):
+            return self.local.url(name)
+        return self.remote.url(name)
+
+    def get_modified_time(self, name):
+        if self.local.exists(name):
+            return self.local.get_modified_time(name)
+        return self.remote.get_modified_time(name)
+
+    def staged(self):
+        """
+        Returns the names of files waiting for promotion.
+        """
+        names = []
+        root = self.local.location
+        for directory, _, files in os.walk(root):
+            for file in files:
+                path = os.path.join(directory, file)
+                names.append(os.path.relpath(path, root).replace(os.sep, '/'))
+        return names
+
+
+def serve_staged(request, path):
+    """
+    Serves a staged upload from MEDIA_STAGING_ROOT. Only the dyno that
+    received an upload holds it, so this runs in production as well.
+    """
+    return serve(request, path, document_root=settings.MEDIA_STAGING_ROOT)
+
+
+def staged_urls():
+    """
+    Returns the URL pattern serving staged uploads at MEDIA_STAGING_URL, or
+    no patterns when uploads are not staged.
+    """
+    if not getattr(settings, 'STAGE_MEDIA_UPLOADS', False):
+        return []
+    prefix = re.escape(settings.MEDIA_STAGING_URL.lstrip('/'))
+    return [re_path(r'^%s(?P<path>.*)$' % prefix, serve_staged)]
@@ -5,7 +5,14 @@ class DashboardConfig(AppConfig):
     """
     Configuration class for the 'dashboard' app.
 
-    Sets the default auto field type and specifies the app name.
+    Sets the default auto field type, specifies the app name and imports
+    signal handlers when the app is ready.
     """
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'dashboard'
+
+    def ready(self):
+        """
+        Import dashboard signals when the app is ready.
+        """
+        import dashboard.signals
@@ -0,0 +1,276 @@
+import asyncio
+import json
+import logging
+import threading
+import time
+from datetime import timedelta
+from django.db import close_old_connections, transaction
+from django.db.models import Max
+from django.utils import timezone
+from .models import Sprite, StreamEvent
+
+
+logger = logging.getLogger(__name__)
+
+# Seconds between the per-process checks for events published by other
+# processes
+POLL_INTERVAL = 5
+# Seconds of silence after which a keep-alive comment is sent
+HEARTBEAT_INTERVAL = 15
+# How long published events are kept for reconnecting clients
+RETENTION = timedelta(hours=1)
+
+
+class Notifier:
+    """
+    Wakes event streams in this process as soon as an event is published for
+    their user.
+
+    Streams in other processes are not reachable from here and are woken by
+    their own process's poller instead.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.waiters = {}
+
+    def subscribe(self, user_id):
+        """
+        Registers the running event loop to be woken for `user_id` and
+        returns the waiter to wait on.
+        """
+        waiter = (asyncio.get_running_loop(), asyncio.Event())
+        with self.lock:
+            self.waiters.setdefault(user_id, set()).add(waiter)
+        return waiter
+
+    def unsubscribe(self, user_id, waiter):
+        """
+        Removes a waiter registered with subscribe().
+        """
+        with self.lock:
+            waiters = self.waiters.get(user_id, set())
+            waiters.discard(waiter)
+            if not waiters:
+                self.waiters.pop(user_id, None)
+
+    def subscribed(self):
+        """
+        Returns the IDs of the users with a stream in this process.
+        """
+        with self.lock:
+            return set(self.waiters)
+
+    def notify(self, user_id):
+        """
+        Wakes every stream in this process that belongs to `user_id`. Safe to
+        call from any thread.
+        """
+        with self.lock:
+            waiters = list(self.waiters.get(user_id, ()))
+        for loop, event in waiters:
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:
+                # The stream's loop has already closed
+                pass
+
+
+notifier = Notifier()
+
+
+class Poller:
+    """
+    Background thread that checks the StreamEvent table every `interval`
+    seconds for events published by other processes, and wakes this
+    process's streams of the users they belong to.
+
+    One indexed query per process per interval replaces one per open
+    stream, and the thread holds the only database connection spent on
+    polling. Nothing is queried while the process has no streams.
+    """
+    def __init__(self, notifier, interval=POLL_INTERVAL):
+        self.notifier = notifier
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.thread = None
+        # Newest event seen, or None before the first check
+        self.cursor = None
+
+    def start(self):
+        """
+        Starts the thread unless it is already running in this process.
+        """
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(
+                    target=self.run,
+                    name='stream-event-poller',
+                    daemon=True
+                )
+                self.thread.start()
+
+    def run(self):
+        while True:
+            close_old_connections()
+            try:
+                self.check()
+            except Exception:
+                logger.exception("Failed to check for stream events")
+            time.sleep(self.interval)
+
+    def check(self):
+        """
+        Wakes the streams of every user with an event newer than the last
+        check. The first check after a quiet spell reads the newest event
+        and wakes every stream, since events may have been published just
+        before it was read.
+        """
+        users = self.notifier.subscribed()
+        if not users:
+            self.cursor = None
+            return
+        if self.cursor is None:
+            self.cursor = StreamEvent.objects.aggregate(
+                Max('id')
+            )['id__max'] or 0
+            woken = users
+        else:
+            events = list(StreamEvent.objects.filter(
+                id__gt=self.cursor
+            ).values_list('id', 'user_id'))
+            self.cursor = max(
+                [self.cursor] + [event_id for event_id, _ in events]
+            )
+            woken = users & {user_id for _, user_id in events}
+        for user_id in woken:
+            self.notifier.notify(user_id)
+
+
+poller = Poller(notifier)
+
+
+def publish(user_id, kind, data):
+    """
+    Records an event for a user's stream and wakes local streams once the
+    surrounding transaction commits.
+
+    Events older than RETENTION are pruned for the same user, so the table
+    only ever holds what a reconnecting client could still ask for.
+    """
+    event = StreamEvent.objects.create(user_id=user_id, kind=kind, data=data)
+    StreamEvent.objects.filter(
+        user_id=user_id,
+        created_at__lt=timezone.now() - RETENTION
+    ).delete()
+    transaction.on_commit(lambda: notifier.notify(user_id))
+    return event
+
+
+def format_event(kind, data, event_id=None):
+    """
+    Formats one Server-Sent Events message.
+    """
+    message = ''
+    if event_id is not None:
+        message += f'id: {event_id}\n'
+    message += f'event: {kind}\ndata: {json.dumps(data)}\n\n'
+    return message
+
+
+def next_change(sprites, now):
+    """
+    Returns the number of seconds until the status of any of the sprites next
+    changes, which happens on a whole minute from each sprite's anchor.
+    """
+    delays = [
+        60 - (now - sprite.last_checked).total_seconds() % 60
+        for sprite in sprites
+    ]
+    return min(delays, default=None)
+
+
+async def stream(user_id, last_event_id=None,
+                 heartbeat_interval=HEARTBEAT_INTERVAL):
+    """
+    Yields Server-Sent Events messages for a user until the client goes away.
+
+    Sprite statuses are computed in memory from the anchors, so satiation
+    decay and STANDING/RUNNING flips are pushed at the minute they happen
+    without touching the database. The StreamEvent table is only read when
+    the stream is woken: at once for events published in this process, and
+    by the process's poller for those published elsewhere. Anchors are only
+    reloaded when a `sprite` event says a row changed, for example after a
+    feed. New `update` events are forwarded as they are.
+
+    Under the ASGI worker each stream's queries run on its request's own
+    thread, so the stream holds a database connection for its whole life,
+    released when the client disconnects.
+    """
+    loop, wake = notifier.subscribe(user_id)
+    poller.start()
+    try:
+        if last_event_id is None:
+            last_event_id = await StreamEvent.objects.filter(
+                user_id=user_id
+            ).order_by('-id').values_list('id', flat=True).afirst() or 0
+
+        sprites = [s async for s in Sprite.objects.filter(user_id=user_id)]
+        sent = {}
+        last_sent = time.monotonic()
+        woken = True
+
+        while True:
+            wake.clear()
+            reload_sprites = False
+            messages = []
+
+            if woken:
+                events = StreamEvent.objects.filter(
+                    user_id=user_id,
+                    id__gt=last_event_id
+                ).order_by('id')
+                async for event in events:
+                    last_event_id = event.id
+                    if event.kind == StreamEvent.Kinds.SPRITE:
+                        reload_sprites = True
+                    else:
+                        messages.append(
+                            format_event(event.kind, event.data, event.id)
+                        )
+
+            if reload_sprites:
+                sprites = [
+                    s async for s in Sprite.objects.filter(user_id=user_id)
+                ]
+
+            now = timezone.now()
+            for sprite in sprites:
+                status = sprite.status_data(now)
+                if sent.get(sprite.id) != status:
+                    sent[sprite.id] = status
+                    messages.append(format_event(
+                        StreamEvent.Kinds.SPRITE,
+                        {'id': sprite.id, **status},
+                        last_event_id,
+                    ))
+
+            if messages:
+                last_sent = time.monotonic()
+                yield ''.join(messages)
+            elif time.monotonic() - last_sent >= heartbeat_interval:
+                last_sent = time.monotonic()
+                yield ': keep-alive\n\n'
+
+            timeout = min(
+                filter(None, [
+                    heartbeat_interval,
+                    next_change(sprites, timezone.now()),
+                ])
+            )
+            try:
+                await asyncio.wait_for(wake.wait(), timeout)
+                woken = True
+            except asyncio.TimeoutError:
+                woken = False
+    finally:
+        notifier.unsubscribe(user_id, (loop, wake))
@@ -0,0 +1,42 @@
+import time
+from django.core.management.base import BaseCommand
+from dashboard.simulation import CHUNK_SIZE, advance_sprites
+
+
+class Command(BaseCommand):
+    """
+    Management command that brings every sprite's stored status up to date,
+    including the daily reset of the standing and running counters.
+    """
+    help = "Advance the satiation and state timers of all sprites"
+
+    def add_arguments(self, parser):
+        """
+        Adds the chunk size and worker count options.
+        """
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=CHUNK_SIZE,
+            help="Number of sprites loaded and written per chunk"
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help="Number of processes to spread the chunks over"
+        )
+
+    def handle(self, *args, **options):
+        """
+        Runs the bulk simulation and reports how many sprites changed.
+        """
+        started = time.monotonic()
+        updated = advance_sprites(
+            chunk_size=options['chunk_size'],
+            workers=options['workers'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Advanced {updated} sprites in "
+            f"{time.monotonic() - started:.1f}s"
+        ))
@@ -0,0 +1,19 @@
+# Generated by Django 5.1 on 2026-10-18 13:03
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0007_sprite_time_running_sprite_time_standing'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='sprite',
+            name='last_checked',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
@@ -1,7 +1,18 @@
+from datetime import timedelta
 from django.utils import timezone
 from django.db import models
+from django.db.models import F, Value
+from django.db.models.functions import Greatest, Least
 from django.contrib.auth.models import User
 from animals.models import Animal
+from .status import (
+    DECAY_PER_MINUTE, FEED_AMOUNT, MAX_SATIATION, RUNNING_THRESHOLD,
+    compute_status,
+)
+
+
+# Number of times a feed is retried when a concurrent feed wins the race
+FEED_ATTEMPTS = 3
 
 
 class Sprite(models.Model):
@@ -50,7 +61,7 @@ class Sprite(models.Model):
         )
     url = models.CharField(max_length=50)
     created_at = models.DateTimeField(auto_now_add=True)
-    last_checked = models.DateTimeField(auto_now=True)
+    last_checked = models.DateTimeField(default=timezone.now)
     satiation = models.IntegerField(default=50)
     current_state = models.CharField(
         max_length=10,
@@ -67,40 +78,126 @@ class Sprite(models.Model):
         """
         return f"Sprite {self.id} for {self.animal.name}"
 
-    def update_status(self):
+    def status(self, now=None):
+        """
+        Returns the sprite's satiation, state and daily state timers as of
+        `now` (defaults to the current time).
+
+        The values are computed from the stored anchors and nothing is saved,
+        so reading a sprite's status never writes to the database.
+        """
+        return compute_status(
+            self.satiation,
+            self.time_standing,
+            self.time_running,
+            self.last_checked,
+            now or timezone.now(),
+        )
+
+    def status_data(self, now=None):
+        """
+        Returns the sprite's status as served to the dashboard, without the
+        internal anchor timestamp.
+        """
+        status = self.status(now)
+        del status['last_checked']
+        return status
+
+    def feed(self, count=1, now=None):
+        """
+        Feeds the sprite `count` times and stores the result.
+
+        Re-anchors the sprite at its current status and adds the food in one
+        conditional UPDATE. The satiation is decayed, fed and capped at
+        MAX_SATIATION in SQL, and the WHERE clause only matches while the
+        stored anchor is still the one this instance was read with. If a
+        concurrent feed moved the anchor first, the row is reloaded and the
+        feed retried, so no lock is ever taken. Returns False if every attempt
+        lost the race.
+        """
+        for attempt in range(FEED_ATTEMPTS):
+            status = self.status(now)
+            elapsed = (status['last_checked'] - self.last_checked) // (
+                timedelta(minutes=1)
+            )
+            satiation = min(
+                status['satiation'] + FEED_AMOUNT * count,
+                MAX_SATIATION
+            )
+            status['satiation'] = satiation
+            status['current_state'] = (
+                self.States.STANDING if satiation < RUNNING_THRESHOLD
+                else self.States.RUNNING
+            )
+
+            updated = Sprite.objects.filter(
+                pk=self.pk,
+                satiation=self.satiation,
+                last_checked=self.last_checked,
+            ).update(
+                satiation=Least(
+                    Greatest(
+                        F('satiation') - elapsed * DECAY_PER_MINUTE,
+                        Value(0)
+                    ) + FEED_AMOUNT * count,
+                    Value(MAX_SATIATION)
+                ),
+                current_state=status['current_state'],
+                time_standing=status['time_standing'],
+                time_running=status['time_running'],
+                last_checked=status['last_checked'],
+            )
+            if updated:
+                for field, value in status.items():
+                    setattr(self, field, value)
+                return True
+
+            self.refresh_from_db(fields=[
+                'satiation', 'current_state', 'time_standing',
+                'time_running', 'last_checked',
+            ])
+        return False
+
+    def update_status(self, now=None):
         """
-        Updates the sprite's status based on time elapsed since last checked.
+        Brings the sprite's fields up to date in memory.
 
-        Adjusts the sprite's satiation, state (standing or running), and time
-        spent in each state. Resets daily time counters if a new day has begun.
+        Moves the anchor forward to the latest whole minute and applies the
+        computed satiation, state and time counters without saving. Callers
+        that change the sprite because of a real event, such as feeding, call
+        this first and then save.
+        """
+        for field, value in self.status(now).items():
+            setattr(self, field, value)
+
+
+class StreamEvent(models.Model):
+    """
+    Model representing a change pushed to a user's dashboard event stream.
+
+    A row is written whenever something the user watches changes outside the
+    passage of time, such as feeding a sprite or a new update for a fostered
+    animal. Stream connections in every process read new rows by ID, so the
+    table doubles as a cross-process notifier without an external broker.
+    """
+    class Kinds(models.TextChoices):
+        SPRITE = 'sprite', 'Sprite'
+        UPDATE = 'update', 'Update'
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='stream_events'
+        )
+    kind = models.CharField(max_length=10, choices=Kinds.choices)
+    data = models.JSONField(default=dict)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['user', 'id'])]
+
+    def __str__(self):
+        """
+        Returns a string representation of the event.
         """
-        now = timezone.now()
-        delta = now - self.last_checked
-        mins_passed = delta.seconds // 60
-
-        self.satiation = max(self.satiation - mins_passed, 0)
-
-        # Reset time values if it's a new day
-        if self.last_checked.date() != now.date():
-            midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
-            self.last_checked = midnight
-            self.time_standing = 0
-            self.time_running = 0
-
-            delta = now - self.last_checked
-            mins_passed = delta.seconds // 60
-
-        # State time setters
-        if self.current_state == self.States.STANDING:
-            self.time_standing += mins_passed
-        elif self.current_state == self.States.RUNNING:
-            self.time_running += mins_passed
-
-        # State change handlers
-        if self.satiation < 50:
-            self.current_state = self.States.STANDING
-        else:
-            self.current_state = self.States.RUNNING
-
-        self.last_checked = now
-        self.save()
+        return f"{self.kind} event {self.id} for {self.user}"
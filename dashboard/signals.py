@@ -0,0 +1,25 @@
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from animals.models import Update
+from .events import publish
+from .models import StreamEvent
+
+
+@receiver(post_save, sender=Update)
+def publish_update_to_fosterer(sender, instance, created, **kwargs):
+    """
+    Pushes a new Update to the event stream of the animal's fosterer, if the
+    animal is currently fostered.
+    """
+    if created and instance.animal.fosterer_id:
+        publish(
+            instance.animal.fosterer.user_id,
+            StreamEvent.Kinds.UPDATE,
+            {
+                'id': instance.id,
+                'animal_id': instance.animal_id,
+                'animal_name': instance.animal.name,
+                'text': instance.text,
+                'created_at': instance.created_at.isoformat(),
+            }
+        )
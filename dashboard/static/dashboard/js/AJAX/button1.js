@@ -1,10 +1,11 @@
-export async function feedSprite(spriteId) {
+export async function feedSprite(spriteId, count = 1) {
   try {
     const response = await fetch(`/dashboard/sprite/${spriteId}/feed/`, {
       method: 'POST',
       headers: {
         'X-CSRFToken': getCSRFToken(),
       },
+      body: new URLSearchParams({ count }),
     });
 
     const data = await response.json();
@@ -40,9 +40,16 @@ describe('feedSprite', () => {
       headers: {
         'X-CSRFToken': 'mockedToken',
       },
+      body: new URLSearchParams({ count: 1 }),
     });
   });
 
+  test('should send the number of feeds in one request', async () => {
+    await feedSprite(1, 3);
+    expect(fetch).toHaveBeenCalledTimes(1);
+    expect(fetch.mock.calls[0][1].body.get('count')).toBe('3');
+  });
+
   test('getCSRFToken should extract the token from document.cookie', () => {
     const csrfToken = getCSRFToken();
     expect(csrfToken).toBe('mockedToken');
@@ -4,7 +4,7 @@ import { feedSprite } from '../AJAX/button1.js';
 import { ChartClass } from '../chart/chart.js';
 
 export class Game {
-  constructor(width, height, id, url) {
+  constructor(width, height, id, url, status) {
     this.width = width;
     this.height = height;
     this.id = id;
@@ -14,31 +14,113 @@ export class Game {
     this.satiation = 55;
     this.chartObj = new ChartClass(this.id);
 
-    this.fetchStatus();
+    if (status) this.setStatus(status);
+  }
+  setStatus(data) {
+    this.satiation = data.satiation;
+    this.sprite.setState(data.current_state);
+    this.chartObj.updateChart(data);
+  }
+  update(deltaTime) {
+    this.sprite.update(deltaTime);
+  }
+  draw(context) {
+    this.userInterface.draw(context);
+    this.sprite.draw(context);
+  }
+}
+
+export class StatusPoller {
+  constructor(games) {
+    this.games = games;
+  }
+  start() {
     this.statusInterval = setInterval(() => this.fetchStatus(), 61000);
   }
   fetchStatus() {
-    fetch(`/dashboard/sprite/${this.id}/update-status/`)
+    return fetch('/dashboard/sprites/status/')
       .then(response => response.json())
       .then(data => {
-        this.satiation = data.satiation;
-        this.sprite.setState(data.current_state);
-        this.chartObj.updateChart(data);
+        Object.entries(data.sprites).forEach(([id, status]) => {
+          const game = this.games[id];
+          if (game) game.setStatus(status);
+        });
       })
       .catch(error => {
         console.error('Failed to fetch status:', error);
       });
   }
-  update(deltaTime) {
-    this.sprite.update(deltaTime);
+}
+
+export class StatusStream {
+  constructor(games) {
+    this.games = games;
+    this.source = new EventSource('/dashboard/events/');
+    this.source.addEventListener('sprite', event => this.onSprite(event));
+    this.source.addEventListener('update', event => this.onUpdate(event));
   }
-  draw(context) {
-    this.userInterface.draw(context);
-    this.sprite.draw(context);
+  onSprite(event) {
+    const data = JSON.parse(event.data);
+    const game = this.games[data.id];
+    if (game) game.setStatus(data);
+  }
+  onUpdate(event) {
+    const data = JSON.parse(event.data);
+    showAlert(`New update for ${data.animal_name}: ${data.text}`);
+  }
+}
+
+export function showAlert(text, kind = 'info') {
+  const alerts = document.querySelector('#update-alerts');
+  if (!alerts) return;
+  const alert = document.createElement('div');
+  alert.className = `alert alert-${kind}`;
+  alert.textContent = text;
+  alerts.prepend(alert);
+}
+
+// Most feeds the server accepts in one request, MAX_FEEDS in dashboard/views.py
+export const MAX_FEEDS = 20;
+
+// Sends clicks in quick succession as one request for several feeds. A full
+// batch is sent at once, and a rejected batch is reported to the user.
+export class FeedBatcher {
+  constructor(game, delay = 300) {
+    this.game = game;
+    this.delay = delay;
+    this.pending = 0;
+    this.timer = null;
+  }
+  click() {
+    this.pending++;
+    clearTimeout(this.timer);
+    if (this.pending >= MAX_FEEDS) return this.flush();
+    this.timer = setTimeout(() => this.flush(), this.delay);
+  }
+  async flush() {
+    clearTimeout(this.timer);
+    const count = this.pending;
+    this.pending = 0;
+    if (!count) return;
+    const data = await feedSprite(this.game.id, count);
+    if (data.success) {
+      this.game.setStatus(data);
+    } else {
+      const feeds = count === 1 ? 'feed' : `${count} feeds`;
+      showAlert(`Your ${feeds} could not be given: ${data.error}`, 'warning');
+    }
   }
 }
 
 window.addEventListener('load', function () {
+  const statusElement = document.getElementById('sprite-status-data');
+  const initialStatus = statusElement ? JSON.parse(statusElement.textContent) : {};
+  const games = {};
+  const poller = new StatusPoller(games);
+  // Fall back to polling where Server-Sent Events are not supported
+  const stream = window.EventSource ? new StatusStream(games) : null;
+  if (!stream) poller.start();
+
   const spriteCanvases = document.querySelectorAll('.sprite-canvas');
   spriteCanvases.forEach(canvas => {
     canvas.width = 300;
@@ -46,7 +128,8 @@ window.addEventListener('load', function () {
     const ctx = canvas.getContext('2d');
     const id = canvas.getAttribute('data-id');
     const url = canvas.getAttribute('data-url');
-    const game = new Game(canvas.width, canvas.height, id, url);
+    const game = new Game(canvas.width, canvas.height, id, url, initialStatus[id]);
+    games[id] = game;
     let lastTimeAnimate = 0;
 
     function animate(timestamp) {
@@ -61,10 +144,7 @@ window.addEventListener('load', function () {
     animate(0);
 
     const feedButton = document.querySelector(`#button1-${id}`);
-    feedButton.addEventListener('click', async () => {
-      await feedSprite(id);
-      game.fetchStatus();
-    });
+    const feeds = new FeedBatcher(game);
+    feedButton.addEventListener('click', () => feeds.click());
   });
 });
-
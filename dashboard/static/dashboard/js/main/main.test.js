@@ -1,18 +1,31 @@
-import { Game } from './main.js';
+import {
+  Game, StatusPoller, StatusStream, FeedBatcher, MAX_FEEDS
+} from './main.js';
 import { UserInterface } from '../userInterface/userInterface.js';
 import { Sprite } from '../sprite/sprite.js';
 import { ChartClass } from '../chart/chart.js';
+import { feedSprite } from '../AJAX/button1.js';
 
 // Mock dependencies
 jest.mock('../sprite/sprite.js');
 jest.mock('../chart/chart.js');
+jest.mock('../AJAX/button1.js');
+
+// Let pending promise callbacks run
+async function settle() {
+  for (let i = 0; i < 10; i++) await Promise.resolve();
+}
 
 // Mock global fetch function
 global.fetch = jest.fn(() =>
   Promise.resolve({
     json: () => Promise.resolve({
-      satiation: 75,
-      current_state: 'RUNNING'
+      sprites: {
+        1: {
+          satiation: 75,
+          current_state: 'RUNNING'
+        }
+      }
     })
   })
 );
@@ -59,24 +72,22 @@ describe('Game class', () => {
     expect(game.url).toBe("husky/one");
   });
 
-  test('.fetchStatus should update status', async () => {
-    await game.fetchStatus();
-    expect(fetch).toHaveBeenCalledWith('/dashboard/sprite/1/update-status/');
-    expect(game.satiation).toBe(75);
-    expect(game.sprite.setState).toHaveBeenCalledWith('RUNNING');
-    expect(game.chartObj.updateChart).toHaveBeenCalledWith({
-      satiation: 75,
-      current_state: 'RUNNING'
-    });
+  test('should apply the initial status without fetching', () => {
+    fetch.mockClear();
+    const status = { satiation: 40, current_state: 'STANDING' };
+    const seeded = new Game(200, 200, 2, "husky/one", status);
+    expect(fetch).not.toHaveBeenCalled();
+    expect(seeded.satiation).toBe(40);
+    expect(seeded.sprite.setState).toHaveBeenCalledWith('STANDING');
+    expect(seeded.chartObj.updateChart).toHaveBeenCalledWith(status);
   });
 
-  test('should call fetchStatus every 61 seconds', () => {
-    const mockFetchStatus = jest.spyOn(game, 'fetchStatus');
-    expect(mockFetchStatus).not.toHaveBeenCalled();
-    jest.advanceTimersByTime(30000);
-    expect(mockFetchStatus).not.toHaveBeenCalled();
-    jest.advanceTimersByTime(31000);
-    expect(mockFetchStatus).toHaveBeenCalledTimes(1);
+  test('.setStatus should update status', () => {
+    const status = { satiation: 75, current_state: 'RUNNING' };
+    game.setStatus(status);
+    expect(game.satiation).toBe(75);
+    expect(game.sprite.setState).toHaveBeenCalledWith('RUNNING');
+    expect(game.chartObj.updateChart).toHaveBeenCalledWith(status);
   });
 
   test('.update should call .update on sprite', () => {
@@ -94,3 +105,133 @@ describe('Game class', () => {
   });
 });
 
+describe('StatusPoller class', () => {
+  let game, poller;
+
+  beforeEach(() => {
+    jest.useFakeTimers();
+    fetch.mockClear();
+    game = new Game(200, 200, 1, "husky/one");
+    game.setStatus = jest.fn();
+    poller = new StatusPoller({ 1: game });
+  });
+
+  afterEach(() => {
+    jest.clearAllTimers();
+  });
+
+  test('.fetchStatus should update every game from one request', async () => {
+    await poller.fetchStatus();
+    expect(fetch).toHaveBeenCalledTimes(1);
+    expect(fetch).toHaveBeenCalledWith('/dashboard/sprites/status/');
+    expect(game.setStatus).toHaveBeenCalledWith({
+      satiation: 75,
+      current_state: 'RUNNING'
+    });
+  });
+
+  test('should call fetchStatus every 61 seconds once started', () => {
+    const mockFetchStatus = jest.spyOn(poller, 'fetchStatus');
+    jest.advanceTimersByTime(61000);
+    expect(mockFetchStatus).not.toHaveBeenCalled();
+    poller.start();
+    expect(mockFetchStatus).not.toHaveBeenCalled();
+    jest.advanceTimersByTime(30000);
+    expect(mockFetchStatus).not.toHaveBeenCalled();
+    jest.advanceTimersByTime(31000);
+    expect(mockFetchStatus).toHaveBeenCalledTimes(1);
+  });
+});
+
+describe('StatusStream class', () => {
+  let game, statusStream, listeners;
+
+  beforeEach(() => {
+    listeners = {};
+    global.EventSource = jest.fn(() => ({
+      addEventListener: (name, callback) => { listeners[name] = callback; },
+    }));
+    game = new Game(200, 200, 1, "husky/one");
+    game.setStatus = jest.fn();
+    statusStream = new StatusStream({ 1: game });
+  });
+
+  test('should open one stream for the page', () => {
+    expect(EventSource).toHaveBeenCalledTimes(1);
+    expect(EventSource).toHaveBeenCalledWith('/dashboard/events/');
+    expect(statusStream.games[1]).toBe(game);
+  });
+
+  test('should pass sprite events to the matching game', () => {
+    listeners.sprite({ data: JSON.stringify({ id: 1, satiation: 60 }) });
+    expect(game.setStatus).toHaveBeenCalledWith({ id: 1, satiation: 60 });
+  });
+
+  test('should show update events as an alert', () => {
+    document.body.innerHTML = '<div id="update-alerts"></div>';
+    listeners.update({
+      data: JSON.stringify({ animal_name: 'Rex', text: 'Went for a walk' })
+    });
+    const alert = document.querySelector('#update-alerts .alert');
+    expect(alert.textContent).toBe('New update for Rex: Went for a walk');
+  });
+});
+
+describe('FeedBatcher class', () => {
+  let game, batcher;
+
+  beforeEach(() => {
+    jest.useFakeTimers();
+    document.body.innerHTML = '<div id="update-alerts"></div>';
+    feedSprite.mockReset();
+    feedSprite.mockResolvedValue({ success: true, satiation: 80 });
+    game = new Game(200, 200, 1, "husky/one");
+    game.setStatus = jest.fn();
+    batcher = new FeedBatcher(game);
+  });
+
+  afterEach(() => {
+    jest.clearAllTimers();
+  });
+
+  test('should send quick clicks as one request', async () => {
+    batcher.click();
+    batcher.click();
+    batcher.click();
+    expect(feedSprite).not.toHaveBeenCalled();
+    jest.advanceTimersByTime(300);
+    await settle();
+    expect(feedSprite).toHaveBeenCalledTimes(1);
+    expect(feedSprite).toHaveBeenCalledWith(1, 3);
+    expect(game.setStatus).toHaveBeenCalledWith({ success: true, satiation: 80 });
+  });
+
+  test('should send a full batch at once in a burst of clicks', async () => {
+    for (let i = 0; i < MAX_FEEDS + 5; i++) batcher.click();
+    await settle();
+    expect(feedSprite).toHaveBeenCalledTimes(1);
+    expect(feedSprite).toHaveBeenCalledWith(1, MAX_FEEDS);
+    jest.advanceTimersByTime(300);
+    await settle();
+    expect(feedSprite).toHaveBeenCalledTimes(2);
+    expect(feedSprite).toHaveBeenLastCalledWith(1, 5);
+    feedSprite.mock.calls.forEach(([, count]) => {
+      expect(count).toBeLessThanOrEqual(MAX_FEEDS);
+    });
+  });
+
+  test('should tell the user when a batch is rejected', async () => {
+    feedSprite.mockResolvedValue({
+      success: false, error: 'Not enough tokens to feed the sprite.'
+    });
+    batcher.click();
+    batcher.click();
+    jest.advanceTimersByTime(300);
+    await settle();
+    expect(game.setStatus).not.toHaveBeenCalled();
+    const alert = document.querySelector('#update-alerts .alert-warning');
+    expect(alert.textContent).toBe(
+      'Your 2 feeds could not be given: Not enough tokens to feed the sprite.'
+    );
+  });
+});
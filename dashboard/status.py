@@ -0,0 +1,70 @@
+from datetime import timedelta
+
+
+# Satiation rules shared by the model, the views and the bulk simulation
+DECAY_PER_MINUTE = 1
+RUNNING_THRESHOLD = 50
+MAX_SATIATION = 100
+FEED_AMOUNT = 5
+
+STANDING = 'STANDING'
+RUNNING = 'RUNNING'
+
+
+def running_span(satiation):
+    """
+    Returns the number of whole minutes, counted from the anchor, during which
+    a sprite anchored at the given satiation is still running.
+
+    A sprite runs while its satiation is at or above RUNNING_THRESHOLD, so a
+    sprite anchored at 55 runs for minutes 0 to 5 and stands from minute 6.
+    """
+    return max(
+        (satiation - RUNNING_THRESHOLD) // DECAY_PER_MINUTE + 1,
+        0
+    )
+
+
+def compute_status(satiation, time_standing, time_running, anchor, now):
+    """
+    Works out a sprite's status at `now` from its stored anchors.
+
+    `satiation`, `time_standing` and `time_running` are the values stored at
+    the `anchor` timestamp. Nothing is read from or written to the database,
+    so the result can be served on every poll without touching the row.
+
+    Only whole minutes are consumed, so the returned `last_checked` is the
+    anchor moved forward by those minutes rather than `now`. Saving the result
+    as the new anchor therefore never loses a partial minute of decay.
+
+    The standing/running counters cover the current (UTC) day only. When the
+    anchor belongs to an earlier day, however long ago, the counters are
+    rebuilt from midnight using the satiation trajectory since the anchor.
+    """
+    elapsed = max(int((now - anchor).total_seconds() // 60), 0)
+    span = running_span(satiation)
+
+    midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    if anchor >= midnight:
+        start = 0
+    else:
+        # Minutes since the anchor that started before midnight belong to a
+        # previous day
+        before_midnight = -int((anchor - midnight).total_seconds() // 60)
+        start = min(before_midnight, elapsed)
+        time_standing = 0
+        time_running = 0
+
+    running = max(min(elapsed, span) - start, 0)
+    standing = elapsed - start - running
+    current_satiation = max(satiation - elapsed * DECAY_PER_MINUTE, 0)
+
+    return {
+        'satiation': current_satiation,
+        'current_state': (
+            STANDING if current_satiation < RUNNING_THRESHOLD else RUNNING
+        ),
+        'time_standing': time_standing + standing,
+        'time_running': time_running + running,
+        'last_checked': anchor + timedelta(minutes=elapsed),
+    }
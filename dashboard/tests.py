@@ -1,15 +1,24 @@
 import os
+import numpy as np
+from io import StringIO
 from django.conf import settings
 from django.utils import timezone
 from django.test import TestCase
-from unittest.mock import patch
+from django.core.management import call_command
+from unittest.mock import Mock, patch
+from asgiref.sync import sync_to_async
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.contrib.messages import get_messages
 from django.contrib.auth.models import User
 from shelters.models import Shelter
-from animals.models import Animal
-from .models import Sprite
+from virtual_shelter.budgets import QueryBudgetTestCase
+from animals.models import Animal, Update
+from .events import Notifier, Poller, publish, stream
+from .models import Sprite, StreamEvent
 from .forms import SpriteForm
+from . import simulation
+from .simulation import advance_arrays, advance_sprites, to_microseconds
+from .status import FEED_AMOUNT, compute_status
 
 
 # Views
@@ -68,6 +77,17 @@ class DashboardViewTests(TestCase):
         self.assertEqual(list(response.context['sprites']), [self.sprite])
         self.assertEqual(response.context['profile'], self.user.profile)
 
+    def test_dashboard_view_embeds_initial_status(self):
+        """
+        Test that the dashboard embeds each sprite's status in the page so the
+        canvases can draw without fetching it.
+        """
+        response = self.client.get('/dashboard/')
+        status = response.context['sprite_status'][str(self.sprite.id)]
+        self.assertEqual(status['satiation'], self.sprite.satiation)
+        self.assertEqual(status['current_state'], Sprite.States.RUNNING)
+        self.assertContains(response, 'id="sprite-status-data"')
+
     def test_dashboard_view_with_success_payment_status(self):
         """
         Test accessing the dashboard with a successful payment status. Confirms
@@ -114,6 +134,52 @@ class DashboardViewTests(TestCase):
         super().tearDown()
 
 
+class DashboardQueryBudgetTests(QueryBudgetTestCase):
+    """
+    Checks the dashboard views against their query budgets.
+    """
+    def setUp(self):
+        """
+        Set up a logged-in user and a shelter to take animals from.
+        """
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='12345'
+            )
+        self.client.login(username='testuser', password='12345')
+        admin = User.objects.create_user(username='admin', password='12345')
+        self.shelter = Shelter.objects.create(
+            admin=admin,
+            name="Test Shelter",
+            registration_number="123456789",
+            description="A test shelter"
+            )
+
+    def add_sprites(self, count):
+        for _ in range(count):
+            animal = Animal.objects.create(
+                shelter=self.shelter,
+                name="Test Animal",
+                age=4,
+                adoption_status='Fostered',
+                fosterer=self.user.profile,
+                image='animals/test_image.jpg'
+            )
+            Sprite.objects.create(
+                user=self.user,
+                animal=animal,
+                breed=Sprite.BreedChoices.HUSKY,
+                colour=Sprite.ColourChoices.ONE,
+                url='husky/one'
+            )
+
+    def test_dashboard(self):
+        self.assertWithinBudget('dashboard', self.add_sprites)
+
+    def test_sprites_status(self):
+        self.assertWithinBudget('sprites_status', self.add_sprites)
+
+
 class SelectSpriteViewTests(TestCase):
     """
     Test suite for the select sprite view, where users can foster an animal by
@@ -378,6 +444,239 @@ class UpdateStatusViewTests(TestCase):
         mock_update_status.assert_called_once()
 
 
+class SpritesStatusViewTests(TestCase):
+    """
+    Test suite for the view that returns the status of all of a user's
+    sprites in one response.
+    """
+    def setUp(self):
+        """
+        Set up the test environment by creating two users with a sprite each,
+        and logging in the first user.
+        """
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='12345'
+            )
+        self.other_user = User.objects.create_user(
+            username='otheruser',
+            password='12345'
+            )
+        self.client.login(username='testuser', password='12345')
+        self.shelter = Shelter.objects.create(
+            admin=self.other_user,
+            name="Test Shelter",
+            registration_number="123456789",
+            description="A test shelter"
+            )
+        self.animal = Animal.objects.create(
+            shelter=self.shelter,
+            name="Test Animal",
+            species="Dog",
+            age=4,
+            description="A friendly dog",
+            adoption_status='available'
+        )
+        self.sprites = [
+            Sprite.objects.create(
+                user=self.user,
+                animal=self.animal,
+                satiation=satiation
+            )
+            for satiation in (30, 70)
+        ]
+        self.other_sprite = Sprite.objects.create(
+            user=self.other_user,
+            animal=self.animal
+        )
+
+    def test_sprites_status_view(self):
+        """
+        Test that the view returns the status of every sprite belonging to the
+        user, keyed by sprite ID.
+        """
+        response = self.client.get('/dashboard/sprites/status/')
+        self.assertEqual(response.status_code, 200)
+        data = response.json()['sprites']
+        self.assertEqual(
+            set(data),
+            {str(sprite.id) for sprite in self.sprites}
+            )
+        self.assertEqual(data[str(self.sprites[0].id)], {
+            'satiation': 30,
+            'current_state': 'STANDING',
+            'time_standing': 0,
+            'time_running': 0,
+            })
+        self.assertEqual(
+            data[str(self.sprites[1].id)]['current_state'],
+            'RUNNING'
+            )
+
+    def test_sprites_status_view_does_not_write(self):
+        """
+        Test that polling the status does not change the stored sprites.
+        """
+        Sprite.objects.filter(user=self.user).update(
+            last_checked=timezone.now() - timezone.timedelta(minutes=10)
+        )
+        response = self.client.get('/dashboard/sprites/status/')
+        data = response.json()['sprites']
+        self.assertEqual(data[str(self.sprites[1].id)]['satiation'], 60)
+        self.sprites[1].refresh_from_db()
+        self.assertEqual(self.sprites[1].satiation, 70)
+
+    def test_sprites_status_requires_login(self):
+        """
+        Test that anonymous users are redirected to log in.
+        """
+        self.client.logout()
+        response = self.client.get('/dashboard/sprites/status/')
+        self.assertEqual(response.status_code, 302)
+
+
+class EventStreamTests(TestCase):
+    """
+    Test suite for the Server-Sent Events stream of sprite statuses and
+    animal updates.
+    """
+    def setUp(self):
+        """
+        Set up the test environment by creating a user with a sprite for a
+        fostered animal, and logging in the user.
+        """
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='12345'
+            )
+        self.client.login(username='testuser', password='12345')
+        self.shelter = Shelter.objects.create(
+            admin=self.user,
+            name="Test Shelter",
+            registration_number="123456789",
+            description="A test shelter"
+            )
+        self.animal = Animal.objects.create(
+            shelter=self.shelter,
+            name="Test Animal",
+            species="Dog",
+            age=4,
+            description="A friendly dog",
+            adoption_status='Fostered',
+            fosterer=self.user.profile
+        )
+        self.sprite = Sprite.objects.create(
+            user=self.user,
+            animal=self.animal,
+            satiation=70
+        )
+        # The poller's thread would query on a connection of its own
+        poller_start = patch('dashboard.events.poller.start')
+        poller_start.start()
+        self.addCleanup(poller_start.stop)
+
+    async def test_stream_sends_current_status(self):
+        """
+        Test that a new stream starts with the status of every sprite.
+        """
+        messages = stream(self.user.id)
+        message = await anext(messages)
+        await messages.aclose()
+
+        self.assertIn('event: sprite', message)
+        self.assertIn('"satiation": 70', message)
+        self.assertIn('"current_state": "RUNNING"', message)
+
+    async def test_stream_pushes_published_events(self):
+        """
+        Test that sprite changes and updates published after the stream
+        starts are pushed to it.
+        """
+        messages = stream(self.user.id)
+        await anext(messages)
+
+        @sync_to_async
+        def committed(func, *args, **kwargs):
+            with self.captureOnCommitCallbacks(execute=True):
+                func(*args, **kwargs)
+
+        await Sprite.objects.filter(id=self.sprite.id).aupdate(satiation=40)
+        await committed(
+            publish,
+            self.user.id, StreamEvent.Kinds.SPRITE, {'id': self.sprite.id}
+            )
+        message = await anext(messages)
+        self.assertIn('"satiation": 40', message)
+        self.assertIn('"current_state": "STANDING"', message)
+
+        await committed(
+            Update.objects.create, animal=self.animal, text='Went for a walk'
+            )
+        message = await anext(messages)
+        await messages.aclose()
+        self.assertIn('event: update', message)
+        self.assertIn('Went for a walk', message)
+
+    def test_poller_wakes_users_with_new_events(self):
+        """
+        Test that the poller's first check wakes every local stream, and
+        later checks only those of users with new events.
+        """
+        other = User.objects.create_user(username='other', password='12345')
+        notifier = Notifier()
+        notifier.subscribed = lambda: {self.user.id, other.id}
+        notifier.notify = Mock()
+        poller = Poller(notifier)
+
+        with self.assertNumQueries(1):
+            poller.check()
+        self.assertEqual(
+            {call.args[0] for call in notifier.notify.call_args_list},
+            {self.user.id, other.id}
+        )
+
+        notifier.notify.reset_mock()
+        poller.check()
+        notifier.notify.assert_not_called()
+
+        publish(self.user.id, StreamEvent.Kinds.SPRITE, {'id': 1})
+        with self.assertNumQueries(1):
+            poller.check()
+        notifier.notify.assert_called_once_with(self.user.id)
+
+    def test_feed_publishes_sprite_event(self):
+        """
+        Test that feeding a sprite records an event for the owner's stream.
+        """
+        self.user.profile.tokens = 10
+        self.user.profile.save()
+        self.client.post(f'/dashboard/sprite/{self.sprite.id}/feed/')
+        event = StreamEvent.objects.get(user=self.user)
+        self.assertEqual(event.kind, StreamEvent.Kinds.SPRITE)
+        self.assertEqual(event.data, {'id': self.sprite.id})
+
+    def test_update_for_unfostered_animal_is_not_published(self):
+        """
+        Test that updates for animals without a fosterer are not published.
+        """
+        self.animal.fosterer = None
+        self.animal.save()
+        Update.objects.create(animal=self.animal, text='No one is watching')
+        self.assertFalse(StreamEvent.objects.exists())
+
+    async def test_event_stream_view(self):
+        """
+        Test that the view responds with an event stream.
+        """
+        await self.async_client.alogin(username='testuser', password='12345')
+        response = await self.async_client.get('/dashboard/events/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.assertEqual(response['Cache-Control'], 'no-cache')
+        message = await anext(aiter(response.streaming_content))
+        self.assertIn(b'event: sprite', message)
+
+
 class FeedSpriteTestCase(TestCase):
     """
     Test suite for the 'feed sprite' functionality, which increases a sprite's
@@ -437,8 +736,8 @@ class FeedSpriteTestCase(TestCase):
 
         # Check if the tokens were deducted
         self.user.profile.refresh_from_db()
-        self.assertEqual(self.user.profile.tokens, 99)
-        self.assertEqual(response_data['tokens'], self.user.profile.tokens)
+        self.assertEqual(self.user.profile.balance, 99)
+        self.assertEqual(response_data['tokens'], self.user.profile.balance)
 
     def test_sufficient_tokens(self):
         """
@@ -466,6 +765,72 @@ class FeedSpriteTestCase(TestCase):
         self.assertEqual(self.sprite.satiation, 100)
         self.assertEqual(response_data['satiation'], 100)
 
+    def test_feed_sprite_with_count(self):
+        """
+        Test that several feeds can be bought in one request.
+        """
+        response = self.client.post(self.url, {'count': 4})
+        self.assertEqual(response.status_code, 200)
+        response_data = response.json()
+        self.assertEqual(response_data['satiation'], 70)
+        self.assertEqual(response_data['tokens'], 96)
+        self.assertEqual(response_data['current_state'], 'RUNNING')
+
+        self.sprite.refresh_from_db()
+        self.user.profile.refresh_from_db()
+        self.assertEqual(self.sprite.satiation, 70)
+        self.assertEqual(self.user.profile.balance, 96)
+
+    def test_feed_sprite_count_over_balance(self):
+        """
+        Test that nothing changes when the balance does not cover every feed.
+        """
+        self.user.profile.tokens = 2
+        self.user.profile.save()
+        response = self.client.post(self.url, {'count': 3})
+        self.assertEqual(response.status_code, 400)
+
+        self.sprite.refresh_from_db()
+        self.user.profile.refresh_from_db()
+        self.assertEqual(self.sprite.satiation, 50)
+        self.assertEqual(self.user.profile.balance, 2)
+
+    def test_feed_sprite_invalid_count(self):
+        """
+        Test that invalid feed counts are rejected.
+        """
+        for count in ('0', '-1', 'many', '1000'):
+            response = self.client.post(self.url, {'count': count})
+            self.assertEqual(response.status_code, 400)
+        self.user.profile.refresh_from_db()
+        self.assertEqual(self.user.profile.balance, 100)
+
+    def test_feed_sprite_decays_before_feeding(self):
+        """
+        Test that feeding applies the decay since the sprite was last checked
+        before adding the food.
+        """
+        Sprite.objects.filter(id=self.sprite.id).update(
+            last_checked=timezone.now() - timezone.timedelta(minutes=20)
+        )
+        response = self.client.post(self.url)
+        self.assertEqual(response.json()['satiation'], 35)
+        self.sprite.refresh_from_db()
+        self.assertEqual(self.sprite.satiation, 35)
+        self.assertEqual(self.sprite.current_state, Sprite.States.STANDING)
+
+    def test_feed_with_stale_instance(self):
+        """
+        Test that a feed from an instance read before a concurrent feed
+        retries against the new anchor instead of overwriting it.
+        """
+        stale = Sprite.objects.get(id=self.sprite.id)
+        self.sprite.feed(2)
+        self.assertTrue(stale.feed(1))
+        self.assertEqual(stale.satiation, 65)
+        self.sprite.refresh_from_db()
+        self.assertEqual(self.sprite.satiation, 65)
+
 
 # Models
 class SpriteModelTests(TestCase):
@@ -643,7 +1008,9 @@ class SpriteModelTests(TestCase):
     def test_update_status_resets_state_timers(self):
         """
         Test that time_standing and time_running are reset when a new day
-        starts.
+        starts, and that today's minutes are credited to the state the sprite
+        was actually in. A sprite left at 50 satiation a day ago has been
+        standing since shortly after it was last checked.
         """
         now = timezone.now()
 
@@ -667,5 +1034,236 @@ class SpriteModelTests(TestCase):
 
         sprite.update_status()
 
-        self.assertEqual(sprite.time_standing, 0)
-        self.assertEqual(sprite.time_running, mins_passed)
+        self.assertEqual(sprite.time_standing, mins_passed)
+        self.assertEqual(sprite.time_running, 0)
+        self.assertEqual(sprite.current_state, Sprite.States.STANDING)
+
+    def test_update_status_does_not_save(self):
+        """
+        Test that bringing the status up to date does not write to the
+        database.
+        """
+        sprite = Sprite.objects.create(
+            user=self.user,
+            animal=self.animal,
+            satiation=80,
+        )
+        Sprite.objects.filter(id=sprite.id).update(
+            last_checked=timezone.now() - timezone.timedelta(minutes=10)
+        )
+        sprite.refresh_from_db()
+
+        with self.assertNumQueries(0):
+            sprite.update_status()
+
+        self.assertEqual(sprite.satiation, 70)
+        sprite.refresh_from_db()
+        self.assertEqual(sprite.satiation, 80)
+
+    def test_update_status_over_several_days(self):
+        """
+        Test that a gap of more than a day decays satiation by every elapsed
+        minute instead of only the minutes within the last day.
+        """
+        sprite = Sprite.objects.create(
+            user=self.user,
+            animal=self.animal,
+            satiation=100,
+        )
+        Sprite.objects.filter(id=sprite.id).update(
+            last_checked=timezone.now() - timezone.timedelta(days=2, minutes=1)
+        )
+        sprite.refresh_from_db()
+
+        sprite.update_status()
+        self.assertEqual(sprite.satiation, 0)
+        self.assertEqual(sprite.time_running, 0)
+
+
+class ComputeStatusTests(TestCase):
+    """
+    Test suite for the closed-form status computation used by the Sprite
+    model.
+    """
+    def setUp(self):
+        """
+        Set up a fixed anchor in the middle of a day.
+        """
+        self.anchor = timezone.now().replace(
+            year=2024, month=10, day=1, hour=12, minute=0, second=0,
+            microsecond=0
+            )
+
+    def test_same_day_accumulates_counters(self):
+        """
+        Test that minutes are split between running and standing according to
+        the satiation trajectory, and added to the stored counters.
+        """
+        status = compute_status(
+            55, 3, 7, self.anchor,
+            self.anchor + timezone.timedelta(minutes=10, seconds=30)
+            )
+        self.assertEqual(status['satiation'], 45)
+        self.assertEqual(status['current_state'], 'STANDING')
+        # Running for minutes 0-5 while satiation >= 50, standing for 6-9
+        self.assertEqual(status['time_running'], 7 + 6)
+        self.assertEqual(status['time_standing'], 3 + 4)
+
+    def test_partial_minutes_are_kept(self):
+        """
+        Test that the returned anchor only moves by whole minutes.
+        """
+        status = compute_status(
+            60, 0, 0, self.anchor,
+            self.anchor + timezone.timedelta(minutes=2, seconds=59)
+            )
+        self.assertEqual(
+            status['last_checked'],
+            self.anchor + timezone.timedelta(minutes=2)
+            )
+
+    def test_new_day_counts_from_midnight(self):
+        """
+        Test that counters restart at midnight and only count today's minutes.
+        """
+        now = self.anchor + timezone.timedelta(hours=13)
+        status = compute_status(100, 30, 20, self.anchor, now)
+        self.assertEqual(status['time_running'], 0)
+        self.assertEqual(status['time_standing'], 60)
+        self.assertEqual(status['satiation'], 0)
+
+    def test_running_across_midnight(self):
+        """
+        Test that running minutes after midnight are credited to the new day.
+        """
+        anchor = self.anchor.replace(hour=23, minute=50)
+        now = anchor + timezone.timedelta(minutes=30)
+        status = compute_status(100, 30, 20, anchor, now)
+        self.assertEqual(status['time_running'], 20)
+        self.assertEqual(status['time_standing'], 0)
+        self.assertEqual(status['current_state'], 'RUNNING')
+
+
+# Simulation
+class SimulationTests(TestCase):
+    """
+    Test suite for the vectorised bulk sprite simulation and its management
+    command.
+    """
+    def setUp(self):
+        """
+        Set up the test environment by creating a user, shelter, animal and
+        a few sprites last checked at different times.
+        """
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='12345'
+            )
+        self.shelter = Shelter.objects.create(
+            admin=self.user,
+            name="Test Shelter",
+            registration_number="123456789",
+            description="A test shelter"
+            )
+        self.animal = Animal.objects.create(
+            shelter=self.shelter,
+            name="Test Animal",
+            species="Dog",
+            age=4,
+            description="A friendly dog",
+            adoption_status='available'
+        )
+        self.now = timezone.now()
+        self.sprites = []
+        for satiation, minutes in ((100, 0), (55, 10), (80, 3000)):
+            sprite = Sprite.objects.create(
+                user=self.user,
+                animal=self.animal,
+                satiation=satiation,
+                time_standing=5,
+                time_running=5,
+            )
+            Sprite.objects.filter(id=sprite.id).update(
+                last_checked=self.now - timezone.timedelta(minutes=minutes)
+            )
+            sprite.refresh_from_db()
+            self.sprites.append(sprite)
+
+    def test_advance_arrays_matches_compute_status(self):
+        """
+        Test that the vectorised computation gives the same result as the
+        per-sprite computation across day boundaries.
+        """
+        rng = np.random.default_rng(1)
+        satiation = rng.integers(0, 101, 500)
+        standing = rng.integers(0, 100, 500)
+        running = rng.integers(0, 100, 500)
+        offsets = rng.integers(0, 4 * 24 * 60 * 60 * 10 ** 6, 500)
+        now_us = to_microseconds(self.now)
+
+        result = advance_arrays(
+            satiation, standing, running, now_us - offsets, now_us
+            )
+
+        for i in range(500):
+            expected = compute_status(
+                int(satiation[i]),
+                int(standing[i]),
+                int(running[i]),
+                self.now - timezone.timedelta(microseconds=int(offsets[i])),
+                self.now,
+            )
+            for field in expected:
+                if field == 'last_checked':
+                    value = self.now + timezone.timedelta(
+                        microseconds=int(result[field][i]) - now_us
+                        )
+                else:
+                    value = result[field][i]
+                self.assertEqual(value, expected[field])
+
+    def test_advance_sprites(self):
+        """
+        Test that advancing stores every sprite's current status and skips
+        sprites that are already up to date.
+        """
+        expected = [sprite.status(self.now) for sprite in self.sprites]
+        updated = advance_sprites(now=self.now, chunk_size=2)
+        self.assertEqual(updated, 3)
+        self.assertEqual(advance_sprites(now=self.now, chunk_size=2), 0)
+
+        for sprite, status in zip(self.sprites, expected):
+            sprite.refresh_from_db()
+            for field, value in status.items():
+                self.assertEqual(getattr(sprite, field), value)
+
+    def test_concurrent_feed_not_overwritten(self):
+        """
+        Test that a feed committed between reading a chunk and writing it
+        back is kept, and the fed sprite is left for the next run.
+        """
+        fed = self.sprites[1]
+        write_back = simulation.write_back
+
+        def feed_then_write(rows):
+            Sprite.objects.get(id=fed.id).feed(now=self.now)
+            return write_back(rows)
+
+        with patch('dashboard.simulation.write_back', feed_then_write):
+            updated = advance_sprites(now=self.now, chunk_size=10)
+
+        self.assertEqual(updated, 2)
+        fed.refresh_from_db()
+        self.assertEqual(fed.satiation, 45 + FEED_AMOUNT)
+        self.assertEqual(fed.last_checked, self.now)
+
+    def test_advance_sprites_command(self):
+        """
+        Test that the management command advances the sprites and reports
+        how many were updated.
+        """
+        out = StringIO()
+        call_command('advance_sprites', '--chunk-size', '2', stdout=out)
+        self.assertIn('Advanced 3 sprites', out.getvalue())
+        self.sprites[1].refresh_from_db()
+        self.assertEqual(self.sprites[1].satiation, 45)
@@ -12,6 +12,12 @@ urlpatterns = [
       views.update_status,
       name='update_status'
       ),
+    path(
+      'sprites/status/',
+      views.sprites_status,
+      name='sprites_status'
+      ),
+    path('events/', views.event_stream, name='event_stream'),
     path(
       'sprite/<int:sprite_id>/feed/',
       views.feed_sprite,
@@ -1,28 +1,50 @@
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
+from django.db import transaction
+from django.utils import timezone
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from .forms import SpriteForm
-from .models import Sprite
+from .events import publish, stream
+from .models import Sprite, StreamEvent
 from animals.models import Animal
 from profiles.models import Profile
 
 
+# Upper limit on the number of feeds a single request can buy
+MAX_FEEDS = 20
+
+
+def status_payload(sprites):
+    """
+    Returns the current status of each sprite, keyed by sprite ID, in the
+    shape returned by the status endpoints.
+
+    Statuses are computed in memory, so building the payload costs no queries
+    beyond evaluating `sprites` itself.
+    """
+    now = timezone.now()
+    return {str(sprite.id): sprite.status_data(now) for sprite in sprites}
+
+
 @login_required
 def dashboard(request):
     """
     Display the user's dashboard with their profile and sprites.
     Also handles messages related to payment status (success or cancel).
     """
-    if request.user.profile.role == 'shelter_admin':
+    profile = request.identity.profile
+    if profile.role == 'shelter_admin':
         messages.warning(request, "The dashboard is not available for admins")
         return redirect('home')
 
-    profile = Profile.objects.get(user=request.user)
-    sprites = Sprite.objects.filter(user=request.user)
+    sprites = Sprite.objects.filter(user=request.user).select_related(
+        'animal'
+        )
     context = {
         'profile': profile,
-        'sprites': sprites
+        'sprites': sprites,
+        'sprite_status': status_payload(sprites),
     }
 
     # If redirected from checkout session
@@ -45,9 +67,8 @@ def select_sprite(request, id):
     the animal's status.
     """
     animal = get_object_or_404(Animal, id=id)
-    if request.user.profile.role == 'shelter_admin' or (
-        animal.fosterer == request.user.profile
-    ):
+    profile = request.identity.profile
+    if profile.role == 'shelter_admin' or animal.fosterer_id == profile.id:
         messages.warning(request, "You cannot foster this animal")
         return redirect('view_animals')
 
@@ -64,7 +85,7 @@ def select_sprite(request, id):
             sprite.url = f'{breed_choice}/{colour_choice}'
             sprite.save()
 
-            animal.fosterer = request.user.profile
+            animal.fosterer = profile
             animal.adoption_status = 'Fostered'
             animal.save()
 
@@ -109,10 +130,10 @@ def delete_sprite(request, id):
 
 def update_status(request, sprite_id):
     """
-    View to update the status of a sprite and return its current stats as JSON.
-    Retrieves the sprite by its ID, updates its status, and returns a JSON
-    response with the updated satiation, current state, time standing, and time
-    running.
+    View to return the current status of a sprite as JSON.
+    Retrieves the sprite by its ID, brings its status up to date in memory
+    and returns a JSON response with the satiation, current state, time
+    standing, and time running. Nothing is saved, so polling never writes.
     """
     sprite = get_object_or_404(Sprite, id=sprite_id)
     sprite.update_status()
@@ -124,33 +145,89 @@ def update_status(request, sprite_id):
     })
 
 
-def feed_sprite(request, sprite_id):
+@login_required
+def sprites_status(request):
     """
-    View to feed a sprite. Deducts 1 token from the user's profile if they have
-    enough tokens, increases the sprite's satiation by 5 (capped at 100), and
-    returns a JSON response with the updated satiation and token count. Returns
-    an error if the user has insufficient tokens.
+    View to return the current status of all of the user's sprites as JSON.
+    Loads every sprite in a single query so the dashboard can refresh all of
+    its canvases with one request instead of one request per sprite.
     """
-    sprite = get_object_or_404(Sprite, id=sprite_id)
-    profile = request.user.profile
+    sprites = Sprite.objects.filter(user=request.user).only(
+        'id', 'satiation', 'time_standing', 'time_running', 'last_checked'
+        )
+    return JsonResponse({'sprites': status_payload(sprites)})
 
-    token_cost = 1
 
-    # Check if the user has enough tokens
-    if profile.tokens < token_cost:
+@login_required
+async def event_stream(request):
+    """
+    Async view that streams the user's sprite statuses and new updates for
+    their fostered animals as Server-Sent Events.
+
+    Meant to be served by an ASGI worker, where an idle connection costs a
+    coroutine rather than a whole worker, though it still holds a database
+    connection until the client disconnects. Clients reconnecting with a
+    Last-Event-ID header resume after the last event they received.
+    """
+    user = await request.auser()
+    last_event_id = request.headers.get('Last-Event-ID')
+    if last_event_id is not None and not last_event_id.isdigit():
+        last_event_id = None
+
+    response = StreamingHttpResponse(
+        stream(user.id, last_event_id and int(last_event_id)),
+        content_type='text/event-stream'
+    )
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def feed_sprite(request, sprite_id):
+    """
+    View to feed a sprite one or more times. The number of feeds is read from
+    the optional 'count' POST field, so several clicks cost one request.
+
+    Deducts 1 token per feed from the user's profile if they have enough
+    tokens, increases the sprite's satiation by 5 per feed (capped at 100),
+    and returns a JSON response with the sprite's fresh status and token
+    count. Both changes are conditional UPDATEs in one transaction, so double
+    clicks and concurrent tabs cannot lose or overdraw anything. Returns an
+    error if the user has insufficient tokens.
+    """
+    try:
+        count = int(request.POST.get('count', 1))
+    except ValueError:
+        count = 0
+    if not 1 <= count <= MAX_FEEDS:
         return JsonResponse({
             'success': False,
-            'error': 'Not enough tokens to feed the sprite.'
+            'error': 'Invalid number of feeds.'
         }, status=400)
 
-    profile.tokens -= token_cost
-    profile.save()
-
-    sprite.satiation = min(sprite.satiation + 5, 100)
-    sprite.save()
+    sprite = get_object_or_404(Sprite, id=sprite_id)
+    token_cost = 1 * count
+    now = timezone.now()
+
+    with transaction.atomic():
+        tokens = Profile.spend_tokens(request.user.id, token_cost)
+        if tokens is None:
+            return JsonResponse({
+                'success': False,
+                'error': 'Not enough tokens to feed the sprite.'
+            }, status=400)
+
+        if not sprite.feed(count, now):
+            transaction.set_rollback(True)
+            return JsonResponse({
+                'success': False,
+                'error': 'The sprite is busy. Please try again.'
+            }, status=409)
+
+        publish(sprite.user_id, StreamEvent.Kinds.SPRITE, {'id': sprite.id})
 
     return JsonResponse({
         'success': True,
-        'satiation': sprite.satiation,
-        'tokens': profile.tokens
+        **sprite.status_data(now),
+        'tokens': tokens
     })
@@ -0,0 +1,27 @@
+from django.contrib import admin
+from django.utils import timezone
+from .models import Job
+
+
+class JobAdmin(admin.ModelAdmin):
+    """
+    Job admin display options.
+    Failed jobs can be queued again with the retry action.
+    """
+    list_display = ('name', 'status', 'attempts', 'run_at', 'created_at')
+    list_filter = ('status', 'name')
+    actions = ['retry_jobs']
+
+    @admin.action(description="Retry selected jobs")
+    def retry_jobs(self, request, queryset):
+        """
+        Queues the selected failed jobs to run again straight away.
+        """
+        queryset.filter(status=Job.Statuses.FAILED).update(
+            status=Job.Statuses.PENDING,
+            attempts=0,
+            run_at=timezone.now()
+        )
+
+
+admin.site.register(Job, JobAdmin)
@@ -0,0 +1,10 @@
+from django.apps import AppConfig
+
+
+class JobsConfig(AppConfig):
+    """
+    App configuration for the 'jobs' app, which runs slow side effects in a
+    background worker instead of inside the request.
+    """
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'jobs'
@@ -0,0 +1,243 @@
+import base64
+import logging
+from datetime import timedelta
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.core.mail.backends.base import BaseEmailBackend
+from django.db import transaction
+from django.db.models import Avg, Count, F, Max
+from django.utils import timezone
+from metrics.tracing import span
+from .models import OutgoingEmail
+from .queue import job
+
+
+logger = logging.getLogger(__name__)
+
+# Backend used by the worker to actually deliver queued mail
+DEFAULT_DELIVERY_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
+# Number of messages sent over one connection
+BATCH_SIZE = 50
+# Attempts after which a message that keeps failing is left unsent
+MAX_ATTEMPTS = 5
+# How long sent messages are kept for the latency metrics
+RETENTION = timedelta(days=1)
+
+
+def message_to_dict(message):
+    """
+    Returns the JSON-serialisable fields of an EmailMessage. Attachment
+    content is stored base64 encoded.
+    """
+    return {
+        'subject': message.subject,
+        'body': message.body,
+        'from_email': message.from_email,
+        'to': message.to,
+        'cc': message.cc,
+        'bcc': message.bcc,
+        'reply_to': message.reply_to,
+        'headers': message.extra_headers,
+        'content_subtype': message.content_subtype,
+        'alternatives': [
+            [content, mimetype]
+            for content, mimetype in getattr(message, 'alternatives', [])
+        ],
+        'attachments': [
+            [
+                filename,
+                base64.b64encode(
+                    content.encode() if isinstance(content, str) else content
+                ).decode(),
+                mimetype,
+            ]
+            for filename, content, mimetype in message.attachments
+        ],
+    }
+
+
+def message_from_dict(data):
+    """
+    Rebuilds the EmailMessage stored by message_to_dict.
+    """
+    message = EmailMultiAlternatives(
+        subject=data['subject'],
+        body=data['body'],
+        from_email=data['from_email'],
+        to=data['to'],
+        cc=data['cc'],
+        bcc=data['bcc'],
+        reply_to=data['reply_to'],
+        headers=data['headers'],
+        alternatives=[tuple(a) for a in data['alternatives']],
+    )
+    message.content_subtype = data['content_subtype']
+    for filename, content, mimetype in data['attachments']:
+        message.attach(filename, base64.b64decode(content), mimetype)
+    return message
+
+
+def can_queue(message):
+    """
+    Returns whether every attachment of a message can be stored. Prebuilt
+    MIME attachments cannot and are sent straight away instead.
+    """
+    return all(isinstance(a, tuple) for a in message.attachments)
+
+
+class QueuedEmailBackend(BaseEmailBackend):
+    """
+    Email backend that stores messages and returns at once, leaving delivery
+    to the background worker.
+
+    Signup and verification mail therefore no longer hold the request open
+    for the SMTP handshake. Messages are written in the caller's transaction
+    and sent by the deliver_queued_mail job through the backend named in
+    settings.QUEUED_EMAIL_BACKEND.
+    """
+    def send_messages(self, email_messages):
+        """
+        Queues the messages and returns how many were accepted.
+        """
+        queued = [
+            m for m in email_messages
+            if m.recipients() and can_queue(m)
+        ]
+        direct = [
+            m for m in email_messages
+            if m.recipients() and not can_queue(m)
+        ]
+
+        sent = 0
+        if direct:
+            sent += delivery_connection(self.fail_silently).send_messages(
+                direct
+            ) or 0
+        if queued:
+            OutgoingEmail.objects.bulk_create([
+                OutgoingEmail(message=message_to_dict(m)) for m in queued
+            ])
+            deliver_queued_mail.enqueue()
+            sent += len(queued)
+        return sent
+
+
+def delivery_connection(fail_silently=False):
+    """
+    Returns a connection to the backend that delivers queued mail.
+    """
+    return get_connection(
+        getattr(settings, 'QUEUED_EMAIL_BACKEND', DEFAULT_DELIVERY_BACKEND),
+        fail_silently=fail_silently
+    )
+
+
+def deliver_batch(batch_size=BATCH_SIZE, after=0):
+    """
+    Sends one batch of queued messages with IDs above `after` over a single
+    connection. Returns the number sent and the ID of the last message
+    tried, or (0, None) if none were pending.
+
+    Each message is marked sent as soon as the server accepts it. A message
+    that fails has its attempts counted and the rest of the batch is still
+    sent, reconnecting first in case the failure dropped the connection. A
+    message that fails MAX_ATTEMPTS times stops being picked up, so a bad
+    address cannot hold up the rest of the queue. Only failing to reach the
+    server at all stops the batch, after committing what was sent. Rows are
+    claimed with SKIP LOCKED so several workers can share the queue.
+    """
+    with transaction.atomic():
+        pending = list(
+            OutgoingEmail.objects.select_for_update(skip_locked=True)
+            .filter(
+                sent_at__isnull=True,
+                attempts__lt=MAX_ATTEMPTS,
+                id__gt=after
+            )
+            .order_by('id')[:batch_size]
+        )
+        if not pending:
+            return 0, None
+
+        sent = 0
+        error = None
+        connection = delivery_connection()
+        try:
+            connection.open()
+            for queued in pending:
+                try:
+                    with span('smtp.send', 'client', {
+                        'email.id': queued.id,
+                    }):
+                        connection.send_messages(
+                            [message_from_dict(queued.message)]
+                        )
+                except Exception:
+                    logger.exception(
+                        "Failed to deliver queued email %s", queued.id
+                    )
+                    OutgoingEmail.objects.filter(id=queued.id).update(
+                        attempts=F('attempts') + 1
+                    )
+                    connection.close()
+                    connection.open()
+                    continue
+                OutgoingEmail.objects.filter(id=queued.id).update(
+                    sent_at=timezone.now()
+                )
+                sent += 1
+        except Exception as e:
+            # Commit the messages already sent before reporting the failure
+            error = e
+        finally:
+            try:
+                connection.close()
+            except Exception:
+                pass
+
+    if error is not None:
+        raise error
+    return sent, pending[-1].id
+
+
+@job
+def deliver_queued_mail():
+    """
+    Delivers queued mail batch by batch until the queue is empty, then
+    prunes sent messages older than RETENTION. Each message is tried at most
+    once per run, so one that fails is retried by a later run rather than
+    straight away.
+    """
+    after = 0
+    while after is not None:
+        _, after = deliver_batch(after=after)
+    OutgoingEmail.objects.filter(
+        sent_at__lt=timezone.now() - RETENTION
+    ).delete()
+
+
+def mail_metrics(window=timedelta(hours=1)):
+    """
+    Returns the number of queued messages not yet sent, including any given
+    up on after MAX_ATTEMPTS, and the count, average and maximum delivery
+    latency in seconds of messages sent within `window`.
+    """
+    sent = OutgoingEmail.objects.filter(
+        sent_at__gte=timezone.now() - window
+    ).aggregate(
+        count=Count('id'),
+        average=Avg(F('sent_at') - F('created_at')),
+        maximum=Max(F('sent_at') - F('created_at')),
+    )
+    return {
+        'queue_depth': OutgoingEmail.objects.filter(
+            sent_at__isnull=True
+        ).count(),
+        'sent': sent['count'],
+        'latency_avg_seconds': (
+            sent['average'].total_seconds() if sent['average'] else None
+        ),
+        'latency_max_seconds': (
+            sent['maximum'].total_seconds() if sent['maximum'] else None
+        ),
+    }
@@ -0,0 +1,75 @@
+import threading
+from django.core.management.base import BaseCommand
+from django.db import connection
+from jobs.queue import run_pending
+
+
+class Command(BaseCommand):
+    """
+    Management command that runs queued background jobs, either once or
+    continuously as a worker process.
+    """
+    help = "Run queued background jobs"
+
+    def add_arguments(self, parser):
+        """
+        Adds the concurrency, polling interval and run-once options.
+        """
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=1,
+            help="Number of jobs run at the same time"
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=1,
+            help="Seconds to wait between checks when there is nothing to do"
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help="Run the jobs that are due and exit"
+        )
+
+    def handle(self, *args, **options):
+        """
+        Runs the worker loop in this thread, or in one thread per unit of
+        concurrency. Extra threads claim jobs on their own database
+        connections.
+        """
+        stop = threading.Event()
+        counts = []
+
+        def work():
+            ran = 0
+            while not stop.is_set():
+                ran += run_pending()
+                if options['once']:
+                    break
+                stop.wait(options['interval'])
+            counts.append(ran)
+
+        def work_in_thread():
+            try:
+                work()
+            finally:
+                connection.close()
+
+        try:
+            if options['concurrency'] <= 1:
+                work()
+            else:
+                threads = [
+                    threading.Thread(target=work_in_thread, daemon=True)
+                    for _ in range(options['concurrency'])
+                ]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+        except KeyboardInterrupt:
+            stop.set()
+
+        self.stdout.write(f"Ran {sum(counts)} jobs")
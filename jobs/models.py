@@ -0,0 +1,68 @@
+from django.db import models
+from django.utils import timezone
+
+
+class Job(models.Model):
+    """
+    A queued call to a function decorated with jobs.job.
+
+    `name` is the function's dotted import path and `args`/`kwargs` its JSON
+    arguments. Pending jobs become due at `run_at`; a failed attempt pushes
+    `run_at` back until `max_attempts` is reached, after which the job is
+    kept as FAILED with the last traceback in `last_error`. Jobs that finish
+    are deleted.
+    """
+    class Statuses(models.TextChoices):
+        PENDING = 'pending', 'Pending'
+        RUNNING = 'running', 'Running'
+        FAILED = 'failed', 'Failed'
+
+    name = models.CharField(max_length=255)
+    args = models.JSONField(default=list, blank=True)
+    kwargs = models.JSONField(default=dict, blank=True)
+    status = models.CharField(
+        max_length=10,
+        choices=Statuses.choices,
+        default=Statuses.PENDING
+    )
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_at = models.DateTimeField(default=timezone.now)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_at'])
+        ]
+
+    def __str__(self):
+        return f"{self.name} ({self.get_status_display()})"
+
+
+class OutgoingEmail(models.Model):
+    """
+    An email accepted by jobs.mail.QueuedEmailBackend and waiting for, or
+    already through, delivery by the background worker.
+
+    `message` holds the fields needed to rebuild the EmailMessage. Sent rows
+    keep `sent_at` for a while so delivery latency can be measured.
+    """
+    message = models.JSONField()
+    attempts = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(default=timezone.now)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['id'],
+                name='outgoing_email_pending_idx',
+                condition=models.Q(sent_at__isnull=True)
+            ),
+            models.Index(fields=['sent_at'])
+        ]
+
+    def __str__(self):
+        return self.message.get('subject', '')
@@ -0,0 +1,155 @@
+import logging
+import traceback
+from datetime import timedelta
+from functools import wraps
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from metrics.tracing import start_span, traced_queries
+from .models import Job
+
+
+logger = logging.getLogger(__name__)
+
+# Seconds before the first retry; each later retry waits twice as long
+RETRY_DELAY = 10
+# Longest wait between retries
+MAX_RETRY_DELAY = 60 * 60
+# A running job whose worker has not finished it within this time is assumed
+# to have died with the worker and is claimed again
+LOCK_TIMEOUT = timedelta(minutes=10)
+
+
+def job(func=None, *, max_attempts=5):
+    """
+    Decorator that lets a function be run by the background worker.
+
+    The function is returned unchanged, so it can still be called directly,
+    and gains an `enqueue(*args, **kwargs)` method that records the call as a
+    Job row and returns it. Arguments must be JSON serialisable, so pass
+    primary keys rather than model instances.
+
+    The row is written in the caller's transaction, so a job enqueued from a
+    view or signal only becomes visible to the worker if that work commits.
+    """
+    def decorate(func):
+        name = f'{func.__module__}.{func.__qualname__}'
+
+        @wraps(func)
+        def enqueue(*args, **kwargs):
+            return Job.objects.create(
+                name=name,
+                args=list(args),
+                kwargs=kwargs,
+                max_attempts=max_attempts
+            )
+
+        func.job_name = name
+        func.enqueue = enqueue
+        return func
+
+    if func is None:
+        return decorate
+    return decorate(func)
+
+
+def retry_delay(attempts):
+    """
+    Returns how long to wait before the next attempt of a job that has failed
+    `attempts` times.
+    """
+    return timedelta(
+        seconds=min(RETRY_DELAY * 2 ** (attempts - 1), MAX_RETRY_DELAY)
+    )
+
+
+def claim_job(now=None):
+    """
+    Claims the next due job for this worker and returns it, or None if there
+    is nothing to do.
+
+    Candidates are read with SELECT ... FOR UPDATE SKIP LOCKED, so concurrent
+    workers on PostgreSQL never wait on each other's rows. The claim itself is
+    a conditional UPDATE on the status and lock time the candidate was read
+    with, which is what keeps two workers from taking the same job on
+    databases without row locks such as SQLite.
+    """
+    now = now or timezone.now()
+    due = Q(status=Job.Statuses.PENDING, run_at__lte=now) | Q(
+        status=Job.Statuses.RUNNING,
+        locked_at__lt=now - LOCK_TIMEOUT
+    )
+    with transaction.atomic():
+        candidates = (
+            Job.objects.select_for_update(skip_locked=True)
+            .filter(due)
+            .order_by('run_at', 'id')[:10]
+        )
+        for candidate in candidates:
+            claimed = Job.objects.filter(
+                id=candidate.id,
+                status=candidate.status,
+                locked_at=candidate.locked_at
+            ).update(
+                status=Job.Statuses.RUNNING,
+                locked_at=now,
+                attempts=candidate.attempts + 1
+            )
+            if claimed:
+                candidate.status = Job.Statuses.RUNNING
+                candidate.locked_at = now
+                candidate.attempts += 1
+                return candidate
+    return None
+
+
+def run_job(job):
+    """
+    Runs a claimed job. The row is deleted if the function returns, and
+    otherwise queued for a retry after a backoff or marked FAILED once its
+    attempts are used up. Returns True if the job succeeded.
+
+    The job runs in its own trace, so its queries, and the log line of a
+    failure, carry the job's trace ID.
+    """
+    with start_span(f'job {job.name}', 'consumer', {
+        'job.id': job.id,
+        'job.attempt': job.attempts,
+    }) as current, traced_queries():
+        try:
+            func = import_string(job.name)
+            if getattr(func, 'job_name', None) != job.name:
+                raise ImportError(f"{job.name} is not a registered job")
+            func(*job.args, **job.kwargs)
+        except Exception as exc:
+            current.record_exception(exc)
+            logger.exception("Job %s (%s) failed", job.id, job.name)
+            if job.attempts >= job.max_attempts:
+                status = Job.Statuses.FAILED
+                run_at = job.run_at
+            else:
+                status = Job.Statuses.PENDING
+                run_at = timezone.now() + retry_delay(job.attempts)
+            Job.objects.filter(id=job.id).update(
+                status=status,
+                run_at=run_at,
+                locked_at=None,
+                last_error=traceback.format_exc()
+            )
+            return False
+
+        Job.objects.filter(id=job.id).delete()
+        return True
+
+
+def run_pending():
+    """
+    Claims and runs due jobs until none are left, and returns the number of
+    jobs run, successful or not.
+    """
+    count = 0
+    while (claimed := claim_job()) is not None:
+        run_job(claimed)
+        count += 1
+    return count
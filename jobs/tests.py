@@ -0,0 +1,320 @@
+import socketserver
+import threading
+from datetime import timedelta
+from io import StringIO
+from django.core import mail
+from django.core.mail import EmailMultiAlternatives, send_mail, send_mass_mail
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from .mail import deliver_batch, mail_metrics
+from .models import Job, OutgoingEmail
+from .queue import claim_job, job, retry_delay, run_job, run_pending
+
+
+calls = []
+
+
+@job
+def record(value, extra=None):
+    """
+    Test job that records its arguments.
+    """
+    calls.append((value, extra))
+
+
+@job(max_attempts=2)
+def explode():
+    """
+    Test job that always fails.
+    """
+    raise ValueError("boom")
+
+
+def not_a_job():
+    """
+    Plain function the worker must refuse to run.
+    """
+    calls.append('not a job')
+
+
+class JobQueueTests(TestCase):
+    """
+    Test cases for enqueuing, claiming and running background jobs.
+    """
+    def setUp(self):
+        calls.clear()
+
+    def test_enqueue_records_call(self):
+        """
+        Test that enqueue stores the function path and arguments without
+        running the function.
+        """
+        queued = record.enqueue(1, extra='x')
+
+        self.assertEqual(queued.name, 'jobs.tests.record')
+        self.assertEqual(queued.args, [1])
+        self.assertEqual(queued.kwargs, {'extra': 'x'})
+        self.assertEqual(calls, [])
+
+    def test_run_pending_runs_and_deletes_jobs(self):
+        """
+        Test that due jobs are run in order and removed once they succeed.
+        """
+        record.enqueue(1)
+        record.enqueue(2, extra='y')
+
+        self.assertEqual(run_pending(), 2)
+        self.assertEqual(calls, [(1, None), (2, 'y')])
+        self.assertFalse(Job.objects.exists())
+
+    def test_future_jobs_not_claimed(self):
+        """
+        Test that a job is not claimed before its run_at.
+        """
+        queued = record.enqueue(1)
+        Job.objects.filter(id=queued.id).update(
+            run_at=timezone.now() + timedelta(minutes=1)
+        )
+
+        self.assertIsNone(claim_job())
+
+    def test_claimed_job_not_claimed_twice(self):
+        """
+        Test that a running job is not handed to another worker until its
+        lock times out.
+        """
+        record.enqueue(1)
+
+        first = claim_job()
+        self.assertEqual(first.status, Job.Statuses.RUNNING)
+        self.assertIsNone(claim_job())
+
+        later = timezone.now() + timedelta(hours=1)
+        self.assertEqual(claim_job(later).id, first.id)
+
+    def test_failed_job_retried_with_backoff(self):
+        """
+        Test that a failing job is rescheduled with a growing delay and
+        marked FAILED when its attempts run out.
+        """
+        explode.enqueue()
+
+        with self.assertLogs('jobs.queue', 'ERROR'):
+            self.assertFalse(run_job(claim_job()))
+        failed = Job.objects.get()
+        self.assertEqual(failed.status, Job.Statuses.PENDING)
+        self.assertEqual(failed.attempts, 1)
+        self.assertGreater(failed.run_at, timezone.now())
+        self.assertIn('boom', failed.last_error)
+
+        with self.assertLogs('jobs.queue', 'ERROR'):
+            self.assertFalse(run_job(claim_job(failed.run_at)))
+        failed.refresh_from_db()
+        self.assertEqual(failed.status, Job.Statuses.FAILED)
+        self.assertIsNone(claim_job(failed.run_at + timedelta(days=1)))
+
+        self.assertEqual(retry_delay(1), timedelta(seconds=10))
+        self.assertEqual(retry_delay(3), timedelta(seconds=40))
+        self.assertEqual(retry_delay(20), timedelta(hours=1))
+
+    def test_unregistered_function_not_run(self):
+        """
+        Test that the worker refuses to import and run a function that was
+        not decorated as a job.
+        """
+        Job.objects.create(name='jobs.tests.not_a_job', max_attempts=1)
+
+        with self.assertLogs('jobs.queue', 'ERROR'):
+            run_pending()
+
+        self.assertEqual(calls, [])
+        self.assertEqual(Job.objects.get().status, Job.Statuses.FAILED)
+
+    def test_runworker_command(self):
+        """
+        Test that runworker --once runs the due jobs and exits.
+        """
+        record.enqueue(1)
+        out = StringIO()
+
+        call_command('runworker', '--once', stdout=out)
+
+        self.assertEqual(calls, [(1, None)])
+        self.assertIn('Ran 1 jobs', out.getvalue())
+
+
+class SMTPStandIn(socketserver.ThreadingTCPServer):
+    """
+    Minimal local SMTP server that accepts every message and records the
+    connections and messages it received.
+    """
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), SMTPHandler)
+        self.connections = 0
+        self.messages = []
+        self.refuse = set()
+
+
+class SMTPHandler(socketserver.StreamRequestHandler):
+    """
+    Speaks just enough SMTP for Django's SMTP backend.
+    """
+    def reply(self, line):
+        self.wfile.write(line.encode() + b'\r\n')
+
+    def handle(self):
+        self.server.connections += 1
+        self.reply('220 localhost')
+        recipients = []
+        while line := self.rfile.readline():
+            command = line.decode().strip().upper()
+            if command.startswith('EHLO') or command.startswith('HELO'):
+                self.reply('250 localhost')
+            elif command.startswith('RCPT'):
+                address = command.split(':', 1)[1].strip('<> ').lower()
+                if address in self.server.refuse:
+                    self.reply('550 No such user')
+                else:
+                    recipients.append(address)
+                    self.reply('250 OK')
+            elif command == 'DATA':
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                data = b''
+                while (chunk := self.rfile.readline()) != b'.\r\n':
+                    data += chunk
+                self.server.messages.append((recipients, data))
+                recipients = []
+                self.reply('250 OK')
+            elif command == 'QUIT':
+                self.reply('221 Bye')
+                return
+            else:
+                self.reply('250 OK')
+
+
+@override_settings(
+    EMAIL_BACKEND='jobs.mail.QueuedEmailBackend',
+    QUEUED_EMAIL_BACKEND='django.core.mail.backends.smtp.EmailBackend',
+    EMAIL_HOST='127.0.0.1',
+    EMAIL_USE_TLS=False,
+    EMAIL_HOST_USER='',
+    EMAIL_HOST_PASSWORD='',
+)
+class QueuedEmailBackendTests(TestCase):
+    """
+    Test cases for the queued email backend, delivering through a local SMTP
+    stand-in.
+    """
+    def setUp(self):
+        self.server = SMTPStandIn()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        override = override_settings(EMAIL_PORT=self.server.server_address[1])
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def test_send_queues_without_connecting(self):
+        """
+        Test that sending mail only queues it and a delivery job.
+        """
+        send_mail('Hello', 'Body', 'from@example.com', ['to@example.com'])
+
+        self.assertEqual(self.server.connections, 0)
+        self.assertEqual(OutgoingEmail.objects.count(), 1)
+        self.assertTrue(
+            Job.objects.filter(name='jobs.mail.deliver_queued_mail').exists()
+        )
+        self.assertEqual(mail_metrics()['queue_depth'], 1)
+
+    def test_batch_delivered_over_one_connection(self):
+        """
+        Test that the worker delivers every queued message over a single
+        SMTP connection and records the latency.
+        """
+        for i in range(3):
+            send_mail(
+                f'Hello {i}', 'Body', 'from@example.com', [f'{i}@example.com']
+            )
+        message = EmailMultiAlternatives(
+            'Verify', 'Text', 'from@example.com', ['html@example.com']
+        )
+        message.attach_alternative('<p>HTML</p>', 'text/html')
+        message.attach('note.txt', 'attached', 'text/plain')
+        message.send()
+
+        run_pending()
+
+        self.assertEqual(self.server.connections, 1)
+        self.assertEqual(len(self.server.messages), 4)
+        recipients, data = self.server.messages[3]
+        self.assertEqual(recipients, ['html@example.com'])
+        self.assertIn(b'<p>HTML</p>', data)
+        self.assertIn(b'note.txt', data)
+
+        metrics = mail_metrics()
+        self.assertEqual(metrics['queue_depth'], 0)
+        self.assertEqual(metrics['sent'], 4)
+        self.assertGreaterEqual(metrics['latency_max_seconds'], 0)
+
+    def test_failed_message_does_not_block_batch(self):
+        """
+        Test that a message which fails is counted and skipped, the good
+        messages after it are still delivered, and the job succeeds.
+        """
+        self.server.refuse.add('bad@example.com')
+        send_mass_mail([
+            ('Bad', 'Body', 'from@example.com', ['bad@example.com']),
+            ('One', 'Body', 'from@example.com', ['one@example.com']),
+            ('Two', 'Body', 'from@example.com', ['two@example.com']),
+        ])
+
+        run_pending()
+
+        delivered = [recipients for recipients, _ in self.server.messages]
+        self.assertEqual(delivered, [['one@example.com'], ['two@example.com']])
+        self.assertFalse(Job.objects.exists())
+        bad = OutgoingEmail.objects.get(sent_at__isnull=True)
+        self.assertEqual(bad.attempts, 1)
+
+    def test_failing_message_given_up(self):
+        """
+        Test that a message failing MAX_ATTEMPTS times stops being picked
+        up, and messages sent before it are not sent again.
+        """
+        self.server.refuse.add('bad@example.com')
+        send_mail('One', 'Body', 'from@example.com', ['one@example.com'])
+        send_mail('Bad', 'Body', 'from@example.com', ['bad@example.com'])
+
+        self.assertEqual(deliver_batch()[0], 1)
+        for _ in range(4):
+            self.assertEqual(deliver_batch()[0], 0)
+        self.assertEqual(deliver_batch(), (0, None))
+
+        delivered = [recipients for recipients, _ in self.server.messages]
+        self.assertEqual(delivered, [['one@example.com']])
+        self.assertEqual(
+            OutgoingEmail.objects.get(sent_at__isnull=True).attempts, 5
+        )
+
+    def test_allauth_signup_mail_queued(self):
+        """
+        Test that the verification email sent on signup is queued rather
+        than sent during the request.
+        """
+        response = self.client.post('/accounts/signup/', {
+            'username': 'newuser',
+            'email': 'new@example.com',
+            'email2': 'new@example.com',
+            'password1': 'a-long-Passw0rd',
+            'password2': 'a-long-Passw0rd',
+        })
+
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.server.connections, 0)
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(OutgoingEmail.objects.count(), 1)
@@ -0,0 +1,10 @@
+from django.apps import AppConfig
+
+
+class MetricsConfig(AppConfig):
+    """
+    App configuration for the 'metrics' app, which records per-view request
+    figures and serves them to Prometheus.
+    """
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'metrics'
@@ -0,0 +1,46 @@
+import time
+from django.template import TemplateDoesNotExist
+from django.template.backends import django
+from .middleware import current_request
+from .tracing import span
+
+
+class Template(django.Template):
+    """
+    Template that adds its render time to the current request's figures
+    and renders in a span. Templates rendered while another is rendering,
+    such as form widgets, are counted as part of the outer one.
+    """
+    def render(self, context=None, request=None):
+        with span('template.render', attributes={
+            'template.name': self.template.name,
+        }):
+            return self.timed_render(context, request)
+
+    def timed_render(self, context, request):
+        figures = current_request.get()
+        if figures is None:
+            return super().render(context, request)
+        figures.rendering += 1
+        start = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            figures.rendering -= 1
+            if not figures.rendering:
+                figures.template_seconds += time.perf_counter() - start
+
+
+class DjangoTemplates(django.DjangoTemplates):
+    """
+    The Django template backend with render times recorded by the metrics
+    middleware.
+    """
+    def from_string(self, template_code):
+        return Template(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return Template(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            django.reraise(exc, self)
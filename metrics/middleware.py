@@ -0,0 +1,80 @@
+import time
+from contextvars import ContextVar
+from django.db import connection
+from .registry import recorder
+
+
+# Figures of the request being served, read by the template backend
+current_request = ContextVar('current_request', default=None)
+
+
+class RequestFigures:
+    """
+    Query and template render figures gathered while serving one request.
+    """
+    def __init__(self):
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.template_seconds = 0.0
+        self.rendering = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        """
+        Database execute wrapper timing each query.
+        """
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.query_seconds += time.perf_counter() - start
+
+
+def response_size(response):
+    """
+    Returns the size of a response body in bytes, or 0 for a streaming
+    response of unknown length.
+    """
+    if 'Content-Length' in response:
+        return int(response['Content-Length'])
+    if response.streaming:
+        return 0
+    return len(response.content)
+
+
+class MetricsMiddleware:
+    """
+    Middleware recording each request's latency, database queries, template
+    render time and response size against the name of the view it
+    resolved to. Should come first, so the latency covers every other
+    middleware.
+
+    Queries are counted on the default database connection of the thread
+    serving the request, so those made by async views are not included.
+    Streaming responses are timed until their first byte is ready.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        figures = RequestFigures()
+        token = current_request.set(figures)
+        start = time.perf_counter()
+        try:
+            with connection.execute_wrapper(figures):
+                response = self.get_response(request)
+        finally:
+            current_request.reset(token)
+        duration = time.perf_counter() - start
+
+        match = getattr(request, 'resolver_match', None)
+        recorder().record(
+            view=match.view_name if match else '<unresolved>',
+            status=response.status_code,
+            duration=duration,
+            queries=figures.queries,
+            query_seconds=figures.query_seconds,
+            template_seconds=figures.template_seconds,
+            response_bytes=response_size(response)
+        )
+        return response
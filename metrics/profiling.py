@@ -0,0 +1,228 @@
+import cProfile
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.urls import Resolver404, resolve
+
+
+# Names of profile files, as written by save()
+FILE_NAME = re.compile(r'^[\w.-]+\.(pstats|collapsed)$')
+
+
+class Sampler:
+    """
+    Statistical profiler that records the stack of one thread at a fixed
+    interval from a background thread.
+
+    The profiled code runs at full speed between samples, so the overhead
+    is low enough for production requests. Stacks are kept in the collapsed
+    format read by flame graph tools: frames from outermost to innermost,
+    joined by ';', with the number of samples.
+    """
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.stacks = Counter()
+        self.stopped = threading.Event()
+
+    def sample(self, thread_id):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(thread_id)
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                module = frame.f_globals.get('__name__', '?')
+                names.append(f'{module}:{code.co_name}')
+                frame = frame.f_back
+            if names:
+                self.stacks[';'.join(reversed(names))] += 1
+
+    def start(self):
+        """
+        Starts sampling the calling thread.
+        """
+        self.thread = threading.Thread(
+            target=self.sample,
+            args=(threading.get_ident(),),
+            name='profile-sampler',
+            daemon=True
+        )
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def runcall(self, func, *args, **kwargs):
+        self.start()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            self.stop()
+
+    def dump(self, path):
+        with open(path, 'w') as file:
+            for stack, count in self.stacks.items():
+                file.write(f'{stack} {count}\n')
+
+
+def profiles():
+    """
+    Returns the names of the profiles in the ring, newest first.
+    """
+    try:
+        names = [
+            name for name in os.listdir(settings.PROFILE_DIR)
+            if FILE_NAME.match(name)
+        ]
+    except FileNotFoundError:
+        return []
+    return sorted(names, reverse=True)
+
+
+def save(profiler, view_name, duration):
+    """
+    Writes a finished profile to the ring, named after the time, view and
+    duration in milliseconds, and deletes the oldest profiles beyond
+    PROFILE_RING_SIZE.
+    """
+    directory = settings.PROFILE_DIR
+    os.makedirs(directory, exist_ok=True)
+    deterministic = isinstance(profiler, cProfile.Profile)
+    now = time.time()
+    name = '{}.{:03d}-{}-{}ms-{}{}'.format(
+        time.strftime('%Y%m%dT%H%M%S', time.gmtime(now)),
+        int(now * 1000) % 1000,
+        re.sub(r'[^\w-]', '_', view_name),
+        round(duration * 1000),
+        os.getpid(),
+        '.pstats' if deterministic else '.collapsed'
+    )
+    temporary = os.path.join(directory, f'.{name}.tmp')
+    if deterministic:
+        profiler.dump_stats(temporary)
+    else:
+        profiler.dump(temporary)
+    os.replace(temporary, os.path.join(directory, name))
+
+    for old in profiles()[getattr(settings, 'PROFILE_RING_SIZE', 50):]:
+        try:
+            os.remove(os.path.join(directory, old))
+        except FileNotFoundError:
+            pass
+    return name
+
+
+def choose_profiler(request, view_name):
+    """
+    Returns a profiler for the request, or None if it is not to be
+    profiled.
+
+    Staff can profile any request by adding ?profile, which uses cProfile,
+    or ?profile=sample for the sampler. Requests to the URL names in
+    PROFILE_SAMPLE_RATES are profiled with the sampler at a rate of one in
+    the given number.
+    """
+    flag = request.GET.get('profile')
+    interval = getattr(settings, 'PROFILE_SAMPLE_INTERVAL', 0.005)
+    if flag is not None and request.user.is_staff:
+        if flag == 'sample':
+            return Sampler(interval)
+        return cProfile.Profile()
+    rate = getattr(settings, 'PROFILE_SAMPLE_RATES', {}).get(view_name)
+    if rate and random.randrange(rate) == 0:
+        return Sampler(interval)
+    return None
+
+
+# Held while cProfile runs. From Python 3.12 cProfile uses the process-wide
+# sys.monitoring, so only one profile can run at a time and it records
+# every thread's calls, not just the request's.
+_cprofile_lock = threading.Lock()
+
+
+def start_profiler(profiler):
+    """
+    Starts `profiler` on the calling thread and returns the profiler that
+    is running.
+
+    A cProfile run that cannot start, because another one or some other
+    profiling tool is active, falls back to the sampler, which only
+    watches the calling thread and can run alongside anything.
+    """
+    if isinstance(profiler, cProfile.Profile):
+        if _cprofile_lock.acquire(blocking=False):
+            try:
+                profiler.enable()
+                return profiler
+            except ValueError:
+                _cprofile_lock.release()
+        profiler = Sampler(
+            getattr(settings, 'PROFILE_SAMPLE_INTERVAL', 0.005)
+        )
+    profiler.start()
+    return profiler
+
+
+def stop_profiler(profiler):
+    """
+    Stops a profiler started by start_profiler().
+    """
+    if isinstance(profiler, cProfile.Profile):
+        profiler.disable()
+        _cprofile_lock.release()
+    else:
+        profiler.stop()
+
+
+def profiled_view_name(request):
+    """
+    Returns the URL name of the view a request will reach, or None if the
+    request cannot be profiled: its path does not resolve, or its view is
+    async. Nothing is resolved when there is no way for it to be profiled.
+    """
+    if 'profile' not in request.GET and not getattr(
+        settings, 'PROFILE_SAMPLE_RATES', {}
+    ):
+        return None
+    try:
+        match = resolve(
+            request.path_info, getattr(request, 'urlconf', None)
+        )
+    except Resolver404:
+        return None
+    if iscoroutinefunction(match.func):
+        return None
+    return match.view_name
+
+
+class ProfilingMiddleware:
+    """
+    Middleware that runs chosen requests under a profiler and keeps the
+    result in the profile ring. Should come last, so the profile covers
+    the view and the handling of its response or exception rather than
+    the other middleware.
+
+    An exception from the view is re-raised once its profile is saved.
+    Async views, such as the event stream, are never profiled.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        view_name = profiled_view_name(request)
+        profiler = view_name and choose_profiler(request, view_name)
+        if not profiler:
+            return self.get_response(request)
+        profiler = start_profiler(profiler)
+        start = time.perf_counter()
+        try:
+            return self.get_response(request)
+        finally:
+            stop_profiler(profiler)
+            save(profiler, view_name, time.perf_counter() - start)
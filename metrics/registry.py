@@ -0,0 +1,135 @@
+import glob
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from django.conf import settings
+
+
+# Upper bounds of the request latency histogram, in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# Upper bounds of the queries per request histogram
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+
+def empty_view():
+    """
+    Returns the recorded figures of a view that has not served a request.
+    The histograms hold one count per bucket plus one for +Inf, not yet
+    cumulative.
+    """
+    return {
+        'requests': {},
+        'duration': [0] * (len(LATENCY_BUCKETS) + 1),
+        'duration_sum': 0.0,
+        'queries': [0] * (len(QUERY_BUCKETS) + 1),
+        'queries_sum': 0,
+        'query_seconds': 0.0,
+        'template_seconds': 0.0,
+        'response_bytes': 0,
+    }
+
+
+def merge(total, view):
+    """
+    Adds the figures of `view` to `total`.
+    """
+    for status, count in view['requests'].items():
+        total['requests'][status] = total['requests'].get(status, 0) + count
+    for key in ('duration', 'queries'):
+        total[key] = [a + b for a, b in zip(total[key], view[key])]
+    for key in ('duration_sum', 'queries_sum', 'query_seconds',
+                'template_seconds', 'response_bytes'):
+        total[key] += view[key]
+
+
+class Recorder:
+    """
+    Per-process store of request figures, keyed by view name.
+
+    Requests are added in memory and written to a file of the process's own
+    in METRICS_DIR at most every METRICS_FLUSH_INTERVAL seconds, so the
+    numbers of every worker can be summed by whichever worker serves the
+    metrics endpoint. Files are never shared between processes, so no
+    locking between them is needed, and each is replaced atomically.
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        self.path = os.path.join(
+            directory, f'{os.getpid()}-{time.time_ns()}.json'
+        )
+        self.pid = os.getpid()
+        self.lock = threading.Lock()
+        self.views = {}
+        self.flushed_at = time.monotonic()
+
+    def record(self, view, status, duration, queries, query_seconds,
+               template_seconds, response_bytes):
+        with self.lock:
+            figures = self.views.setdefault(view, empty_view())
+            status = str(status)
+            figures['requests'][status] = (
+                figures['requests'].get(status, 0) + 1
+            )
+            figures['duration'][bisect_left(LATENCY_BUCKETS, duration)] += 1
+            figures['duration_sum'] += duration
+            figures['queries'][bisect_left(QUERY_BUCKETS, queries)] += 1
+            figures['queries_sum'] += queries
+            figures['query_seconds'] += query_seconds
+            figures['template_seconds'] += template_seconds
+            figures['response_bytes'] += response_bytes
+            due = (
+                time.monotonic() - self.flushed_at
+                >= getattr(settings, 'METRICS_FLUSH_INTERVAL', 5)
+            )
+        if due:
+            self.flush()
+
+    def flush(self):
+        """
+        Writes this process's figures to its file.
+        """
+        with self.lock:
+            os.makedirs(self.directory, exist_ok=True)
+            temporary = f'{self.path}.tmp'
+            with open(temporary, 'w') as file:
+                json.dump(self.views, file)
+            os.replace(temporary, self.path)
+            self.flushed_at = time.monotonic()
+
+
+_recorder = None
+_recorder_lock = threading.Lock()
+
+
+def recorder():
+    """
+    Returns the current process's recorder, starting a new one in a process
+    forked after it was created or when METRICS_DIR changes.
+    """
+    global _recorder
+    with _recorder_lock:
+        if (_recorder is None or _recorder.pid != os.getpid()
+                or _recorder.directory != settings.METRICS_DIR):
+            _recorder = Recorder(settings.METRICS_DIR)
+        return _recorder
+
+
+def collect():
+    """
+    Returns the figures of every process that has written to METRICS_DIR,
+    summed by view. Files of exited workers are included, so totals do not
+    drop when a worker is replaced.
+    """
+    recorder().flush()
+    views = {}
+    for path in glob.glob(os.path.join(settings.METRICS_DIR, '*.json')):
+        try:
+            with open(path) as file:
+                data = json.load(file)
+        except (OSError, ValueError):
+            continue
+        for view, figures in data.items():
+            merge(views.setdefault(view, empty_view()), figures)
+    return views
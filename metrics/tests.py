@@ -0,0 +1,562 @@
+import json
+import os
+import pstats
+import tempfile
+import threading
+import time
+import logging
+from unittest.mock import Mock, patch
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.core.mail import send_mail
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from custom_storages import StagedMediaStorage
+from jobs.mail import deliver_batch
+from jobs.queue import job, run_pending
+from .profiling import (
+    ProfilingMiddleware, Sampler, _cprofile_lock, profiles
+)
+from .registry import LATENCY_BUCKETS, collect, empty_view
+from .tracing import RequestIdFilter, span, start_span
+
+
+@job
+def traced_job():
+    with span('inside'):
+        User.objects.count()
+
+
+class MetricsTests(TestCase):
+    """
+    Tests for the request figures recorded by the metrics middleware and
+    the Prometheus endpoint serving them.
+    """
+    def setUp(self):
+        """
+        Point METRICS_DIR at an empty directory and flush on every request.
+        """
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        settings = override_settings(
+            METRICS_DIR=self.directory,
+            METRICS_FLUSH_INTERVAL=0,
+            METRICS_TOKEN='secret'
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def test_request_recorded_by_view_name(self):
+        """
+        Test that a request's latency, queries, render time and size are
+        recorded against its URL name.
+        """
+        response = self.client.get('/shelters/')
+
+        figures = collect()['view_shelters']
+        self.assertEqual(figures['requests'], {'200': 1})
+        self.assertEqual(sum(figures['duration']), 1)
+        self.assertGreater(figures['duration_sum'], 0)
+        self.assertGreaterEqual(figures['queries_sum'], 1)
+        self.assertGreater(figures['template_seconds'], 0)
+        self.assertLessEqual(
+            figures['template_seconds'], figures['duration_sum']
+        )
+        self.assertEqual(figures['response_bytes'], len(response.content))
+
+    def test_unresolved_request(self):
+        """
+        Test that requests matching no URL are recorded together.
+        """
+        self.client.get('/no-such-page/')
+
+        self.assertEqual(
+            collect()['<unresolved>']['requests'], {'404': 1}
+        )
+
+    def test_workers_summed(self):
+        """
+        Test that figures written by other worker processes are added in.
+        """
+        other = empty_view()
+        other['requests'] = {'200': 2, '500': 1}
+        other['duration'][-1] = 3
+        other['duration_sum'] = 45.0
+        with open(os.path.join(self.directory, '1-1.json'), 'w') as file:
+            json.dump({'view_shelters': other}, file)
+
+        self.client.get('/shelters/')
+
+        figures = collect()['view_shelters']
+        self.assertEqual(figures['requests'], {'200': 3, '500': 1})
+        self.assertEqual(figures['duration'][-1], 3)
+        self.assertEqual(sum(figures['duration']), 4)
+        self.assertGreater(figures['duration_sum'], 45)
+
+    def test_endpoint_staff_only(self):
+        """
+        Test that the endpoint is refused to anonymous and non-staff users.
+        """
+        self.assertEqual(self.client.get('/metrics/').status_code, 403)
+        User.objects.create_user(username='user', password='12345')
+        self.client.login(username='user', password='12345')
+        self.assertEqual(self.client.get('/metrics/').status_code, 403)
+        self.assertEqual(
+            self.client.get(
+                '/metrics/', HTTP_AUTHORIZATION='Bearer wrong'
+            ).status_code,
+            403
+        )
+
+    def test_endpoint_exposition(self):
+        """
+        Test that staff get the figures in the Prometheus text format, with
+        cumulative histogram buckets.
+        """
+        User.objects.create_user(
+            username='staff', password='12345', is_staff=True
+        )
+        self.client.get('/shelters/')
+        self.client.login(username='staff', password='12345')
+
+        response = self.client.get('/metrics/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        body = response.content.decode()
+        self.assertIn(
+            'http_requests_total{view="view_shelters",status="200"} 1', body
+        )
+        self.assertIn(
+            'http_request_duration_seconds_bucket'
+            '{view="view_shelters",le="+Inf"} 1',
+            body
+        )
+        self.assertIn(
+            'http_request_duration_seconds_count{view="view_shelters"} 1',
+            body
+        )
+        self.assertIn('# TYPE http_request_queries histogram', body)
+        self.assertIn('jobs_queued{status="pending"} 0', body)
+        self.assertIn('mail_queue_depth 0', body)
+        self.assertEqual(
+            body.count('http_request_duration_seconds_bucket'
+                       '{view="view_shelters"'),
+            len(LATENCY_BUCKETS) + 1
+        )
+
+    def test_endpoint_token(self):
+        """
+        Test that a scraper can authenticate with METRICS_TOKEN.
+        """
+        response = self.client.get(
+            '/metrics/', HTTP_AUTHORIZATION='Bearer secret'
+        )
+
+        self.assertEqual(response.status_code, 200)
+
+
+class ProfilingTests(TestCase):
+    """
+    Tests for profiling chosen requests into the on-disk ring and the staff
+    pages listing it.
+    """
+    def setUp(self):
+        """
+        Point PROFILE_DIR at an empty directory and create a staff user.
+        """
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        settings = override_settings(
+            PROFILE_DIR=self.directory,
+            PROFILE_RING_SIZE=3,
+            PROFILE_SAMPLE_RATES={},
+            PROFILE_SAMPLE_INTERVAL=0.001
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+        User.objects.create_user(
+            username='staff', password='12345', is_staff=True
+        )
+        User.objects.create_user(username='user', password='12345')
+
+    def test_unprofiled_by_default(self):
+        """
+        Test that requests are not profiled without a trigger.
+        """
+        response = self.client.get('/shelters/?profile')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(profiles(), [])
+
+    def test_flag_ignored_for_non_staff(self):
+        """
+        Test that the query flag does nothing for users who are not staff.
+        """
+        self.client.login(username='user', password='12345')
+
+        self.client.get('/shelters/?profile')
+
+        self.assertEqual(profiles(), [])
+
+    def test_staff_flag_runs_cprofile(self):
+        """
+        Test that staff adding ?profile get the view run under cProfile and
+        the stats written to the ring.
+        """
+        self.client.login(username='staff', password='12345')
+
+        response = self.client.get('/shelters/?profile')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateUsed(response, 'shelters/view_shelters.html')
+        [name] = profiles()
+        self.assertIn('-view_shelters-', name)
+        self.assertTrue(name.endswith('.pstats'))
+        stats = pstats.Stats(os.path.join(self.directory, name))
+        self.assertTrue(any(
+            function == 'view_shelters' for _, _, function in stats.stats
+        ))
+
+    def test_sampled_view(self):
+        """
+        Test that a URL name in PROFILE_SAMPLE_RATES is profiled with the
+        sampler, and that other views are not.
+        """
+        with self.settings(PROFILE_SAMPLE_RATES={'view_shelters': 1}):
+            self.client.get('/animals/')
+            self.client.get('/shelters/')
+
+        [name] = profiles()
+        self.assertIn('-view_shelters-', name)
+        self.assertTrue(name.endswith('.collapsed'))
+
+    def test_sample_rate(self):
+        """
+        Test that a rate of N profiles one request in N.
+        """
+        with self.settings(PROFILE_SAMPLE_RATES={'view_shelters': 4}), \
+                patch('metrics.profiling.random.randrange',
+                      side_effect=[3, 0, 2]):
+            for _ in range(3):
+                self.client.get('/shelters/')
+
+        self.assertEqual(len(profiles()), 1)
+
+    def test_sampler_collapsed_stacks(self):
+        """
+        Test that the sampler records stacks outermost first, with counts.
+        """
+        def slow():
+            time.sleep(0.05)
+            return 'done'
+
+        sampler = Sampler(interval=0.001)
+        self.assertEqual(sampler.runcall(slow), 'done')
+        path = os.path.join(self.directory, 'out.collapsed')
+        sampler.dump(path)
+
+        with open(path) as file:
+            lines = file.read().splitlines()
+        self.assertTrue(lines)
+        stack, count = lines[0].rsplit(' ', 1)
+        self.assertGreater(int(count), 0)
+        self.assertTrue(stack.endswith('metrics.tests:slow'))
+
+    def test_ring_bounded(self):
+        """
+        Test that only the newest PROFILE_RING_SIZE profiles are kept.
+        """
+        self.client.login(username='staff', password='12345')
+
+        for _ in range(5):
+            self.client.get('/shelters/?profile=sample')
+            time.sleep(0.002)
+
+        self.assertEqual(len(profiles()), 3)
+
+    def profiled_request(self):
+        """
+        Returns a staff request for the shelters page asking for cProfile.
+        """
+        request = RequestFactory().get('/shelters/?profile')
+        request.user = Mock(is_staff=True)
+        return request
+
+    def test_concurrent_profiles(self):
+        """
+        Test that two requests profiled at once both succeed, with cProfile
+        for one and the sampler for the other.
+        """
+        barrier = threading.Barrier(2, timeout=5)
+
+        def view(request):
+            barrier.wait()
+            time.sleep(0.02)
+            return HttpResponse('ok')
+
+        middleware = ProfilingMiddleware(view)
+        responses = []
+        threads = [
+            threading.Thread(target=lambda: responses.append(
+                middleware(self.profiled_request())
+            ))
+            for _ in range(2)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(
+            [response.status_code for response in responses], [200, 200]
+        )
+        self.assertEqual(
+            sorted(name.rsplit('.', 1)[1] for name in profiles()),
+            ['collapsed', 'pstats']
+        )
+
+    def test_cprofile_busy_falls_back_to_sampler(self):
+        """
+        Test that a request asking for cProfile while another profile holds
+        it is sampled instead.
+        """
+        middleware = ProfilingMiddleware(lambda request: HttpResponse('ok'))
+
+        with _cprofile_lock:
+            response = middleware(self.profiled_request())
+
+        self.assertEqual(response.status_code, 200)
+        [name] = profiles()
+        self.assertTrue(name.endswith('.collapsed'))
+
+    def test_exception_reraised_after_profile_saved(self):
+        """
+        Test that an exception raised under the profiler propagates, with
+        the profile saved and cProfile free for the next request.
+        """
+        def view(request):
+            raise ValueError('broken')
+
+        middleware = ProfilingMiddleware(view)
+
+        with self.assertRaisesMessage(ValueError, 'broken'):
+            middleware(self.profiled_request())
+
+        [name] = profiles()
+        self.assertTrue(name.endswith('.pstats'))
+        self.assertFalse(_cprofile_lock.locked())
+
+    def test_ring_page(self):
+        """
+        Test that staff can list and download profiles, and others cannot.
+        """
+        self.client.login(username='staff', password='12345')
+        self.client.get('/shelters/?profile')
+        [name] = profiles()
+
+        response = self.client.get('/metrics/profiles/')
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, name)
+
+        response = self.client.get(f'/metrics/profiles/{name}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('attachment', response['Content-Disposition'])
+        self.assertIn(b'view_shelters', b''.join(response.streaming_content))
+
+        self.assertEqual(
+            self.client.get('/metrics/profiles/missing.pstats/').status_code,
+            404
+        )
+
+        self.client.login(username='user', password='12345')
+        response = self.client.get('/metrics/profiles/')
+        self.assertEqual(response.status_code, 302)
+
+
+class TracingTests(TestCase):
+    """
+    Tests for the spans exported to TRACE_FILE and the request IDs given to
+    requests and log records.
+    """
+    def setUp(self):
+        """
+        Point TRACE_FILE at a file in an empty directory.
+        """
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.trace_file = os.path.join(self.directory, 'traces.jsonl')
+        settings = override_settings(TRACE_FILE=self.trace_file)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def spans(self):
+        try:
+            with open(self.trace_file) as file:
+                return [json.loads(line) for line in file]
+        except FileNotFoundError:
+            return []
+
+    def named(self, name):
+        return [span for span in self.spans() if span['name'] == name]
+
+    def test_request_spans(self):
+        """
+        Test that a request is exported as a server span with its queries
+        and template renders as descendants, under the request ID.
+        """
+        response = self.client.get('/shelters/')
+
+        [root] = self.named('GET view_shelters')
+        self.assertEqual(response['X-Request-ID'], root['traceId'])
+        self.assertEqual(root['kind'], 'SPAN_KIND_SERVER')
+        self.assertEqual(root['parentSpanId'], '')
+        self.assertEqual(
+            root['attributes']['http.response.status_code'], 200
+        )
+        spans = self.spans()
+        self.assertTrue(all(
+            span['traceId'] == root['traceId'] for span in spans
+        ))
+        [render] = [
+            span for span in self.named('template.render')
+            if span['attributes']['template.name']
+            == 'shelters/view_shelters.html'
+        ]
+        self.assertEqual(render['parentSpanId'], root['spanId'])
+        queries = self.named('db.query')
+        self.assertTrue(queries)
+        self.assertIn('db.statement', queries[0]['attributes'])
+        for span in spans:
+            self.assertLessEqual(
+                span['startTimeUnixNano'], span['endTimeUnixNano']
+            )
+
+    def test_traceparent_continued(self):
+        """
+        Test that a W3C traceparent header continues the caller's trace.
+        """
+        trace_id = 'ab' * 16
+        response = self.client.get(
+            '/shelters/',
+            HTTP_TRACEPARENT=f'00-{trace_id}-{"cd" * 8}-01'
+        )
+
+        self.assertEqual(response['X-Request-ID'], trace_id)
+        [root] = self.named('GET view_shelters')
+        self.assertEqual(root['traceId'], trace_id)
+        self.assertEqual(root['parentSpanId'], 'cd' * 8)
+
+    def test_disabled(self):
+        """
+        Test that nothing is exported without TRACE_FILE, while requests
+        still get an ID.
+        """
+        with self.settings(TRACE_FILE=None):
+            response = self.client.get('/shelters/')
+
+        self.assertEqual(len(response['X-Request-ID']), 32)
+        self.assertEqual(self.spans(), [])
+
+    def test_stripe_span(self):
+        """
+        Test that the Stripe checkout call is recorded as a client span.
+        """
+        User.objects.create_user(username='testuser', password='12345')
+        self.client.login(username='testuser', password='12345')
+
+        with patch('stripe.checkout.Session.create') as create:
+            create.return_value = Mock(url='https://mock-checkout-url')
+            self.client.post('/profiles/create-checkout-session/')
+
+        [stripe] = self.named('stripe.checkout.Session.create')
+        self.assertEqual(stripe['kind'], 'SPAN_KIND_CLIENT')
+        [root] = self.named('POST create_checkout_session')
+        self.assertEqual(stripe['parentSpanId'], root['spanId'])
+
+    def test_exception_recorded(self):
+        """
+        Test that an exception raised in a span marks it as an error.
+        """
+        with self.assertRaises(ValueError):
+            with start_span('failing'):
+                raise ValueError("bad")
+
+        [failing] = self.named('failing')
+        self.assertEqual(failing['status']['code'], 'STATUS_CODE_ERROR')
+        self.assertEqual(
+            failing['events'][0]['attributes']['exception.type'],
+            'ValueError'
+        )
+
+    @override_settings(
+        EMAIL_BACKEND='jobs.mail.QueuedEmailBackend',
+        QUEUED_EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend'
+    )
+    def test_mail_delivery_spans(self):
+        """
+        Test that each message delivered by the worker is a span.
+        """
+        send_mail("Subject", "Body", 'from@example.com', ['to@example.com'])
+
+        deliver_batch()
+
+        [send] = self.named('smtp.send')
+        self.assertEqual(send['kind'], 'SPAN_KIND_CLIENT')
+
+    def test_job_spans(self):
+        """
+        Test that a job runs in its own trace, with its queries traced.
+        """
+        traced_job.enqueue()
+
+        run_pending()
+
+        [root] = self.named('job metrics.tests.traced_job')
+        self.assertEqual(root['kind'], 'SPAN_KIND_CONSUMER')
+        [inside] = self.named('inside')
+        self.assertEqual(inside['parentSpanId'], root['spanId'])
+        self.assertTrue(any(
+            span['parentSpanId'] == inside['spanId']
+            for span in self.named('db.query')
+        ))
+
+    def test_promotion_joins_request_trace(self):
+        """
+        Test that a staged upload's promotion, which finishes after the
+        request, is exported in the request's trace.
+        """
+        storage = StagedMediaStorage(
+            remote=FileSystemStorage(
+                location=os.path.join(self.directory, 'remote')
+            ),
+            location=os.path.join(self.directory, 'staging'),
+            base_url='/media-staging/'
+        )
+        with start_span('request') as root:
+            storage.save('photo.jpg', ContentFile(b'photo'))
+        storage.wait()
+
+        [promote] = self.named('storage.promote')
+        self.assertEqual(promote['traceId'], root.trace_id)
+        self.assertEqual(promote['parentSpanId'], root.span_id)
+
+    def test_log_records_carry_request_id(self):
+        """
+        Test that log records get the current request and span IDs.
+        """
+        record = logging.LogRecord(
+            'test', logging.INFO, __file__, 1, "message", None, None
+        )
+        RequestIdFilter().filter(record)
+        self.assertEqual(record.request_id, '-')
+
+        with start_span('request') as root:
+            RequestIdFilter().filter(record)
+
+        self.assertEqual(record.request_id, root.trace_id)
+        self.assertEqual(record.span_id, root.span_id)
@@ -0,0 +1,240 @@
+import json
+import logging
+import re
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from django.conf import settings
+from django.db import connection
+
+
+# The span code runs in, read by span() and the log filter
+current_span = ContextVar('current_span', default=None)
+# W3C trace context header: version-trace id-parent span id-flags
+TRACEPARENT = re.compile(r'^00-([0-9a-f]{32})-([0-9a-f]{16})-[0-9a-f]{2}$')
+
+_export_lock = threading.Lock()
+
+
+def enabled():
+    """
+    Returns whether spans are exported, which is when TRACE_FILE is set.
+    Request IDs are assigned and logged either way.
+    """
+    return bool(getattr(settings, 'TRACE_FILE', None))
+
+
+class Trace:
+    """
+    The finished spans of one trace in this process, written together once
+    its local root span ends.
+    """
+    def __init__(self):
+        self.finished = []
+        self.root_ended = False
+
+
+class Span:
+    """
+    A timed operation, recorded with the fields of an OpenTelemetry span.
+    """
+    def __init__(self, name, kind='internal', attributes=None, parent=None,
+                 trace_id=None, parent_span_id=None):
+        self.name = name
+        self.kind = kind
+        self.attributes = dict(attributes or {})
+        self.span_id = secrets.token_hex(8)
+        if parent is not None:
+            self.trace_id = parent.trace_id
+            self.parent_span_id = parent.span_id
+            self.trace = parent.trace
+        else:
+            self.trace_id = trace_id or secrets.token_hex(16)
+            self.parent_span_id = parent_span_id
+            self.trace = Trace()
+        self.root = parent is None
+        self.status = None
+        self.events = []
+        self.start = time.time_ns()
+        self.end = None
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def record_exception(self, exc):
+        self.status = {'code': 'STATUS_CODE_ERROR', 'message': str(exc)}
+        self.events.append({
+            'name': 'exception',
+            'timeUnixNano': time.time_ns(),
+            'attributes': {
+                'exception.type': type(exc).__name__,
+                'exception.message': str(exc),
+            },
+        })
+
+    def finish(self):
+        """
+        Ends the span and, if tracing is enabled, exports it with the rest
+        of its trace once the local root has ended. Spans ending after their
+        root, such as background uploads, are exported on their own.
+        """
+        self.end = time.time_ns()
+        if not enabled():
+            return
+        trace = self.trace
+        with _export_lock:
+            trace.finished.append(self)
+            if not (self.root or trace.root_ended):
+                return
+            trace.root_ended = True
+            spans, trace.finished = trace.finished, []
+            with open(settings.TRACE_FILE, 'a') as file:
+                for span in spans:
+                    file.write(json.dumps(span.to_dict(), default=str))
+                    file.write('\n')
+
+    @property
+    def traceparent(self):
+        return f'00-{self.trace_id}-{self.span_id}-01'
+
+    def to_dict(self):
+        """
+        Returns the span in the shape of an OTLP JSON span, with attributes
+        as a plain object.
+        """
+        return {
+            'traceId': self.trace_id,
+            'spanId': self.span_id,
+            'parentSpanId': self.parent_span_id or '',
+            'name': self.name,
+            'kind': f'SPAN_KIND_{self.kind.upper()}',
+            'startTimeUnixNano': self.start,
+            'endTimeUnixNano': self.end,
+            'durationMs': round((self.end - self.start) / 1e6, 3),
+            'attributes': self.attributes,
+            'events': self.events,
+            'status': self.status or {'code': 'STATUS_CODE_UNSET'},
+        }
+
+
+@contextmanager
+def start_span(name, kind='internal', attributes=None, traceparent=None):
+    """
+    Runs the block in a new span, the child of the current span or, with
+    none, the root of a new trace. `traceparent` continues a trace started
+    elsewhere. Exceptions are recorded on the span and re-raised.
+    """
+    parent = current_span.get()
+    trace_id = parent_span_id = None
+    match = TRACEPARENT.match(traceparent or '')
+    if parent is None and match:
+        trace_id, parent_span_id = match.groups()
+    span = Span(name, kind, attributes, parent, trace_id, parent_span_id)
+    token = current_span.set(span)
+    try:
+        yield span
+    except BaseException as exc:
+        span.record_exception(exc)
+        raise
+    finally:
+        current_span.reset(token)
+        span.finish()
+
+
+@contextmanager
+def span(name, kind='internal', attributes=None):
+    """
+    Runs the block in a child span of the current one. Does nothing, and
+    yields None, when tracing is disabled.
+    """
+    if not enabled():
+        yield None
+        return
+    with start_span(name, kind, attributes) as child:
+        yield child
+
+
+def traced(name, kind='internal'):
+    """
+    Decorator running a function in a span.
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name, kind):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def trace_query(execute, sql, params, many, context):
+    """
+    Database execute wrapper running each query in a span.
+    """
+    with span('db.query', 'client', {
+        'db.system': connection.vendor,
+        'db.statement': sql,
+    }):
+        return execute(sql, params, many, context)
+
+
+@contextmanager
+def traced_queries():
+    """
+    Records the queries made on the default connection inside the block as
+    spans, when tracing is enabled.
+    """
+    if not enabled():
+        yield
+        return
+    with connection.execute_wrapper(trace_query):
+        yield
+
+
+class TracingMiddleware:
+    """
+    Middleware that serves each request in a root span and assigns it a
+    request ID, the span's trace ID. The ID is returned in X-Request-ID and
+    added to log records by RequestIdFilter. A W3C traceparent header on
+    the request continues the caller's trace.
+
+    Queries and template renders in the request become child spans.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with start_span(
+            f'{request.method} {request.path}', 'server',
+            {'http.request.method': request.method,
+             'url.path': request.path},
+            traceparent=request.headers.get('traceparent')
+        ) as root:
+            request.id = root.trace_id
+            with traced_queries():
+                response = self.get_response(request)
+            match = getattr(request, 'resolver_match', None)
+            if match:
+                root.name = f'{request.method} {match.view_name}'
+                root.set_attribute('http.route', match.route)
+            root.set_attribute('http.response.status_code',
+                               response.status_code)
+            if response.status_code >= 500:
+                root.status = {'code': 'STATUS_CODE_ERROR'}
+        response['X-Request-ID'] = request.id
+        return response
+
+
+class RequestIdFilter(logging.Filter):
+    """
+    Adds the current request ID and span ID to log records, or '-' outside
+    a traced request.
+    """
+    def filter(self, record):
+        current = current_span.get()
+        record.request_id = current.trace_id if current else '-'
+        record.span_id = current.span_id if current else '-'
+        return True
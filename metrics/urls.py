@@ -0,0 +1,12 @@
+from django.urls import path
+from . import views
+
+urlpatterns = [
+    path('', views.metrics, name='metrics'),
+    path('profiles/', views.profile_ring, name='profile_ring'),
+    path(
+      'profiles/<str:name>/',
+      views.download_profile,
+      name='download_profile'
+      ),
+]
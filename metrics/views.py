@@ -0,0 +1,161 @@
+import os
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import (
+    FileResponse, Http404, HttpResponse, HttpResponseForbidden
+)
+from django.shortcuts import render
+from django.utils.crypto import constant_time_compare
+from jobs.mail import mail_metrics
+from jobs.models import Job
+from .profiling import profiles
+from .registry import LATENCY_BUCKETS, QUERY_BUCKETS, collect
+
+
+def label(value):
+    """
+    Escapes a Prometheus label value.
+    """
+    return (
+        str(value).replace('\\', '\\\\').replace('"', '\\"')
+        .replace('\n', '\\n')
+    )
+
+
+def histogram(lines, name, view, buckets, counts, total):
+    """
+    Adds the bucket, sum and count samples of one view's histogram.
+    """
+    cumulative = 0
+    bounds = [str(bound) for bound in buckets] + ['+Inf']
+    for bound, count in zip(bounds, counts):
+        cumulative += count
+        lines.append(
+            f'{name}_bucket{{view="{view}",le="{bound}"}} {cumulative}'
+        )
+    lines.append(f'{name}_sum{{view="{view}"}} {total}')
+    lines.append(f'{name}_count{{view="{view}"}} {cumulative}')
+
+
+def exposition(views):
+    """
+    Returns the figures of every view, plus the job and mail queues, in the
+    Prometheus text format.
+    """
+    lines = []
+
+    def family(name, kind, description):
+        lines.append(f'# HELP {name} {description}')
+        lines.append(f'# TYPE {name} {kind}')
+
+    names = sorted(views)
+    family('http_requests_total', 'counter',
+           'Requests served, by view and status code.')
+    for name in names:
+        for status, count in sorted(views[name]['requests'].items()):
+            lines.append(
+                f'http_requests_total{{view="{label(name)}",'
+                f'status="{status}"}} {count}'
+            )
+    family('http_request_duration_seconds', 'histogram',
+           'Request latency, by view.')
+    for name in names:
+        histogram(lines, 'http_request_duration_seconds', label(name),
+                  LATENCY_BUCKETS, views[name]['duration'],
+                  views[name]['duration_sum'])
+    family('http_request_queries', 'histogram',
+           'Database queries per request, by view.')
+    for name in names:
+        histogram(lines, 'http_request_queries', label(name),
+                  QUERY_BUCKETS, views[name]['queries'],
+                  views[name]['queries_sum'])
+    for key, metric, description in (
+        ('query_seconds', 'http_request_query_seconds_total',
+         'Time spent in database queries, by view.'),
+        ('template_seconds', 'http_request_template_seconds_total',
+         'Time spent rendering templates, by view.'),
+        ('response_bytes', 'http_response_bytes_total',
+         'Response body bytes sent, by view.'),
+    ):
+        family(metric, 'counter', description)
+        for name in names:
+            lines.append(
+                f'{metric}{{view="{label(name)}"}} {views[name][key]}'
+            )
+
+    family('jobs_queued', 'gauge', 'Background jobs, by status.')
+    for status in Job.Statuses.values:
+        count = Job.objects.filter(status=status).count()
+        lines.append(f'jobs_queued{{status="{status}"}} {count}')
+    mail = mail_metrics()
+    family('mail_queue_depth', 'gauge', 'Queued emails not yet sent.')
+    lines.append(f'mail_queue_depth {mail["queue_depth"]}')
+    family('mail_delivery_latency_max_seconds', 'gauge',
+           'Longest delivery latency of emails sent in the last hour.')
+    lines.append(
+        f'mail_delivery_latency_max_seconds '
+        f'{mail["latency_max_seconds"] or 0}'
+    )
+    return '\n'.join(lines) + '\n'
+
+
+def authorised(request):
+    """
+    Returns whether a request may read the metrics: staff users, or a
+    scraper sending METRICS_TOKEN as a bearer token when one is set.
+    """
+    if request.user.is_authenticated and request.user.is_staff:
+        return True
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    header = request.headers.get('Authorization', '')
+    return bool(token) and constant_time_compare(header, f'Bearer {token}')
+
+
+def metrics(request):
+    """
+    Returns the request figures summed across every worker, in the
+    Prometheus text format. Staff only.
+    """
+    if not authorised(request):
+        return HttpResponseForbidden()
+    return HttpResponse(
+        exposition(collect()),
+        content_type='text/plain; version=0.0.4; charset=utf-8'
+    )
+
+
+@staff_member_required
+def profile_ring(request):
+    """
+    Lists the profiles kept in the ring, newest first, with links to
+    download them.
+    """
+    ring = []
+    for name in profiles():
+        try:
+            size = os.path.getsize(os.path.join(settings.PROFILE_DIR, name))
+        except FileNotFoundError:
+            continue
+        ring.append({'name': name, 'size': size})
+    return render(request, 'metrics/profiles.html', {
+        'profiles': ring,
+        'title': "Request profiles",
+        'sample_rates': sorted(
+            getattr(settings, 'PROFILE_SAMPLE_RATES', {}).items()
+        ),
+    })
+
+
+@staff_member_required
+def download_profile(request, name):
+    """
+    Downloads one profile from the ring: pstats files for cProfile runs, and
+    collapsed stacks, ready for flame graph tools, for sampled ones.
+    """
+    if name not in profiles():
+        raise Http404("No such profile")
+    return FileResponse(
+        open(os.path.join(settings.PROFILE_DIR, name), 'rb'),
+        as_attachment=True,
+        filename=name
+    )
@@ -0,0 +1,25 @@
+from django.contrib.auth.models import User
+from jobs.queue import job
+
+
+@job
+def delete_account(user_id):
+    """
+    Deletes a closed account and everything that cascades from it: the
+    profile, sprites and token ledger, and for a shelter admin the shelter
+    with its animals and their updates. An account reactivated since it was
+    closed is left alone.
+    """
+    User.objects.filter(id=user_id, is_active=False).delete()
+
+
+def close_account(user):
+    """
+    Deactivates a user, so they can no longer sign in, and queues the
+    deletion of their account. The cascade can reach every animal and
+    update of a shelter, so it runs on the background worker rather than
+    in the request.
+    """
+    user.is_active = False
+    user.save(update_fields=['is_active'])
+    delete_account.enqueue(user.id)
@@ -1,13 +1,15 @@
 from django.contrib import admin
 from django.utils import timezone
-from .models import Profile, RoleChangeRequest
+from .models import Profile, RoleChangeRequest, TokenEntry
 
 
 class ProfileAdmin(admin.ModelAdmin):
     """
     Profile admin display options.
+    The token snapshot is only changed by rebuild_token_snapshots.
     """
     list_display = ('user', 'role')
+    readonly_fields = ('tokens', 'tokens_entry_id')
 
 
 class RoleChangeRequestAdmin(admin.ModelAdmin):
@@ -46,5 +48,33 @@ class RoleChangeRequestAdmin(admin.ModelAdmin):
             request.save()
 
 
+class TokenEntryAdmin(admin.ModelAdmin):
+    """
+    Token ledger admin display options.
+    Entries are append-only, so they are shown read-only.
+    """
+    list_display = ('user', 'kind', 'amount', 'created_at')
+    list_filter = ('kind',)
+
+    def has_add_permission(self, request):
+        """
+        Ledger entries are only written by the token code.
+        """
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        """
+        Ledger entries are never edited.
+        """
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        """
+        Ledger entries are never deleted.
+        """
+        return False
+
+
 admin.site.register(Profile, ProfileAdmin)
 admin.site.register(RoleChangeRequest, RoleChangeRequestAdmin)
+admin.site.register(TokenEntry, TokenEntryAdmin)
@@ -0,0 +1,31 @@
+from allauth.account.auth_backends import AuthenticationBackend
+from django.contrib.auth import backends, get_user_model
+
+
+class IdentityMixin:
+    """
+    Loads the user of each request together with their profile and the
+    shelter they administer, in one joined query, so role and ownership
+    checks later in the request do not query again.
+    """
+    def get_user(self, user_id):
+        UserModel = get_user_model()
+        try:
+            user = UserModel._default_manager.select_related(
+                'profile', 'shelter'
+            ).get(pk=user_id)
+        except UserModel.DoesNotExist:
+            return None
+        return user if self.user_can_authenticate(user) else None
+
+
+class ModelBackend(IdentityMixin, backends.ModelBackend):
+    """
+    Django's username and password backend, with joined user loading.
+    """
+
+
+class AllauthBackend(IdentityMixin, AuthenticationBackend):
+    """
+    The allauth backend, for login by email, with joined user loading.
+    """
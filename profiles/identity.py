@@ -0,0 +1,75 @@
+from django.contrib.auth import BACKEND_SESSION_KEY
+from django.utils.functional import cached_property
+
+
+# Backends recorded in sessions started before the profiles.backends ones
+# replaced them, mapped to their replacements
+LEGACY_BACKENDS = {
+    'django.contrib.auth.backends.ModelBackend':
+        'profiles.backends.ModelBackend',
+    'allauth.account.auth_backends.AuthenticationBackend':
+        'profiles.backends.AllauthBackend',
+}
+
+
+class Identity:
+    """
+    The profile and owned shelter of the user making a request, resolved
+    once and kept for the rest of the request.
+
+    With the profiles.backends authentication backends, request.user was
+    loaded with both joined in, so resolving them costs no queries.
+    """
+    def __init__(self, request):
+        self.request = request
+
+    @cached_property
+    def user(self):
+        user = self.request.user
+        return user if user.is_authenticated else None
+
+    @cached_property
+    def profile(self):
+        """
+        Returns the user's profile, or None for anonymous users.
+        """
+        return getattr(self.user, 'profile', None)
+
+    @cached_property
+    def shelter(self):
+        """
+        Returns the shelter the user administers, or None.
+        """
+        return getattr(self.user, 'shelter', None)
+
+    @property
+    def role(self):
+        return self.profile.role if self.profile else None
+
+    def owns(self, shelter_id):
+        """
+        Returns whether the user administers the shelter with the given id.
+        Pass the shelter_id column of an animal rather than its shelter, so
+        the check needs no query.
+        """
+        return self.shelter is not None and self.shelter.id == shelter_id
+
+
+class IdentityMiddleware:
+    """
+    Middleware that sets request.identity. Must come after
+    AuthenticationMiddleware, and before anything reads request.user.
+
+    Sessions naming a replaced backend are pointed at its replacement, so
+    users logged in before the change stay logged in and get joined
+    loading too.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        backend = request.session.get(BACKEND_SESSION_KEY)
+        if backend in LEGACY_BACKENDS:
+            request.session[BACKEND_SESSION_KEY] = LEGACY_BACKENDS[backend]
+        request.identity = Identity(request)
+        return self.get_response(request)
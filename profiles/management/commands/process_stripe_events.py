@@ -0,0 +1,46 @@
+import time
+from django.core.management.base import BaseCommand
+from profiles.stripe_events import BATCH_SIZE, process_all_pending_events
+
+
+class Command(BaseCommand):
+    """
+    Management command that applies Stripe webhook events stored by the
+    webhook view, either once or continuously. Events are normally applied
+    by the job the webhook queues; this drains any left behind.
+    """
+    help = "Apply stored Stripe webhook events in batches"
+
+    def add_arguments(self, parser):
+        """
+        Adds the batch size, polling interval and run-once options.
+        """
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=BATCH_SIZE,
+            help="Number of events applied per transaction"
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=2,
+            help="Seconds to wait between checks when there is nothing to do"
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help="Drain the pending events and exit"
+        )
+
+    def handle(self, *args, **options):
+        """
+        Drains pending events, then keeps polling unless --once is given.
+        """
+        while True:
+            processed = process_all_pending_events(options['batch_size'])
+            if processed:
+                self.stdout.write(f"Processed {processed} Stripe events")
+            if options['once']:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,19 @@
+# Generated by Django 5.1 on 2026-10-18 14:18
+
+import blobs.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('profiles', '0008_profile_profile_picture_renditions'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='profile',
+            name='profile_picture',
+            field=models.ImageField(blank=True, null=True, storage=blobs.storage.ContentAddressedStorage(), upload_to=''),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1 on 2026-10-18 14:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('profiles', '0009_alter_profile_profile_picture'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='updates_seen_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+    ]
@@ -1,5 +1,29 @@
-from django.db import models
+from django.db import connection, models, transaction
+from django.db.models import F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
 from django.contrib.auth.models import User
+from django.utils import timezone
+from blobs.storage import content_addressed_storage
+
+
+# Keeps token advisory locks apart from any other advisory locks
+TOKEN_LOCK_NAMESPACE = 1 << 40
+
+
+def entries_since_snapshot(up_to=None):
+    """
+    Returns a subquery summing the ledger entries of the outer profile's user
+    that are not yet in its snapshot, optionally only up to entry `up_to`.
+    """
+    entries = TokenEntry.objects.filter(
+        user_id=OuterRef('user_id'),
+        id__gt=OuterRef('tokens_entry_id')
+    )
+    if up_to is not None:
+        entries = entries.filter(id__lte=up_to)
+    return entries.order_by().values('user_id').annotate(
+        total=Sum('amount')
+    ).values('total')
 
 
 # Create your models here.
@@ -14,11 +38,20 @@ class Profile(models.Model):
     role:
         Either 'user', 'shelter_admin', or 'superuser'.
     tokens:
-        Number of virtual tokens the user has.
+        Snapshot of the user's token balance. Use `balance` for the current
+        balance, which adds the ledger entries recorded since.
+    tokens_entry_id:
+        ID of the last TokenEntry included in the `tokens` snapshot.
     bio:
         Optional text field for user's bio.
     profile_picture:
         Optional image field for the user's profile.
+    profile_picture_renditions:
+        Resized copies of the profile picture, generated by the thumbnails
+        app.
+    updates_seen_at:
+        When the user last opened their updates timeline. Updates to their
+        fostered animals created since are unread.
     """
 
     USER_ROLES = (
@@ -30,8 +63,24 @@ class Profile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     role = models.CharField(max_length=20, choices=USER_ROLES, default='user')
     tokens = models.PositiveIntegerField(default=0)
+    tokens_entry_id = models.BigIntegerField(default=0)
     bio = models.TextField(blank=True)
-    profile_picture = models.ImageField(upload_to='', blank=True, null=True)
+    profile_picture = models.ImageField(
+        upload_to='',
+        storage=content_addressed_storage,
+        blank=True,
+        null=True
+    )
+    profile_picture_renditions = models.JSONField(
+        default=dict,
+        blank=True,
+        editable=False
+    )
+    updates_seen_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        editable=False
+    )
 
     def __str__(self):
         """
@@ -39,6 +88,131 @@ class Profile(models.Model):
         """
         return f'Profile of {self.user.username}'
 
+    @property
+    def balance(self):
+        """
+        Returns the user's current token balance: the snapshot held in
+        `tokens` plus every ledger entry recorded after it.
+
+        The entries are summed through the (user, id) index, so the cost
+        depends on how many entries arrived since the last snapshot rather
+        than on the length of the user's history.
+        """
+        recent = TokenEntry.objects.filter(
+            user_id=self.user_id,
+            id__gt=self.tokens_entry_id
+        ).aggregate(total=Sum('amount'))['total']
+        return self.tokens + (recent or 0)
+
+    @classmethod
+    def grant_tokens(cls, user_id, amount):
+        """
+        Records a grant of `amount` tokens to a user in the ledger.
+        """
+        return TokenEntry.objects.create(
+            user_id=user_id,
+            kind=TokenEntry.Kinds.GRANT,
+            amount=amount
+        )
+
+    @classmethod
+    def spend_tokens(cls, user_id, amount):
+        """
+        Records a spend of `amount` tokens if the user's balance covers it,
+        and returns the new balance.
+
+        The balance check and the ledger insert are one conditional
+        INSERT ... SELECT, and the profile row is never written, so spends do
+        not contend with each other or with grants on that row. On PostgreSQL
+        a transaction-scoped advisory lock keyed on the user serialises spends
+        of the same user so two of them cannot both pass the check. Returns
+        None if the balance was too low, in which case nothing is recorded.
+        """
+        ledger = connection.ops.quote_name(TokenEntry._meta.db_table)
+        profiles = connection.ops.quote_name(cls._meta.db_table)
+        with transaction.atomic(), connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute(
+                    'SELECT pg_advisory_xact_lock(%s)',
+                    [TOKEN_LOCK_NAMESPACE + user_id]
+                )
+            cursor.execute(
+                f'INSERT INTO {ledger} (user_id, kind, amount, created_at) '
+                f'SELECT profile.user_id, %s, %s, %s FROM {profiles} profile '
+                'WHERE profile.user_id = %s AND profile.tokens + COALESCE(('
+                f'SELECT SUM(entry.amount) FROM {ledger} entry '
+                'WHERE entry.user_id = profile.user_id '
+                'AND entry.id > profile.tokens_entry_id), 0) >= %s',
+                [
+                    TokenEntry.Kinds.SPEND,
+                    -amount,
+                    connection.ops.adapt_datetimefield_value(timezone.now()),
+                    user_id,
+                    amount,
+                ]
+            )
+            if cursor.rowcount == 0:
+                return None
+        return cls.objects.filter(user_id=user_id).annotate(
+            current=F('tokens') + Coalesce(
+                Subquery(entries_since_snapshot()), 0
+            )
+        ).values_list('current', flat=True).get()
+
+
+class TokenEntry(models.Model):
+    """
+    Model for the append-only token ledger.
+
+    Every grant (a purchase) and every spend (a feed) is a new row and rows
+    are never updated, so the ledger is the full history of a user's tokens.
+    Profile.tokens holds a periodic snapshot of the balance up to
+    Profile.tokens_entry_id, which the rebuild_token_snapshots command
+    refreshes.
+
+    Attributes:
+    -----------
+        user:
+            The user whose balance the entry changes.
+        kind:
+            Either 'grant' or 'spend'.
+        amount:
+            Signed number of tokens, positive for grants and negative for
+            spends.
+        reference:
+            Optional unique ID of what caused the entry, such as the Stripe
+            event behind a grant, so the same cause is never applied twice.
+        created_at:
+            When the entry was recorded.
+    """
+    class Kinds(models.TextChoices):
+        GRANT = 'grant', 'Grant'
+        SPEND = 'spend', 'Spend'
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='token_entries'
+        )
+    kind = models.CharField(max_length=10, choices=Kinds.choices)
+    amount = models.IntegerField()
+    reference = models.CharField(
+        max_length=255,
+        unique=True,
+        blank=True,
+        null=True
+        )
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [models.Index(fields=['user', 'id'])]
+
+    def __str__(self):
+        """
+        Returns string representation of TokenEntry object.
+        """
+        return f'{self.user.username} - {self.kind} {self.amount}'
+
 
 class RoleChangeRequest(models.Model):
     """
@@ -87,3 +261,48 @@ class RoleChangeRequest(models.Model):
         Returns string representation of RoleChangeRequest object.
         """
         return f'{self.user.username} - {self.charity_name} - {self.status}'
+
+
+class StripeEvent(models.Model):
+    """
+    Model for Stripe webhook events waiting to be, or already, processed.
+
+    The webhook only verifies and stores the event, queues a job and
+    responds. The job, or the process_stripe_events command, applies the
+    stored events in batches. The unique event ID means a retried delivery
+    is stored once, and the grant it causes carries the same ID as its
+    ledger reference, so an event can never credit tokens twice.
+
+    Attributes:
+    -----------
+        event_id:
+            Stripe's ID for the event.
+        type:
+            Stripe's event type, such as 'checkout.session.completed'.
+        payload:
+            The event as received.
+        received_at:
+            When the webhook stored the event.
+        processed_at:
+            When the event was applied, or null while it is pending.
+    """
+    event_id = models.CharField(max_length=255, unique=True)
+    type = models.CharField(max_length=100)
+    payload = models.JSONField()
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['id'],
+                name='stripe_event_pending_idx',
+                condition=models.Q(processed_at__isnull=True)
+            )
+        ]
+
+    def __str__(self):
+        """
+        Returns string representation of StripeEvent object.
+        """
+        return f'{self.type} - {self.event_id}'
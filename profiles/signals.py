@@ -4,6 +4,8 @@ from django.dispatch import receiver
 from django.core.mail import send_mail
 from django.contrib.auth import get_user_model
 from django.conf import settings
+from jobs.queue import job
+from metrics.tracing import span
 from .models import Profile, RoleChangeRequest
 
 
@@ -24,34 +26,48 @@ def save_profile(sender, instance, **kwargs):
     instance.profile.save()
 
 
-@receiver(post_save, sender=RoleChangeRequest)
-def notify_superuser_on_role_change_request(
-    sender, instance, created, **kwargs
-):
+@job
+def send_role_change_request_email(request_id):
     """
-    Notify superusers via email when a new RoleChangeRequest is created.
+    Email every superuser the details of a role change request.
     """
-    if created:
-        # Fetch the superuser
-        User = get_user_model()
-        superusers = User.objects.filter(is_superuser=True)
-
-        # Prepare email details
-        subject = "New Shelter Admin Role Change Request"
-        message = (
-            f"A new role change request by {instance.user.username}.\n\n"
-            f"Details:\nCharity Name: {instance.charity_name}\n"
-            f"Registration Number: {instance.charity_registration_number}\n"
-            f"Website: {instance.charity_website}\n"
-            f"Description: {instance.charity_description}\n\n"
-            f"Please review the request in the admin panel."
-            )
+    instance = RoleChangeRequest.objects.select_related('user').get(
+        id=request_id
+    )
+
+    # Fetch the superuser
+    User = get_user_model()
+    superusers = User.objects.filter(is_superuser=True)
 
-        # Send the email to all superusers
-        for superuser in superusers:
+    # Prepare email details
+    subject = "New Shelter Admin Role Change Request"
+    message = (
+        f"A new role change request by {instance.user.username}.\n\n"
+        f"Details:\nCharity Name: {instance.charity_name}\n"
+        f"Registration Number: {instance.charity_registration_number}\n"
+        f"Website: {instance.charity_website}\n"
+        f"Description: {instance.charity_description}\n\n"
+        f"Please review the request in the admin panel."
+        )
+
+    # Send the email to all superusers
+    for superuser in superusers:
+        with span('send_mail', 'client', {'email.subject': subject}):
             send_mail(
                 subject,
                 message,
                 settings.DEFAULT_FROM_EMAIL,
                 [superuser.email]
             )
+
+
+@receiver(post_save, sender=RoleChangeRequest)
+def notify_superuser_on_role_change_request(
+    sender, instance, created, **kwargs
+):
+    """
+    Notify superusers via email when a new RoleChangeRequest is created.
+    The email is sent by the background worker rather than in the request.
+    """
+    if created:
+        send_role_change_request_email.enqueue(instance.id)
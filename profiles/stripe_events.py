@@ -0,0 +1,93 @@
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import timezone
+from jobs.queue import job
+from .models import StripeEvent, TokenEntry
+
+
+# Number of stored events applied per transaction
+BATCH_SIZE = 500
+# Tokens granted for a completed checkout session
+TOKENS_PER_PURCHASE = 100
+
+
+def purchase_user_id(event):
+    """
+    Returns the ID of the user who paid in a stored checkout event, or None
+    if the session carries no usable user ID.
+    """
+    session = event.payload.get('data', {}).get('object', {})
+    user_id = (session.get('metadata') or {}).get('user_id')
+    try:
+        return int(user_id)
+    except (TypeError, ValueError):
+        return None
+
+
+def process_pending_events(batch_size=BATCH_SIZE):
+    """
+    Applies one batch of pending Stripe events and returns how many events
+    were processed.
+
+    Pending rows are claimed with SELECT ... FOR UPDATE SKIP LOCKED where the
+    database supports it, so several workers can drain the table together.
+    The batch's token grants are written with one bulk insert that ignores
+    conflicts on the ledger reference, so an event is never credited twice
+    even if it is somehow processed again.
+    """
+    with transaction.atomic():
+        events = list(
+            StripeEvent.objects.select_for_update(skip_locked=True)
+            .filter(processed_at__isnull=True)
+            .order_by('id')[:batch_size]
+        )
+        if not events:
+            return 0
+
+        purchases = {
+            event.event_id: purchase_user_id(event)
+            for event in events
+            if event.type == 'checkout.session.completed'
+        }
+        known_users = set(
+            User.objects.filter(id__in=purchases.values())
+            .values_list('id', flat=True)
+        )
+        TokenEntry.objects.bulk_create(
+            [
+                TokenEntry(
+                    user_id=user_id,
+                    kind=TokenEntry.Kinds.GRANT,
+                    amount=TOKENS_PER_PURCHASE,
+                    reference=f'stripe:{event_id}',
+                )
+                for event_id, user_id in purchases.items()
+                if user_id in known_users
+            ],
+            ignore_conflicts=True
+        )
+        StripeEvent.objects.filter(
+            id__in=[event.id for event in events]
+        ).update(processed_at=timezone.now())
+    return len(events)
+
+
+def process_all_pending_events(batch_size=BATCH_SIZE):
+    """
+    Applies pending Stripe events batch by batch until none are left, and
+    returns the total number processed.
+    """
+    total = 0
+    while processed := process_pending_events(batch_size):
+        total += processed
+    return total
+
+
+@job
+def apply_stripe_events():
+    """
+    Applies every pending Stripe event. Queued by the webhook view for each
+    event it stores; a job finding the events already applied by another
+    does nothing.
+    """
+    process_all_pending_events()
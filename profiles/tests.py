@@ -1,17 +1,26 @@
-from django.test import TestCase
-from django.contrib.auth import get_user_model
-from django.contrib.auth.models import User
+from django.test import RequestFactory, TestCase
+from django.contrib.auth import BACKEND_SESSION_KEY, get_user_model
+from django.contrib.auth.models import AnonymousUser, User
 from django.contrib.admin.sites import site
 from django.contrib.messages import get_messages
 from django.core import mail
+from django.core.management import call_command
+from django.utils import timezone
+from io import StringIO
 from unittest.mock import patch, Mock
 import stripe
 import json
+from jobs.queue import run_pending
 from shelters.models import Shelter
-from animals.models import Animal
-from .models import Profile, RoleChangeRequest
-from .admin import ProfileAdmin, RoleChangeRequestAdmin
+from animals.models import Animal, Update
+from .models import Profile, RoleChangeRequest, StripeEvent, TokenEntry
+from .admin import ProfileAdmin, RoleChangeRequestAdmin, TokenEntryAdmin
+from .backends import ModelBackend
 from .forms import ProfileForm, RoleChangeRequestForm
+from .identity import Identity
+from .stripe_events import process_pending_events
+from .views import unread_counts
+from virtual_shelter.budgets import QueryBudgetTestCase
 
 
 # Views
@@ -69,6 +78,240 @@ class ProfileViewTest(TestCase):
         self.assertNotEqual(response.status_code, 200)
 
 
+class TimelineViewTest(TestCase):
+    """
+    Test cases for the fosterer's updates timeline.
+    """
+    def setUp(self):
+        """
+        Set up a fosterer with two fostered animals and another animal they
+        do not foster.
+        """
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='12345'
+        )
+        self.client.login(username='testuser', password='12345')
+        admin = User.objects.create_user(username='admin', password='12345')
+        shelter = Shelter.objects.create(
+            admin=admin,
+            name="Test Shelter",
+            registration_number="123456789",
+            description="A test shelter"
+        )
+        self.sky, self.rex, self.other = [
+            Animal.objects.create(
+                shelter=shelter,
+                name=name,
+                age='1 year',
+                adoption_status='Fostered',
+                fosterer=fosterer
+            )
+            for name, fosterer in (
+                ('Sky', self.user.profile),
+                ('Rex', self.user.profile),
+                ('Other', None),
+            )
+        ]
+
+    def post(self, animal, text):
+        return Update.objects.create(animal=animal, text=text)
+
+    def test_timeline_merges_fostered_animals(self):
+        """
+        Test that updates to every fostered animal are listed newest first,
+        without updates to other animals.
+        """
+        self.post(self.sky, "Sky one")
+        self.post(self.other, "Not mine")
+        self.post(self.rex, "Rex one")
+        self.post(self.sky, "Sky two")
+
+        response = self.client.get('/profiles/timeline/')
+
+        self.assertEqual(
+            [update.text for update in response.context['updates']],
+            ["Sky two", "Rex one", "Sky one"]
+        )
+        self.assertNotContains(response, "Not mine")
+
+    @patch('profiles.views.TIMELINE_PAGE_SIZE', 2)
+    def test_timeline_keyset_pages(self):
+        """
+        Test that following the next page links visits every update once,
+        including updates sharing a timestamp.
+        """
+        updates = [self.post(self.sky, f"Update {i}") for i in range(5)]
+        Update.objects.filter(id__in=[u.id for u in updates[1:4]]).update(
+            created_at=updates[1].created_at
+        )
+        seen = []
+        query = ''
+        while query is not None:
+            response = self.client.get(f'/profiles/timeline/?{query}')
+            seen += [update.id for update in response.context['updates']]
+            query = response.context['next_page']
+
+        self.assertEqual(len(seen), 5)
+        self.assertEqual(set(seen), {update.id for update in updates})
+
+    def test_unread_counts(self):
+        """
+        Test that unread counts per animal come from one query and are
+        cleared by opening the timeline.
+        """
+        self.post(self.sky, "Sky one")
+        self.post(self.sky, "Sky two")
+        self.post(self.rex, "Rex one")
+        profile = Profile.objects.get(user=self.user)
+
+        with self.assertNumQueries(1):
+            counts = unread_counts(profile)
+        self.assertEqual(counts, {self.sky.id: 2, self.rex.id: 1})
+
+        first = self.client.get('/profiles/timeline/')
+        self.assertEqual(
+            first.context['unread'], [(self.sky, 2), (self.rex, 1)]
+        )
+        self.assertContains(first, "Sky: <strong>2 new</strong>")
+
+        self.post(self.rex, "Rex two")
+        second = self.client.get('/profiles/timeline/')
+        self.assertEqual(second.context['unread'], [(self.rex, 1)])
+        self.assertContains(second, '<span class="badge', count=1)
+
+
+class ProfileQueryBudgetTest(QueryBudgetTestCase):
+    """
+    Checks the profile views against their query budgets.
+    """
+    def setUp(self):
+        """
+        Set up a logged-in fosterer and a shelter to foster from.
+        """
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='12345'
+        )
+        self.client.login(username='testuser', password='12345')
+        admin = User.objects.create_user(username='admin', password='12345')
+        self.shelter = Shelter.objects.create(
+            admin=admin,
+            name="Test Shelter",
+            registration_number="123456789",
+            description="A test shelter"
+        )
+
+    def add_fostered(self, count):
+        for _ in range(count):
+            animal = Animal.objects.create(
+                shelter=self.shelter,
+                name="Sky",
+                age='1 year',
+                adoption_status='Fostered',
+                fosterer=self.user.profile,
+                image='animals/sky.jpg'
+            )
+            Update.objects.create(animal=animal, text="News")
+
+    def test_profile(self):
+        self.assertWithinBudget('profile', self.add_fostered)
+
+    def test_timeline(self):
+        self.assertWithinBudget('timeline', self.add_fostered)
+
+
+class IdentityTest(TestCase):
+    """
+    Test cases for loading the request user with their profile and shelter
+    and the request.identity helper.
+    """
+    def setUp(self):
+        """
+        Set up a shelter admin and a regular user.
+        """
+        self.admin = User.objects.create_user(
+            username='admin',
+            password='12345'
+        )
+        self.shelter = Shelter.objects.create(
+            admin=self.admin,
+            name="Test Shelter",
+            registration_number="123456789",
+            description="A test shelter"
+        )
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='12345'
+        )
+
+    def test_user_loaded_with_profile_and_shelter(self):
+        """
+        Test that the backend loads the user, profile and shelter in one
+        query, including for users without a shelter.
+        """
+        with self.assertNumQueries(1):
+            admin = ModelBackend().get_user(self.admin.id)
+            self.assertEqual(admin.profile.role, 'user')
+            self.assertEqual(admin.shelter, self.shelter)
+        with self.assertNumQueries(1):
+            user = ModelBackend().get_user(self.user.id)
+            self.assertIsNone(getattr(user, 'shelter', None))
+
+    def test_identity_owns(self):
+        """
+        Test that ownership is resolved from the loaded user without further
+        queries.
+        """
+        request = RequestFactory().get('/')
+        request.user = ModelBackend().get_user(self.admin.id)
+        identity = Identity(request)
+
+        with self.assertNumQueries(0):
+            self.assertTrue(identity.owns(self.shelter.id))
+            self.assertFalse(identity.owns(self.shelter.id + 1))
+            self.assertEqual(identity.role, 'user')
+
+        request.user = AnonymousUser()
+        identity = Identity(request)
+        self.assertIsNone(identity.profile)
+        self.assertFalse(identity.owns(self.shelter.id))
+
+    def test_legacy_session_kept(self):
+        """
+        Test that a session started with a replaced backend stays logged in
+        and is moved to its replacement.
+        """
+        self.client.force_login(
+            self.user, backend='django.contrib.auth.backends.ModelBackend'
+        )
+
+        response = self.client.get('/profiles/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            self.client.session[BACKEND_SESSION_KEY],
+            'profiles.backends.ModelBackend'
+        )
+
+    def test_edit_shelter_requires_owner(self):
+        """
+        Test that only the shelter's admin can edit it.
+        """
+        self.client.login(username='testuser', password='12345')
+
+        response = self.client.post(
+            f'/shelters/profile/edit/{self.shelter.id}/',
+            {'name': "Taken over"}
+        )
+
+        self.assertRedirects(
+            response, f'/shelters/profile/{self.shelter.id}/'
+        )
+        self.shelter.refresh_from_db()
+        self.assertEqual(self.shelter.name, "Test Shelter")
+
+
 class EditProfileViewTest(TestCase):
     """
     Test cases for the edit profile view.
@@ -148,6 +391,10 @@ class DeleteProfileViewTest(TestCase):
         """
         response = self.client.post('/profiles/delete/')
         self.assertRedirects(response, '/')
+        self.user.refresh_from_db()
+        self.assertFalse(self.user.is_active)
+
+        run_pending()
         self.assertFalse(User.objects.filter(username='testuser').exists())
         self.assertFalse(Profile.objects.filter(bio='Test bio').exists())
 
@@ -159,9 +406,9 @@ class DeleteProfileViewTest(TestCase):
         """
         Test error handling during profile deletion.
         """
-        # Simulate an error in deletion by mocking the delete method
+        # Simulate an error in deletion by mocking closing the account
         with patch(
-            'django.contrib.auth.models.User.delete',
+            'profiles.views.close_account',
             side_effect=Exception('Deletion error')
         ):
             response = self.client.post('/profiles/delete/')
@@ -348,35 +595,138 @@ class StripeWebhookTest(TestCase):
         )
         self.client.login(username='testuser', password='12345')
 
-    @patch('stripe.Webhook.construct_event')
-    def test_valid_webhook_event(self, mock_construct_event):
+    def checkout_event(self, event_id='evt_1', user_id=None):
         """
-        Test processing a valid Stripe webhook event
-        (checkout.session.completed).
+        Returns a minimal checkout.session.completed event.
         """
-        mock_event = {
+        return {
+            'id': event_id,
             'type': 'checkout.session.completed',
             'data': {
                 'object': {
                     'metadata': {
-                        'user_id': str(self.user.id),
+                        'user_id': str(user_id or self.user.id),
                     }
                 }
             }
         }
 
-        mock_construct_event.return_value = mock_event
-
-        response = self.client.post(
+    def post_event(self, mock_construct_event, event):
+        """
+        Posts an event to the webhook as if Stripe had signed it.
+        """
+        mock_construct_event.return_value = event
+        return self.client.post(
             '/profiles/stripe-webhook/',
             data=json.dumps({'dummy': 'data'}),
             content_type='application/json',
             HTTP_STRIPE_SIGNATURE='dummy_signature'
         )
 
+    @patch('stripe.Webhook.construct_event')
+    def test_valid_webhook_event(self, mock_construct_event):
+        """
+        Test processing a valid Stripe webhook event
+        (checkout.session.completed).
+        """
+        response = self.post_event(mock_construct_event, self.checkout_event())
+
+        # The webhook only stores the event
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(StripeEvent.objects.count(), 1)
+        self.user.profile.refresh_from_db()
+        self.assertEqual(self.user.profile.balance, 0)
+
+        self.assertEqual(process_pending_events(), 1)
+        self.user.profile.refresh_from_db()
+        self.assertEqual(self.user.profile.balance, 100)
+        self.assertIsNotNone(StripeEvent.objects.get().processed_at)
+
+    @patch('stripe.Webhook.construct_event')
+    def test_webhook_queues_processing_job(self, mock_construct_event):
+        """
+        Test that the background worker applies a stored event.
+        """
+        self.post_event(mock_construct_event, self.checkout_event())
+
+        run_pending()
+
+        self.user.profile.refresh_from_db()
+        self.assertEqual(self.user.profile.balance, 100)
+        self.assertIsNotNone(StripeEvent.objects.get().processed_at)
+
+    @patch('stripe.Webhook.construct_event')
+    def test_duplicate_delivery_granted_once(self, mock_construct_event):
+        """
+        Test that a retried delivery of the same event is stored and credited
+        only once.
+        """
+        self.post_event(mock_construct_event, self.checkout_event())
+        process_pending_events()
+        response = self.post_event(
+            mock_construct_event, self.checkout_event()
+        )
+
         self.assertEqual(response.status_code, 200)
+        self.assertEqual(StripeEvent.objects.count(), 1)
+        self.assertEqual(process_pending_events(), 0)
         self.user.profile.refresh_from_db()
-        self.assertEqual(self.user.profile.tokens, 100)
+        self.assertEqual(self.user.profile.balance, 100)
+
+    def test_reprocessed_event_not_granted_twice(self):
+        """
+        Test that the ledger reference stops an event being credited twice
+        even if it is processed again.
+        """
+        event = StripeEvent.objects.create(
+            event_id='evt_1',
+            type='checkout.session.completed',
+            payload=self.checkout_event()
+        )
+        process_pending_events()
+        StripeEvent.objects.filter(id=event.id).update(processed_at=None)
+        process_pending_events()
+
+        self.assertEqual(self.user.profile.balance, 100)
+        self.assertEqual(self.user.token_entries.count(), 1)
+
+    def test_events_processed_in_batches(self):
+        """
+        Test that pending events are applied in batches, skipping other
+        event types and unknown users.
+        """
+        StripeEvent.objects.bulk_create([
+            StripeEvent(
+                event_id=f'evt_{i}',
+                type='checkout.session.completed',
+                payload=self.checkout_event(f'evt_{i}')
+            )
+            for i in range(5)
+        ] + [
+            StripeEvent(
+                event_id='evt_other',
+                type='payment_intent.created',
+                payload={'id': 'evt_other'}
+            ),
+            StripeEvent(
+                event_id='evt_unknown',
+                type='checkout.session.completed',
+                payload=self.checkout_event('evt_unknown', user_id=999999)
+            ),
+        ])
+
+        self.assertEqual(process_pending_events(batch_size=4), 4)
+        self.assertEqual(self.user.profile.balance, 400)
+
+        out = StringIO()
+        call_command(
+            'process_stripe_events', '--once', '--batch-size=2', stdout=out
+        )
+        self.assertIn('Processed 3 Stripe events', out.getvalue())
+        self.assertEqual(self.user.profile.balance, 500)
+        self.assertFalse(
+            StripeEvent.objects.filter(processed_at__isnull=True).exists()
+        )
 
     @patch('stripe.Webhook.construct_event')
     def test_invalid_signature(self, mock_construct_event):
@@ -432,6 +782,96 @@ class ProfileModelTest(TestCase):
         profile = Profile.objects.get(user=self.user)
         self.assertEqual(str(profile), 'Profile of testuser')
 
+    def test_spend_tokens(self):
+        """
+        Test that spend_tokens deducts the amount and returns the new balance.
+        """
+        Profile.objects.filter(user=self.user).update(tokens=10)
+        self.assertEqual(Profile.spend_tokens(self.user.id, 4), 6)
+        self.assertEqual(Profile.spend_tokens(self.user.id, 6), 0)
+        self.user.profile.refresh_from_db()
+        self.assertEqual(self.user.profile.balance, 0)
+
+    def test_spend_tokens_records_ledger_entry(self):
+        """
+        Test that spending appends to the ledger and leaves the snapshot on
+        the profile row untouched.
+        """
+        Profile.objects.filter(user=self.user).update(tokens=10)
+        Profile.spend_tokens(self.user.id, 4)
+        entry = TokenEntry.objects.get(user=self.user)
+        self.assertEqual(entry.kind, TokenEntry.Kinds.SPEND)
+        self.assertEqual(entry.amount, -4)
+        self.user.profile.refresh_from_db()
+        self.assertEqual(self.user.profile.tokens, 10)
+        self.assertEqual(self.user.profile.balance, 6)
+
+    def test_spend_tokens_counts_grants(self):
+        """
+        Test that grants recorded after the snapshot can be spent.
+        """
+        Profile.grant_tokens(self.user.id, 5)
+        self.assertEqual(Profile.spend_tokens(self.user.id, 5), 0)
+        self.assertIsNone(Profile.spend_tokens(self.user.id, 1))
+
+    def test_spend_tokens_insufficient_balance(self):
+        """
+        Test that spend_tokens leaves the balance alone when it is too low.
+        """
+        Profile.objects.filter(user=self.user).update(tokens=3)
+        self.assertIsNone(Profile.spend_tokens(self.user.id, 4))
+        self.user.profile.refresh_from_db()
+        self.assertEqual(self.user.profile.balance, 3)
+
+
+class RebuildTokenSnapshotsCommandTest(TestCase):
+    """
+    Test cases for the command that folds ledger entries into the balance
+    snapshots.
+    """
+    def setUp(self):
+        """
+        Set up the test environment by creating a user with a snapshot and a
+        few ledger entries, one of them too recent to fold.
+        """
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='12345'
+        )
+        Profile.objects.filter(user=self.user).update(tokens=10)
+        old = timezone.now() - timezone.timedelta(minutes=5)
+        TokenEntry.objects.create(
+            user=self.user, kind='grant', amount=100, created_at=old
+        )
+        self.last_old = TokenEntry.objects.create(
+            user=self.user, kind='spend', amount=-3, created_at=old
+        )
+        TokenEntry.objects.create(user=self.user, kind='spend', amount=-1)
+
+    def test_rebuild_token_snapshots(self):
+        """
+        Test that settled entries are folded into the snapshot and the
+        balance is unchanged.
+        """
+        out = StringIO()
+        call_command('rebuild_token_snapshots', stdout=out)
+        self.assertIn('Rebuilt 1 token snapshots', out.getvalue())
+
+        profile = Profile.objects.get(user=self.user)
+        self.assertEqual(profile.tokens, 107)
+        self.assertEqual(profile.tokens_entry_id, self.last_old.id)
+        self.assertEqual(profile.balance, 106)
+
+    def test_rebuild_token_snapshots_is_repeatable(self):
+        """
+        Test that running the command twice does not fold entries twice.
+        """
+        call_command('rebuild_token_snapshots', stdout=StringIO())
+        call_command('rebuild_token_snapshots', stdout=StringIO())
+        profile = Profile.objects.get(user=self.user)
+        self.assertEqual(profile.tokens, 107)
+        self.assertEqual(profile.balance, 106)
+
 
 class RoleChangeRequestModelTest(TestCase):
     """
@@ -507,6 +947,38 @@ class ProfileAdminTest(TestCase):
         profile_admin = ProfileAdmin(Profile, site)
         self.assertEqual(profile_admin.list_display, ('user', 'role'))
 
+    def test_profile_admin_token_snapshot_read_only(self):
+        """
+        Test that the token snapshot fields cannot be edited in the admin.
+        """
+        profile_admin = ProfileAdmin(Profile, site)
+        self.assertEqual(
+            profile_admin.readonly_fields, ('tokens', 'tokens_entry_id')
+        )
+
+
+class TokenEntryAdminTest(TestCase):
+    """
+    Test cases for the TokenEntry model's admin configuration.
+
+    Ensures that ledger entries cannot be added, changed or deleted through
+    the admin site.
+    """
+    def test_token_entry_admin_permissions(self):
+        """
+        Test that add, change and delete permissions are all denied.
+        """
+        superuser = User.objects.create_superuser(
+            username='admin',
+            password='12345'
+        )
+        request = RequestFactory().get('/admin/')
+        request.user = superuser
+        token_entry_admin = TokenEntryAdmin(TokenEntry, site)
+        self.assertFalse(token_entry_admin.has_add_permission(request))
+        self.assertFalse(token_entry_admin.has_change_permission(request))
+        self.assertFalse(token_entry_admin.has_delete_permission(request))
+
 
 class RoleChangeRequestAdminTest(TestCase):
     """
@@ -700,7 +1172,9 @@ class RoleChangeRequestSignalTest(TestCase):
             charity_description='A test charity'
         )
 
-        # Check that an email has been sent
+        # The email is queued and sent by the worker
+        self.assertEqual(len(mail.outbox), 0)
+        run_pending()
         self.assertEqual(len(mail.outbox), 1)
 
         # Verify the contents of the email
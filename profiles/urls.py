@@ -4,6 +4,7 @@ from . import views
 
 urlpatterns = [
     path('', views.profile, name='profile'),
+    path('timeline/', views.timeline, name='timeline'),
     path('edit/', views.edit_profile, name='edit_profile'),
     path('delete/', views.delete_profile, name='delete_profile'),
     path(
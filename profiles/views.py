@@ -1,13 +1,27 @@
+import logging
 import stripe
+from datetime import datetime
+from urllib.parse import urlencode
 from django.conf import settings
+from django.db.models import Count, Q
 from django.shortcuts import render, redirect
 from django.contrib import messages
 from django.contrib.auth import logout
 from django.contrib.auth.decorators import login_required
 from django.views.decorators.csrf import csrf_exempt
 from django.http import JsonResponse
-from .models import Profile
+from django.utils import timezone
+from animals.models import Update
+from metrics.tracing import span
+from .accounts import close_account
+from .models import Profile, StripeEvent
 from .forms import ProfileForm, RoleChangeRequestForm
+from .stripe_events import apply_stripe_events
+
+
+logger = logging.getLogger(__name__)
+
+TIMELINE_PAGE_SIZE = 20
 
 
 @login_required
@@ -15,7 +29,7 @@ def profile(request):
     """
     View to display user's profile and associated animals.
     """
-    user_profile = Profile.objects.get(user=request.user)
+    user_profile = request.identity.profile
     animals = user_profile.animals.all()
     return render(
         request,
@@ -24,14 +38,105 @@ def profile(request):
     )
 
 
+def parse_cursor(value):
+    """
+    Returns the (created_at, id) of the update a timeline page starts
+    after, from a 'before' parameter, or None if it is missing or invalid.
+    """
+    try:
+        created_at, update_id = value.rsplit(',', 1)
+        return datetime.fromisoformat(created_at), int(update_id)
+    except (AttributeError, ValueError):
+        return None
+
+
+def timeline_page(profile, params):
+    """
+    Returns one page of updates to the animals a profile fosters, newest
+    first, and the query string of the next page (None on the last page).
+
+    Pages are keyed on (created_at, id) rather than an offset: each page
+    starts below the last update of the previous one, so the index on
+    Update (animal, -created_at) is read from the cursor down for each
+    fostered animal however far back the user goes.
+    """
+    updates = (
+        Update.objects.filter(animal__fosterer=profile)
+        .select_related('animal')
+        .order_by('-created_at', '-id')
+    )
+    cursor = parse_cursor(params.get('before'))
+    if cursor:
+        created_at, update_id = cursor
+        updates = updates.filter(
+            Q(created_at__lt=created_at)
+            | Q(created_at=created_at, id__lt=update_id)
+        )
+
+    updates = list(updates[:TIMELINE_PAGE_SIZE + 1])
+    next_page = None
+    if len(updates) > TIMELINE_PAGE_SIZE:
+        updates = updates[:TIMELINE_PAGE_SIZE]
+        last = updates[-1]
+        next_page = urlencode({
+            'before': f'{last.created_at.isoformat()},{last.id}'
+        })
+    return updates, next_page
+
+
+def unread_counts(profile):
+    """
+    Returns {animal id: count} of the updates to a profile's fostered
+    animals created since it last saw its timeline, in one aggregate query.
+    """
+    updates = Update.objects.filter(animal__fosterer=profile)
+    if profile.updates_seen_at:
+        updates = updates.filter(created_at__gt=profile.updates_seen_at)
+    return dict(
+        updates.order_by()
+        .values_list('animal')
+        .annotate(count=Count('id'))
+    )
+
+
+@login_required
+def timeline(request):
+    """
+    View showing the updates to every animal the user fosters, newest
+    first, with the number of unread updates per animal.
+
+    Opening the first page marks everything up to the start of the request
+    as seen; the unread counts and highlights on that page are from before
+    the visit.
+    """
+    now = timezone.now()
+    profile = request.identity.profile
+    seen_at = profile.updates_seen_at
+    updates, next_page = timeline_page(profile, request.GET)
+    unread = unread_counts(profile)
+    if 'before' not in request.GET:
+        Profile.objects.filter(id=profile.id).update(
+            updates_seen_at=now
+        )
+
+    return render(request, 'profiles/timeline.html', {
+        'updates': updates,
+        'next_page': next_page,
+        'seen_at': seen_at,
+        'unread': [
+            (animal, unread[animal.id])
+            for animal in profile.animals.filter(id__in=unread).order_by('id')
+        ],
+    })
+
+
 @login_required
 def edit_profile(request):
     """
     View for editing the user's profile.
     """
-    try:
-        user_profile = Profile.objects.get(user=request.user)
-    except Profile.DoesNotExist:
+    user_profile = request.identity.profile
+    if user_profile is None:
         messages.error(request, "Profile not found")
         return redirect('home')
 
@@ -52,12 +157,13 @@ def edit_profile(request):
 @login_required
 def delete_profile(request):
     """
-    View for deleting the user's account.
+    View for deleting the user's account. The account is closed at once
+    and deleted by the background worker.
     """
     if request.method == 'POST':
         try:
             user = request.user
-            user.delete()
+            close_account(user)
             messages.success(request, "Profile deleted")
             logout(request)
             return redirect('home')
@@ -93,7 +199,7 @@ def tokens(request):
     """
     View for displaying pre-checkout tokens page.
     """
-    profile = Profile.objects.get(user=request.user)
+    profile = request.identity.profile
     return render(request, 'profiles/tokens.html', {'profile': profile})
 
 
@@ -108,38 +214,40 @@ def create_checkout_session(request):
     domain = request.build_absolute_uri('/').strip('/')
 
     try:
-        checkout_session = stripe.checkout.Session.create(
-            payment_method_types=['card'],
-            line_items=[
-                {
-                    'price_data': {
-                        'currency': 'gbp',
-                        'product_data': {
-                            'name': '100 Virtual Shelter Tokens',
+        with span('stripe.checkout.Session.create', 'client'):
+            checkout_session = stripe.checkout.Session.create(
+                payment_method_types=['card'],
+                line_items=[
+                    {
+                        'price_data': {
+                            'currency': 'gbp',
+                            'product_data': {
+                                'name': '100 Virtual Shelter Tokens',
+                            },
+                            'unit_amount': token_cost,
                         },
-                        'unit_amount': token_cost,
-                    },
-                    'quantity': 1,
+                        'quantity': 1,
+                    }
+                ],
+                mode='payment',
+                success_url=f'{domain}/dashboard/?payment_status=success',
+                cancel_url=f'{domain}/dashboard/?payment_status=cancel',
+                metadata={
+                    'user_id': request.user.id
                 }
-            ],
-            mode='payment',
-            success_url=f'{domain}/dashboard/?payment_status=success',
-            cancel_url=f'{domain}/dashboard/?payment_status=cancel',
-            metadata={
-                'user_id': request.user.id
-            }
-        )
+            )
         return redirect(checkout_session.url, code=302)
     except Exception as e:
-        print("Stripe session creation error:", e)
+        logger.exception("Stripe session creation failed")
         return JsonResponse({'error': str(e)}, status=500)
 
 
 @csrf_exempt
 def stripe_webhook(request):
     """
-    View for the stripe webhook to update user's token count if payment
-    successful.
+    View for the stripe webhook. Verifies and stores the event, then
+    responds at once. Stored events, including the token grant for a
+    successful payment, are applied by a job on the background worker.
     """
     payload = request.body
     sig_header = request.META['HTTP_STRIPE_SIGNATURE']
@@ -154,23 +262,12 @@ def stripe_webhook(request):
     except stripe.error.SignatureVerificationError as e:
         return JsonResponse({'status': 'Invalid signature'}, status=400)
 
-    # Handle the checkout.session.completed event
-    if event['type'] == 'checkout.session.completed':
-        session = event['data']['object']
-
-        # Get the user ID from the session metadata
-        user_id = session.get('metadata', {}).get('user_id')
-
-        if user_id:
-            try:
-                profile = Profile.objects.get(user_id=user_id)
-                # Add tokens to user's profile based on the payment
-                profile.tokens += 100
-                profile.save()
-            except Profile.DoesNotExist:
-                return JsonResponse(
-                    {'status': 'User profile not found'},
-                    status=404
-                )
+    # Store the event for the worker and acknowledge it straight away. A
+    # retried delivery hits the unique event ID and is not stored again.
+    StripeEvent.objects.bulk_create(
+        [StripeEvent(event_id=event['id'], type=event['type'], payload=event)],
+        ignore_conflicts=True
+    )
+    apply_stripe_events.enqueue()
 
     return JsonResponse({'status': 'success'}, status=200)
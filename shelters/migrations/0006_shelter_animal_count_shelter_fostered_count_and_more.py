@@ -0,0 +1,28 @@
+# Generated by Django 5.1 on 2026-10-18 14:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shelters', '0005_alter_shelter_image'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shelter',
+            name='animal_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='shelter',
+            name='fostered_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='shelter',
+            name='last_update_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+    ]
@@ -1,19 +1,39 @@
 from django.db import models
 from django.contrib.auth.models import User
+from blobs.storage import content_addressed_storage
 
 
 class Shelter(models.Model):
     """
     A model representing a shelter, which includes an admin (a single User), an
     optional image, the shelter's name, registration number, website (optional)
-    and a description of the shelter.
+    and a description of the shelter. Counts of its animals and fostered
+    animals and the time of its latest animal update are kept on the row.
     """
     admin = models.OneToOneField(User, on_delete=models.CASCADE)
-    image = models.ImageField(upload_to='', blank=True, null=True)
+    image = models.ImageField(
+        upload_to='',
+        storage=content_addressed_storage,
+        blank=True,
+        null=True
+    )
+    image_renditions = models.JSONField(
+        default=dict,
+        blank=True,
+        editable=False
+    )
     name = models.CharField(max_length=255)
     registration_number = models.CharField(max_length=100)
     website = models.URLField(blank=True, null=True)
     description = models.TextField()
+    # Maintained by animals.counters as animals and updates change
+    animal_count = models.PositiveIntegerField(default=0, editable=False)
+    fostered_count = models.PositiveIntegerField(default=0, editable=False)
+    last_update_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        editable=False
+    )
 
     def __str__(self):
         """
@@ -1,16 +1,35 @@
+from urllib.parse import urlencode
 from django.shortcuts import render, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.contrib.auth import logout
+from django.db.models import F, OuterRef, Subquery
 from .models import Shelter
 from .forms import ShelterForm
+from animals.fragments import FRAGMENT_TIMEOUT, generation
+from animals.models import Update
+from profiles.accounts import close_account
+
+
+PAGE_SIZE = 24
+
+# Directory orderings, by the value of the 'sort' query parameter. Activity
+# puts the shelter with the most recent animal update first.
+SORTS = {
+    'name': ('name', 'id'),
+    'activity': (F('last_update_at').desc(nulls_last=True), 'name', 'id'),
+}
 
 
 def profile(request, id):
     """
     Renders the profile page for a specific shelter by its ID.
     If the shelter does not exist, redirects the user with an error message.
-    Displays the shelter details and all associated animals.
+    Displays the shelter details and all associated animals with their
+    latest update. The animals and their updates are read in one query, so
+    the page costs the same number of queries however many animals the
+    shelter has. The details and the public animal list are cached as
+    fragments keyed by the shelter's generation.
     """
     try:
         shelter = Shelter.objects.get(id=id)
@@ -20,12 +39,23 @@ def profile(request, id):
         )
         return redirect('view_shelters')
 
-    animals = shelter.animals.all()
+    latest = Update.objects.filter(animal=OuterRef('pk')).order_by(
+        '-created_at'
+    )
+    animals = shelter.animals.annotate(
+        latest_update_text=Subquery(latest.values('text')[:1]),
+    )
 
     return render(
         request,
         'shelters/shelter.html',
-        {'shelter': shelter, 'animals': animals}
+        {
+            'shelter': shelter,
+            'animals': animals,
+            'is_shelter_admin': request.identity.owns(shelter.id),
+            'generation': generation(shelter),
+            'fragment_timeout': FRAGMENT_TIMEOUT,
+        }
     )
 
 
@@ -35,7 +65,8 @@ def edit_shelter(request, id):
     View for editing an existing shelter. Loads the shelter by ID.
     Displays a form pre-filled with the shelter's current data.
     Handles POST requests to update shelter information if the form is valid.
-    If the shelter does not exist, redirects with an error message.
+    If the shelter does not exist, redirects with an error message. Only the
+    shelter's admin may edit it.
     """
     try:
         shelter = Shelter.objects.get(id=id)
@@ -43,6 +74,10 @@ def edit_shelter(request, id):
         messages.error(request, "Shelter not found")
         return redirect('view_shelters')
 
+    if not request.identity.owns(shelter.id):
+        messages.error(request, "Only shelter admin can edit shelter")
+        return redirect('shelter_profile', id=shelter.id)
+
     if request.method == 'POST':
         form = ShelterForm(request.POST, request.FILES, instance=shelter)
         if form.is_valid():
@@ -65,14 +100,15 @@ def edit_shelter(request, id):
 def delete_shelter(request):
     """
     Handles the deletion of the user's shelter and account.
-    Deletes the user's account and logs them out on a successful POST request.
+    Closes the user's account and logs them out on a successful POST request;
+    the background worker then deletes the account, shelter and animals.
     If there's an error during deletion, an error message is shown, and the
     user is redirected to the shelter profile.
     """
     if request.method == 'POST':
         try:
             user = request.user
-            user.delete()
+            close_account(user)
             logout(request)
             messages.success(request, "Account deleted")
             return redirect('home')
@@ -81,14 +117,47 @@ def delete_shelter(request):
             return redirect('shelter_profile', id=user.shelter.id)
 
 
-def view_shelters(request):
+def shelter_page(params):
     """
-    Renders a view displaying all shelters.
+    Returns one page of the shelter directory for the query parameters in
+    `params`, with the sort applied and the query strings of the previous
+    and next pages (None at either end).
 
-    Retrieves all Shelter objects and passes them to the 'view_shelters'
-    template.
+    The animal and fostered counts and the latest update time are counter
+    columns on Shelter, so the page is one query with no aggregation. One
+    row more than a page is read to tell whether another page follows.
     """
-    shelters = Shelter.objects.all()
-    return render(
-        request, 'shelters/view_shelters.html', {'shelters': shelters}
-    )
+    sort = params.get('sort')
+    if sort not in SORTS:
+        sort = 'name'
+    try:
+        page = max(int(params.get('page', 1)), 1)
+    except ValueError:
+        page = 1
+
+    shelters = Shelter.objects.order_by(*SORTS[sort])
+
+    start = (page - 1) * PAGE_SIZE
+    shelters = list(shelters[start:start + PAGE_SIZE + 1])
+    next_page = previous_page = None
+    if len(shelters) > PAGE_SIZE:
+        shelters = shelters[:PAGE_SIZE]
+        next_page = urlencode({'sort': sort, 'page': page + 1})
+    if page > 1:
+        previous_page = urlencode({'sort': sort, 'page': page - 1})
+    return shelters, sort, previous_page, next_page
+
+
+def view_shelters(request):
+    """
+    Renders a page of the shelter directory, sorted by name or by recent
+    activity, with each shelter's animal and fostered counts and the date
+    of its latest update.
+    """
+    shelters, sort, previous_page, next_page = shelter_page(request.GET)
+    return render(request, 'shelters/view_shelters.html', {
+        'shelters': shelters,
+        'sort': sort,
+        'previous_page': previous_page,
+        'next_page': next_page,
+    })
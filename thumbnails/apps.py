@@ -0,0 +1,19 @@
+from django.apps import AppConfig
+
+
+class ThumbnailsConfig(AppConfig):
+    """
+    App configuration for the 'thumbnails' app, which generates resized
+    renditions of uploaded images.
+
+    Connects the post_save handlers of every model with a rendered image
+    field when the app is ready.
+    """
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'thumbnails'
+
+    def ready(self):
+        """
+        Import signal handlers when the app is ready.
+        """
+        import thumbnails.signals
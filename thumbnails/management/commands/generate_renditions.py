@@ -0,0 +1,68 @@
+from concurrent.futures import ThreadPoolExecutor
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from django.db import connection
+from thumbnails.renditions import (
+    IMAGE_FIELDS, generate_renditions, needs_renditions, renditions_field
+)
+
+
+def generate_in_thread(label, pk, field_name):
+    """
+    Thread pool entry point for generate_renditions. Each thread uses its
+    own database connection and closes it when done.
+    """
+    try:
+        generate_renditions(label, pk, field_name)
+    finally:
+        connection.close()
+
+
+class Command(BaseCommand):
+    """
+    Management command that generates missing or out of date renditions for
+    every existing image.
+    """
+    help = "Generate resized renditions of existing images"
+
+    def add_arguments(self, parser):
+        """
+        Adds the worker count option.
+        """
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=4,
+            help="Number of images processed at the same time"
+        )
+
+    def handle(self, *args, **options):
+        """
+        Finds images whose renditions are missing or stale and renders them
+        in a thread pool. Resizing and storage uploads release the GIL, so
+        threads keep several cores and connections busy.
+        """
+        pending = []
+        for label, field_name in IMAGE_FIELDS:
+            model = apps.get_model(label)
+            instances = (
+                model.objects.exclude(**{f'{field_name}__isnull': True})
+                .exclude(**{field_name: ''})
+                .only('pk', field_name, renditions_field(field_name))
+            )
+            pending += [
+                (label, instance.pk, field_name)
+                for instance in instances.iterator()
+                if needs_renditions(instance, field_name)
+            ]
+
+        if options['workers'] <= 1:
+            for item in pending:
+                generate_renditions(*item)
+        else:
+            with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+                list(pool.map(lambda item: generate_in_thread(*item), pending))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Generated renditions for {len(pending)} images"
+        ))
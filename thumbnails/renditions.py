@@ -0,0 +1,189 @@
+import io
+import os
+from django.apps import apps
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db.models import Q
+from django.dispatch import Signal
+from PIL import Image, ImageOps, UnidentifiedImageError
+from jobs.queue import job
+
+
+# Image fields that get renditions, as (model label, field name). Each model
+# has a JSONField named '<field>_renditions' holding the result.
+IMAGE_FIELDS = [
+    ('animals.Animal', 'image'),
+    ('shelters.Shelter', 'image'),
+    ('profiles.Profile', 'profile_picture'),
+]
+
+# Length in pixels of the shorter side of each rendition. Images are shown in
+# 200px boxes cropped with object-fit: cover, so these cover 1x, 2x and 4x
+# displays.
+SIZES = (200, 400, 800)
+# Pillow format name and file extension of each rendition format
+FORMATS = {'webp': ('WEBP', 'webp'), 'jpeg': ('JPEG', 'jpg')}
+QUALITY = 80
+DIRECTORY = 'renditions'
+
+# Sent with the model as sender and `pk` after an instance's renditions
+# field is written. The write is a queryset update, so post_save is not sent.
+renditions_updated = Signal()
+
+
+def renditions_field(field_name):
+    """
+    Returns the name of the JSONField holding the renditions of an image
+    field.
+    """
+    return f'{field_name}_renditions'
+
+
+def rendition_name(source, size, extension):
+    """
+    Returns the storage name for one rendition of a source file.
+    """
+    stem = os.path.splitext(source)[0]
+    return f'{DIRECTORY}/{stem}-{size}.{extension}'
+
+
+def scaled(width, height, size):
+    """
+    Returns the dimensions of an image scaled so its shorter side is `size`.
+    """
+    scale = size / min(width, height)
+    return round(width * scale), round(height * scale)
+
+
+def render(source, storage=default_storage):
+    """
+    Generates and stores the renditions of a source file, and returns the
+    data to keep in the renditions field:
+
+        {'source': name, 'width': w, 'height': h,
+         'renditions': [{'width': w, 'height': h,
+                         'webp': name, 'jpeg': name}, ...]}
+
+    Sizes larger than the original are skipped. A file Pillow cannot read
+    gets no renditions, so templates keep using the original. A missing file
+    raises FileNotFoundError, so the job is retried; a staged upload is not
+    readable from the worker until it has been promoted.
+    """
+    try:
+        with storage.open(source, 'rb') as file:
+            image = ImageOps.exif_transpose(Image.open(file))
+            image.load()
+    except FileNotFoundError:
+        raise
+    except (UnidentifiedImageError, OSError):
+        return {'source': source, 'renditions': []}
+
+    image = image.convert('RGB')
+    width, height = image.size
+    renditions = []
+    for size in SIZES:
+        if size > min(width, height):
+            break
+        resized = image.resize(scaled(width, height, size), Image.LANCZOS)
+        rendition = {'width': resized.width, 'height': resized.height}
+        for key, (image_format, extension) in FORMATS.items():
+            buffer = io.BytesIO()
+            resized.save(buffer, image_format, quality=QUALITY)
+            rendition[key] = storage.save(
+                rendition_name(source, size, extension),
+                ContentFile(buffer.getvalue())
+            )
+        renditions.append(rendition)
+    return {
+        'source': source,
+        'width': width,
+        'height': height,
+        'renditions': renditions,
+    }
+
+
+def delete_renditions(data, storage=default_storage):
+    """
+    Deletes the files of previously generated renditions.
+    """
+    for rendition in data.get('renditions', []):
+        for key in FORMATS:
+            storage.delete(rendition[key])
+
+
+@job
+def delete_released_renditions(data):
+    """
+    Deletes the rendition files of an image whose instance was deleted.
+    """
+    delete_renditions(data)
+
+
+def needs_renditions(instance, field_name):
+    """
+    Returns whether an instance's image has changed since its renditions
+    were generated.
+    """
+    source = getattr(instance, field_name).name or None
+    data = getattr(instance, renditions_field(field_name)) or {}
+    return source != data.get('source')
+
+
+@job
+def generate_renditions(model_label, pk, field_name):
+    """
+    Generates the renditions of one instance's image and records them.
+
+    The renditions field is only written if the image is still the one that
+    was rendered, so an upload that lands while the job runs is not
+    overwritten; its own job renders it instead. Renditions of the previous
+    image are deleted once replaced.
+    """
+    model = apps.get_model(model_label)
+    instance = model.objects.filter(pk=pk).first()
+    if instance is None or not needs_renditions(instance, field_name):
+        return
+
+    source = getattr(instance, field_name).name or None
+    previous = getattr(instance, renditions_field(field_name)) or {}
+    data = render(source) if source else {}
+    if source:
+        unchanged = Q(**{field_name: source})
+    else:
+        unchanged = (
+            Q(**{f'{field_name}__isnull': True}) | Q(**{field_name: ''})
+        )
+    updated = model.objects.filter(unchanged, pk=pk).update(
+        **{renditions_field(field_name): data}
+    )
+    if updated:
+        renditions_updated.send(sender=model, pk=pk)
+        delete_renditions(previous)
+    else:
+        delete_renditions(data)
+
+
+def current_renditions(image):
+    """
+    Returns the renditions recorded for an image field file, or an empty
+    list if they have not been generated for the current file yet.
+    """
+    if not image:
+        return []
+    data = getattr(
+        image.instance, renditions_field(image.field.name), None
+    ) or {}
+    if data.get('source') != image.name:
+        return []
+    return data.get('renditions', [])
+
+
+def image_url(image, size=400):
+    """
+    Returns the URL of the smallest JPEG rendition of an image at least
+    `size` pixels on its shorter side, or of the original if there is none.
+    """
+    for item in current_renditions(image):
+        if min(item['width'], item['height']) >= size:
+            return default_storage.url(item['jpeg'])
+    return image.url
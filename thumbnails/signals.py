@@ -0,0 +1,47 @@
+from django.apps import apps
+from django.db.models.signals import post_delete, post_save
+from .renditions import (
+    IMAGE_FIELDS, delete_released_renditions, generate_renditions,
+    needs_renditions, renditions_field
+)
+
+
+def queue_renditions(field_name):
+    """
+    Returns a post_save handler that queues rendition generation when the
+    saved instance's image has changed.
+    """
+    def handler(sender, instance, **kwargs):
+        if needs_renditions(instance, field_name):
+            generate_renditions.enqueue(
+                sender._meta.label, instance.pk, field_name
+            )
+    return handler
+
+
+def release_renditions(field_name):
+    """
+    Returns a post_delete handler that queues the deletion of a deleted
+    instance's rendition files. Renditions of replaced or cleared images
+    are deleted by the job that supersedes them.
+    """
+    def handler(sender, instance, **kwargs):
+        data = getattr(instance, renditions_field(field_name)) or {}
+        if data.get('renditions'):
+            delete_released_renditions.enqueue(data)
+    return handler
+
+
+for label, field_name in IMAGE_FIELDS:
+    post_save.connect(
+        queue_renditions(field_name),
+        sender=apps.get_model(label),
+        weak=False,
+        dispatch_uid=f'thumbnails.{label}.{field_name}'
+    )
+    post_delete.connect(
+        release_renditions(field_name),
+        sender=apps.get_model(label),
+        weak=False,
+        dispatch_uid=f'thumbnails.{label}.{field_name}.release'
+    )
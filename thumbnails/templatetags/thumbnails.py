@@ -0,0 +1,47 @@
+from django import template
+from django.core.files.storage import default_storage
+from django.utils.html import format_html, format_html_join
+from thumbnails.renditions import current_renditions
+
+
+register = template.Library()
+
+
+def srcset(items, key):
+    """
+    Returns a srcset attribute value for one format of the renditions.
+    """
+    return format_html_join(
+        ', ', '{} {}w',
+        ((default_storage.url(item[key]), item['width']) for item in items)
+    )
+
+
+@register.simple_tag
+def responsive_image(image, alt='', css_class='', sizes='200px',
+                     loading='lazy'):
+    """
+    Renders an image field as a <picture> offering WebP renditions with JPEG
+    fallbacks, plus srcset, sizes, width and height so the browser fetches
+    only the size it needs and reserves space before it arrives.
+
+    Until the renditions exist, the original is rendered as a plain <img>.
+    """
+    items = current_renditions(image)
+    if not items:
+        return format_html(
+            '<img src="{}" alt="{}" class="{}" loading="{}">',
+            image.url, alt, css_class, loading
+        )
+    smallest = items[0]
+    return format_html(
+        '<picture>'
+        '<source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}" width="{}" height="{}" '
+        'alt="{}" class="{}" loading="{}">'
+        '</picture>',
+        srcset(items, 'webp'), sizes,
+        default_storage.url(smallest['jpeg']), srcset(items, 'jpeg'), sizes,
+        smallest['width'], smallest['height'],
+        alt, css_class, loading
+    )
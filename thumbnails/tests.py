@@ -0,0 +1,347 @@
+import io
+import shutil
+import tempfile
+import threading
+from io import StringIO
+from django.contrib.auth.models import User
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.template import Context, Template
+from django.test import RequestFactory, TestCase, override_settings
+from PIL import Image
+from animals.models import Animal
+from custom_storages import StagedMediaStorage, staged_urls
+from jobs.models import Job
+from jobs.queue import run_pending
+from shelters.models import Shelter
+from thumbnails.renditions import generate_renditions
+
+
+def jpeg(width, height, name='photo.jpg'):
+    """
+    Returns an uploaded JPEG of the given size.
+    """
+    buffer = io.BytesIO()
+    Image.new('RGB', (width, height), 'orange').save(buffer, 'JPEG')
+    return SimpleUploadedFile(name, buffer.getvalue(), 'image/jpeg')
+
+
+class RenditionTests(TestCase):
+    """
+    Test cases for generating image renditions in the background and
+    rendering them with the responsive_image tag.
+    """
+    def setUp(self):
+        """
+        Set up a temporary media directory, a shelter and an animal.
+        """
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        override = override_settings(MEDIA_ROOT=media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='12345'
+        )
+        self.shelter = Shelter.objects.create(
+            admin=self.user,
+            name="Test Shelter",
+            registration_number="12345",
+            description="A test shelter"
+        )
+        self.animal = Animal.objects.create(
+            shelter=self.shelter,
+            name="Sky",
+            age='1 year',
+            image=jpeg(1000, 500)
+        )
+
+    def render(self, animal):
+        return Template(
+            '{% load thumbnails %}'
+            '{% responsive_image animal.image alt="Sky" css_class="pic" %}'
+        ).render(Context({'animal': animal}))
+
+    def test_upload_queues_generation(self):
+        """
+        Test that saving an image queues a job rather than resizing in the
+        request, and that the original is used until it runs.
+        """
+        self.assertEqual(self.animal.image_renditions, {})
+        self.assertTrue(Job.objects.filter(
+            name='thumbnails.renditions.generate_renditions',
+            args=['animals.Animal', self.animal.id, 'image']
+        ).exists())
+        self.assertIn(
+            f'<img src="{self.animal.image.url}"', self.render(self.animal)
+        )
+
+    def test_renditions_generated(self):
+        """
+        Test that the job stores WebP and JPEG renditions scaled on the
+        shorter side, skipping sizes above the original.
+        """
+        run_pending()
+        self.animal.refresh_from_db()
+        data = self.animal.image_renditions
+
+        self.assertEqual(data['source'], self.animal.image.name)
+        self.assertEqual((data['width'], data['height']), (1000, 500))
+        self.assertEqual(
+            [(r['width'], r['height']) for r in data['renditions']],
+            [(400, 200), (800, 400)]
+        )
+        for rendition in data['renditions']:
+            with default_storage.open(rendition['webp']) as file:
+                self.assertEqual(Image.open(file).format, 'WEBP')
+            with default_storage.open(rendition['jpeg']) as file:
+                self.assertEqual(Image.open(file).size, (
+                    rendition['width'], rendition['height']
+                ))
+
+    def test_tag_renders_picture(self):
+        """
+        Test that the tag emits WebP and JPEG srcsets, sizes, and the width
+        and height of the smallest rendition.
+        """
+        run_pending()
+        self.animal.refresh_from_db()
+        html = self.render(self.animal)
+
+        self.assertIn('<source type="image/webp" srcset="', html)
+        self.assertIn('-200.webp 400w, ', html)
+        self.assertIn('-400.jpg 800w"', html)
+        self.assertIn('sizes="200px"', html)
+        self.assertIn('width="400" height="200"', html)
+        self.assertIn('alt="Sky" class="pic" loading="lazy"', html)
+
+    def test_replaced_image_rerendered(self):
+        """
+        Test that a new upload gets new renditions and the old ones are
+        deleted.
+        """
+        run_pending()
+        self.animal.refresh_from_db()
+        old = self.animal.image_renditions['renditions'][0]['jpeg']
+
+        self.animal.image = jpeg(300, 300, 'other.jpg')
+        self.animal.save()
+        self.assertNotIn('<picture>', self.render(self.animal))
+        run_pending()
+        self.animal.refresh_from_db()
+
+        self.assertEqual(
+            [r['width'] for r in self.animal.image_renditions['renditions']],
+            [200]
+        )
+        self.assertFalse(default_storage.exists(old))
+
+    def test_deleted_instance_releases_renditions(self):
+        """
+        Test that deleting an instance queues the deletion of its rendition
+        files.
+        """
+        run_pending()
+        self.animal.refresh_from_db()
+        files = [
+            rendition[key]
+            for rendition in self.animal.image_renditions['renditions']
+            for key in ('webp', 'jpeg')
+        ]
+
+        self.animal.delete()
+        self.assertTrue(all(default_storage.exists(name) for name in files))
+        run_pending()
+
+        self.assertFalse(any(default_storage.exists(name) for name in files))
+        self.assertFalse(Job.objects.exists())
+
+    def test_unreadable_image_keeps_original(self):
+        """
+        Test that a file Pillow cannot read is recorded without renditions
+        instead of failing the job.
+        """
+        self.animal.image = SimpleUploadedFile(
+            'broken.jpg', b'not an image', 'image/jpeg'
+        )
+        self.animal.save()
+        run_pending()
+        self.animal.refresh_from_db()
+
+        self.assertEqual(self.animal.image_renditions['renditions'], [])
+        self.assertFalse(Job.objects.exists())
+
+    def test_backfill_command(self):
+        """
+        Test that the backfill command renders existing images in parallel.
+        """
+        Job.objects.all().delete()
+        Animal.objects.create(
+            shelter=self.shelter, name="Rex", age='2 year',
+            image=jpeg(600, 900, 'rex.jpg')
+        )
+        Job.objects.all().delete()
+        out = StringIO()
+
+        call_command('generate_renditions', '--workers=1', stdout=out)
+
+        self.assertIn('Generated renditions for 2 images', out.getvalue())
+        self.assertEqual(
+            Animal.objects.filter(image_renditions__has_key='source').count(),
+            2
+        )
+
+
+class SlowRemoteStorage(FileSystemStorage):
+    """
+    Local stand-in for S3 whose uploads wait for `released`, and fail while
+    `failures` is above zero.
+    """
+    released = threading.Event()
+    failures = 0
+
+    def _save(self, name, content):
+        SlowRemoteStorage.released.wait(5)
+        if SlowRemoteStorage.failures:
+            SlowRemoteStorage.failures -= 1
+            raise ConnectionError("Upload failed")
+        return super()._save(name, content)
+
+
+class StagedStorageTests(TestCase):
+    """
+    Test cases for staging uploads locally and promoting them to the remote
+    storage in the background.
+    """
+    def setUp(self):
+        """
+        Set up temporary staging and remote directories and a staged storage
+        using the stand-in remote.
+        """
+        self.staging_root = tempfile.mkdtemp()
+        self.remote_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.staging_root)
+        self.addCleanup(shutil.rmtree, self.remote_root)
+        SlowRemoteStorage.released.clear()
+        SlowRemoteStorage.failures = 0
+        self.addCleanup(SlowRemoteStorage.released.set)
+
+        self.remote = SlowRemoteStorage(
+            location=self.remote_root,
+            base_url='https://bucket.example.com/media/'
+        )
+        self.storage = StagedMediaStorage(
+            remote=self.remote,
+            location=self.staging_root,
+            base_url='/media-staging/',
+            sweep_interval=0
+        )
+        self.storage.retry_delay = 0
+
+    def test_save_returns_before_upload(self):
+        """
+        Test that a save returns while the upload is still running, and the
+        file is readable and served from staging meanwhile.
+        """
+        name = self.storage.save('animal_images/sky.jpg', jpeg(10, 10))
+
+        self.assertEqual(self.storage.staged(), [name])
+        self.assertEqual(self.storage.url(name), f'/media-staging/{name}')
+        self.assertFalse(self.remote.exists(name))
+        with self.storage.open(name) as file:
+            self.assertEqual(Image.open(file).size, (10, 10))
+
+    def test_url_switches_after_promotion(self):
+        """
+        Test that the staged copy is removed and url() returns the remote
+        URL once the upload completes.
+        """
+        name = self.storage.save('animal_images/sky.jpg', jpeg(10, 10))
+        SlowRemoteStorage.released.set()
+        self.storage.wait()
+
+        self.assertEqual(self.storage.staged(), [])
+        self.assertTrue(self.remote.exists(name))
+        self.assertEqual(
+            self.storage.url(name), f'https://bucket.example.com/media/{name}'
+        )
+
+    def test_failed_upload_retried(self):
+        """
+        Test that a failed upload is retried, and a file whose attempts all
+        fail stays staged and served locally.
+        """
+        SlowRemoteStorage.released.set()
+        SlowRemoteStorage.failures = 1
+        retried = self.storage.save('retried.jpg', jpeg(10, 10))
+        self.storage.wait()
+        self.assertTrue(self.remote.exists(retried))
+
+        SlowRemoteStorage.failures = self.storage.attempts
+        kept = self.storage.save('kept.jpg', jpeg(10, 10))
+        self.storage.wait()
+        self.assertEqual(self.storage.staged(), [kept])
+        self.assertEqual(self.storage.url(kept), '/media-staging/kept.jpg')
+
+    def test_sweep_requeues_failed_promotion(self):
+        """
+        Test that a sweep queues files left staged once they are old enough,
+        and promotes them.
+        """
+        SlowRemoteStorage.released.set()
+        SlowRemoteStorage.failures = self.storage.attempts
+        name = self.storage.save('kept.jpg', jpeg(10, 10))
+        self.storage.wait()
+
+        self.assertEqual(self.storage.sweep(), [])
+        self.assertEqual(self.storage.sweep(min_age=0), [name])
+        self.storage.wait()
+
+        self.assertEqual(self.storage.staged(), [])
+        self.assertTrue(self.remote.exists(name))
+
+    def test_staged_file_served(self):
+        """
+        Test that the staging URL serves a file not yet promoted, and is
+        only mounted while uploads are staged.
+        """
+        self.assertEqual(staged_urls(), [])
+        with override_settings(
+            MEDIA_STAGING_ROOT=self.staging_root, STAGE_MEDIA_UPLOADS=True
+        ):
+            self.storage.save('sky.jpg', jpeg(10, 10))
+            [pattern] = staged_urls()
+            match = pattern.resolve('media-staging/sky.jpg')
+            response = match.func(
+                RequestFactory().get('/media-staging/sky.jpg'),
+                **match.kwargs
+            )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+
+    def test_renditions_wait_for_promotion(self):
+        """
+        Test that a rendition job for an upload the worker cannot read yet
+        is retried rather than recorded without renditions.
+        """
+        user = User.objects.create_user(username='testuser', password='12345')
+        shelter = Shelter.objects.create(
+            admin=user, name="Test Shelter", registration_number="12345"
+        )
+        animal = Animal.objects.create(
+            shelter=shelter, name="Sky", age='1 year'
+        )
+        Animal.objects.filter(id=animal.id).update(image='missing.jpg')
+        generate_renditions.enqueue('animals.Animal', animal.id, 'image')
+
+        run_pending()
+
+        job = Job.objects.get()
+        self.assertEqual(job.attempts, 1)
+        self.assertIn('FileNotFoundError', job.last_error)
+        animal.refresh_from_db()
+        self.assertEqual(animal.image_renditions, {})
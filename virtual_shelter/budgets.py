@@ -0,0 +1,207 @@
+import os
+import re
+import sys
+import time
+from collections import Counter
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection
+from django.test import TestCase
+from django.urls import reverse
+from animals.fragments import FRAGMENT_CACHE
+
+
+@dataclass(frozen=True)
+class Budget:
+    """
+    The most queries, and milliseconds spent in them, that one request to a
+    view may cost with `scale` objects on the page.
+    """
+    queries: int
+    milliseconds: int = 500
+    scale: int = 20
+
+
+# Query budgets of the list and profile views, keyed by URL name. Each is
+# checked by a QueryBudgetTestCase test that seeds the view's objects, so a
+# view whose query count grows with the number of objects fails even while
+# it is still under its limit.
+BUDGETS = {
+    'animal_profile': Budget(queries=4),
+    'browse_animals': Budget(queries=2),
+    'dashboard': Budget(queries=4),
+    'profile': Budget(queries=4),
+    'search_animals': Budget(queries=3),
+    'shelter_profile': Budget(queries=4),
+    'sprites_status': Budget(queries=3),
+    'timeline': Budget(queries=6),
+    'view_animals': Budget(queries=5),
+    'view_shelters': Budget(queries=1),
+}
+
+
+@dataclass
+class RecordedQuery:
+    sql: str
+    params: tuple
+    duration: float
+    stack: list = field(default_factory=list)
+
+    @property
+    def shape(self):
+        """
+        Returns the SQL with inlined numbers and IN lists collapsed, so the
+        same query run for different rows compares equal.
+        """
+        return re.sub(r'\b\d+\b|(%s, )+%s', '%s', self.sql)
+
+    def __str__(self):
+        return f'{self.sql} {self.params}'
+
+
+def query_stack():
+    """
+    Returns where the current query was made from, outermost first: the
+    project's own frames, plus the template tag or variable being rendered
+    for queries made by templates.
+    """
+    here = os.path.abspath(__file__)
+    root = str(settings.BASE_DIR)
+    lines = []
+    frame = sys._getframe(1)
+    while frame is not None:
+        code = frame.f_code
+        filename = os.path.abspath(code.co_filename)
+        node = (
+            frame.f_locals.get('self')
+            if code.co_name == 'render_annotated' else None
+        )
+        token = getattr(node, 'token', None)
+        origin = getattr(node, 'origin', None)
+        if token and origin:
+            line = (
+                f'{origin.template_name}, line {token.lineno}: '
+                f'{{{{ {token.contents} }}}}'
+                if token.token_type.name == 'VAR'
+                else f'{origin.template_name}, line {token.lineno}: '
+                f'{{% {token.contents} %}}'
+            )
+        elif (filename.startswith(root) and filename != here
+              and 'site-packages' not in filename):
+            line = (
+                f'{os.path.relpath(filename, root)}, line {frame.f_lineno}, '
+                f'in {code.co_name}'
+            )
+        else:
+            line = None
+        if line and (not lines or lines[-1] != line):
+            lines.append(line)
+        frame = frame.f_back
+    return lines[::-1]
+
+
+class QueryRecorder:
+    """
+    Database execute wrapper recording each query's SQL, duration and stack.
+    """
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append(RecordedQuery(
+                sql=sql,
+                params=tuple(params or ()),
+                duration=time.perf_counter() - start,
+                stack=query_stack()
+            ))
+
+    @property
+    def milliseconds(self):
+        return sum(query.duration for query in self.queries) * 1000
+
+    def shapes(self):
+        return Counter(query.shape for query in self.queries)
+
+
+@contextmanager
+def record_queries():
+    """
+    Records the queries made on the default database inside the block.
+    """
+    recorder = QueryRecorder()
+    with connection.execute_wrapper(recorder):
+        yield recorder
+
+
+def report(small, large, scale):
+    """
+    Describes the queries run more often with `scale` objects than with one,
+    each with the stack of its first run, or every query if none grew.
+    """
+    grown = large.shapes() - small.shapes()
+    lines = []
+    for shape, extra in grown.items():
+        query = next(q for q in large.queries if q.shape == shape)
+        lines.append(f'\n{extra} more with {scale} objects: {query}')
+        lines.extend(f'    {line}' for line in query.stack)
+    if not lines:
+        for query in large.queries:
+            lines.append(f'\n{query}')
+            lines.extend(f'    {line}' for line in query.stack)
+    return '\n'.join(lines)
+
+
+class QueryBudgetTestCase(TestCase):
+    """
+    Test case checking a view against its entry in BUDGETS.
+
+    assertWithinBudget requests the view with one seeded object and again
+    with the budget's scale, clearing the cache before each so cached
+    fragments do not hide queries. It fails if the second request makes more
+    queries than the first, or if it exceeds the budget's query or time
+    limit, and reports the SQL and stack of the offending queries.
+    """
+    def measure(self, url):
+        caches[FRAGMENT_CACHE].clear()
+        with record_queries() as recorder:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return recorder
+
+    def assertWithinBudget(self, url_name, seed, args=None, query=''):
+        """
+        Checks the view named `url_name`, calling `seed(count)` to add
+        `count` more of the objects it lists.
+        """
+        budget = BUDGETS[url_name]
+        url = reverse(url_name, args=args) + query
+
+        seed(1)
+        small = self.measure(url)
+        seed(budget.scale - 1)
+        large = self.measure(url)
+
+        if len(large.queries) > len(small.queries):
+            self.fail(
+                f"{url_name} made {len(small.queries)} queries with 1 object "
+                f"and {len(large.queries)} with {budget.scale}:"
+                + report(small, large, budget.scale)
+            )
+        if len(large.queries) > budget.queries:
+            self.fail(
+                f"{url_name} made {len(large.queries)} queries, over its "
+                f"budget of {budget.queries}:"
+                + report(small, large, budget.scale)
+            )
+        if large.milliseconds > budget.milliseconds:
+            self.fail(
+                f"{url_name} spent {large.milliseconds:.0f}ms on queries, "
+                f"over its budget of {budget.milliseconds}ms:"
+                + report(small, large, budget.scale)
+            )
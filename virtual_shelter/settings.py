@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 import os
+import tempfile
 import dj_database_url
 from pathlib import Path
 
@@ -50,27 +51,35 @@ INSTALLED_APPS = [
     'profiles',
     'shelters',
     'animals',
+    'jobs',
+    'thumbnails',
+    'blobs',
+    'metrics',
     'storages',
     'crispy_forms',
     'crispy_bootstrap5',
 ]
 
 MIDDLEWARE = [
+    'metrics.tracing.TracingMiddleware',
+    'metrics.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'profiles.identity.IdentityMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     "allauth.account.middleware.AccountMiddleware",
+    'metrics.profiling.ProfilingMiddleware',
 ]
 
 ROOT_URLCONF = 'virtual_shelter.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'metrics.backends.DjangoTemplates',
         'DIRS': [
             os.path.join(BASE_DIR, 'templates'),
             os.path.join(BASE_DIR, 'templates', 'allauth'),
@@ -92,10 +101,10 @@ CRISPY_TEMPLATE_PACK = "bootstrap5"
 
 AUTHENTICATION_BACKENDS = [
     # Needed to login by username in Django admin, regardless of `allauth`
-    'django.contrib.auth.backends.ModelBackend',
+    'profiles.backends.ModelBackend',
 
     # `allauth` specific authentication methods, such as login by email
-    'allauth.account.auth_backends.AuthenticationBackend',
+    'profiles.backends.AllauthBackend',
 ]
 
 SITE_ID = 1
@@ -119,6 +128,36 @@ else:
     }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+# Page fragments are invalidated by bumping counters in their cache, so
+# every web process must share it. Without Redis there is no shared cache,
+# and fragment caching is turned off rather than serving pages that other
+# processes have already changed.
+
+if 'REDIS_URL' in os.environ:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ.get('REDIS_URL'),
+        },
+        'fragments': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ.get('REDIS_URL'),
+            'KEY_PREFIX': 'fragments',
+        },
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        },
+        'fragments': {
+            'BACKEND': 'django.core.cache.backends.dummy.DummyCache',
+        },
+    }
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -166,6 +205,13 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Uploads waiting to be promoted by custom_storages.StagedMediaStorage,
+# served from MEDIA_STAGING_URL only while uploads are staged
+STAGE_MEDIA_UPLOADS = False
+MEDIA_STAGING_URL = '/media-staging/'
+MEDIA_STAGING_ROOT = os.path.join(BASE_DIR, 'media-staging')
+STAGED_MEDIA_SWEEP_INTERVAL = 300
+
 if 'USE_AWS' in os.environ:
     AWS_STORAGE_BUCKET_NAME = 'virtual-shelter'
     AWS_S3_REGION_NAME = 'eu-north-1'
@@ -183,20 +229,89 @@ if 'USE_AWS' in os.environ:
     STATIC_URL = f'https://{AWS_S3_CUSTOM_DOMAIN}/{STATICFILES_LOCATION}/'
     MEDIA_URL = f'https://{AWS_S3_CUSTOM_DOMAIN}/{MEDIAFILES_LOCATION}/'
 
+    # With STAGE_MEDIA_UPLOADS set, uploads are written to local disk and
+    # copied to S3 in the background instead of during the request
+    STAGE_MEDIA_UPLOADS = 'STAGE_MEDIA_UPLOADS' in os.environ
+    if STAGE_MEDIA_UPLOADS:
+        MEDIA_STORAGE_BACKEND = 'custom_storages.StagedMediaStorage'
+    else:
+        MEDIA_STORAGE_BACKEND = 'custom_storages.MediaStorage'
+
     STORAGES = {
         "default": {
-            "BACKEND": "custom_storages.MediaStorage",
+            "BACKEND": MEDIA_STORAGE_BACKEND,
         },
         "staticfiles": {"BACKEND": "custom_storages.StaticStorage"}
     }
 
 
+# Per-view request figures, written by each worker and summed by /metrics/
+METRICS_DIR = os.environ.get(
+    'METRICS_DIR',
+    os.path.join(tempfile.gettempdir(), 'virtual-shelter-metrics')
+)
+METRICS_FLUSH_INTERVAL = 5
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
+# Profiles of chosen requests, kept by metrics.profiling in a ring of the
+# newest PROFILE_RING_SIZE files. PROFILE_SAMPLE_RATES profiles one in N
+# requests to each URL name, e.g. 'feed_sprite=100,view_animals=100'.
+PROFILE_DIR = os.environ.get(
+    'PROFILE_DIR',
+    os.path.join(tempfile.gettempdir(), 'virtual-shelter-profiles')
+)
+PROFILE_RING_SIZE = 50
+PROFILE_SAMPLE_INTERVAL = 0.005
+PROFILE_SAMPLE_RATES = {
+    name: int(rate)
+    for name, rate in (
+        item.split('=')
+        for item in os.environ.get('PROFILE_SAMPLE_RATES', '').split(',')
+        if item
+    )
+}
+
+# Spans of requests, queries, templates, S3, Stripe and mail are appended
+# to TRACE_FILE as JSON lines when it is set
+TRACE_FILE = os.environ.get('TRACE_FILE')
+
+# Log records carry the request ID set by metrics.tracing.TracingMiddleware
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'filters': {
+        'request_id': {'()': 'metrics.tracing.RequestIdFilter'},
+    },
+    'formatters': {
+        'request_id': {
+            'format': '%(levelname)s [%(request_id)s] %(name)s: %(message)s',
+        },
+    },
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+            'filters': ['request_id'],
+            'formatter': 'request_id',
+        },
+    },
+    'root': {
+        'handlers': ['console'],
+        'level': os.environ.get('LOG_LEVEL', 'WARNING'),
+    },
+    'loggers': {
+        # Client errors such as 404s are not worth a log line each
+        'django.request': {'level': 'ERROR'},
+    },
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
-EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
+# Mail is queued during the request and delivered over SMTP by the worker
+EMAIL_BACKEND = 'jobs.mail.QueuedEmailBackend'
+QUEUED_EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
 EMAIL_USE_TLS = True
 EMAIL_PORT = 587
 EMAIL_HOST = 'smtp.gmail.com'
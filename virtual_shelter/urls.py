@@ -18,6 +18,7 @@ from django.contrib import admin
 from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
+from custom_storages import staged_urls
 
 
 urlpatterns = [
@@ -28,4 +29,7 @@ urlpatterns = [
     path('profiles/', include('profiles.urls')),
     path('shelters/', include('shelters.urls')),
     path('animals/', include('animals.urls')),
-] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+    path('metrics/', include('metrics.urls')),
+] + staged_urls()
+
+urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)